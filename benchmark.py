@@ -0,0 +1,357 @@
+"""Benchmarks for the storage tracker on synthetic warehouses.
+
+Generates storages of the requested sizes (filled slots), times loading,
+saving, searching, command parsing, category lookups and TUI frames against
+a fake screen, and writes the timings as JSON so runs can be compared:
+
+    python benchmark.py --sizes 1000,100000 --output before.json
+    python benchmark.py --sizes 1000,100000 --output after.json
+    python benchmark.py --compare before.json after.json
+"""
+import argparse
+import curses
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import main
+
+SLOTS_FILLED_PER_CHEST = 40  # Average filled slots in a synthetic slot chest
+CHESTS_PER_WALL = 500
+WALLS_PER_ROOM = 10
+CHESTS_PER_CATEGORY = 50
+
+MATERIALS = ["Oak", "Spruce", "Birch", "Jungle", "Acacia", "Dark Oak", "Mangrove", "Cherry", "Iron",
+             "Gold", "Copper", "Diamond", "Netherite", "Stone", "Cobblestone", "Deepslate", "Granite",
+             "Diorite", "Andesite", "Sandstone", "Red Sandstone", "Prismarine", "Quartz", "Blackstone",
+             "Brick", "Nether Brick", "End Stone", "Purpur", "Mud Brick", "Tuff", "White", "Red", "Blue",
+             "Black", "Lime", "Cyan"]
+FORMS = ["Log", "Planks", "Slab", "Stairs", "Fence", "Door", "Ingot", "Block", "Nugget", "Ore",
+         "Pickaxe", "Sword", "Wall", "Bricks", "Wool", "Concrete", "Glass", "Carpet"]
+SINGLE_ITEMS = ["Coal", "Charcoal", "Redstone Dust", "Lapis Lazuli", "Emerald", "Ender Pearl", "Blaze Rod",
+                "Gunpowder", "String", "Bone", "Bone Meal", "Rotten Flesh", "Slimeball", "Wheat", "Carrot",
+                "Potato", "Bread", "Cooked Beef", "Torch", "Lantern", "Rail", "Powered Rail", "Hopper",
+                "Observer", "Piston", "Sticky Piston", "Elytra", "Totem of Undying", "Name Tag", "Saddle"]
+LABELS = ["Misc", "overflow", "iron stuff", "Random loot", "Potions - sort later", ""]
+
+SEARCH_QUERIES = ["iron", "oak log", "a0", "diamond pickaxe", "o", "zzzz"]
+TYPED_QUERY = "iron ingot"
+FUZZY_QUERIES = ["irn ingt", "dimond pick", "redstne"]
+
+def wall_name(index):
+    """Return the letters-only wall ID for a 0-based index: A..Z, AA, AB, ..."""
+    name = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        name = chr(ord('A') + rem) + name
+    return name
+
+def item_vocabulary(rng):
+    """Return (names, weights): every item name with a Zipf-like popularity weight."""
+    names = [f"{material} {form}" for material in MATERIALS for form in FORMS] + SINGLE_ITEMS
+    rng.shuffle(names)
+    return names, [1.0 / rank for rank in range(1, len(names) + 1)]
+
+def generate_layout(chest_count):
+    """Return (rooms, chests, categories) with enough walls for chest_count chests."""
+    rooms = {}
+    chests = {}
+    categories = {}
+    wall_count = max(1, math.ceil(chest_count / CHESTS_PER_WALL))
+    for wall_index in range(wall_count):
+        wall = wall_name(wall_index)
+        count = min(CHESTS_PER_WALL, chest_count - wall_index * CHESTS_PER_WALL) if chest_count else 1
+        digits = len(str(CHESTS_PER_WALL))
+        chests[wall] = [f"{wall}{str(i).zfill(digits)}" for i in range(1, count + 1)]
+        categories[wall] = [
+            (f"{chests[wall][start]}–{chests[wall][min(start + CHESTS_PER_CATEGORY, count) - 1]}",
+             f"Section {wall}{start // CHESTS_PER_CATEGORY + 1}")
+            for start in range(0, count, CHESTS_PER_CATEGORY)]
+        rooms.setdefault(f"Hall {wall_index // WALLS_PER_ROOM + 1}", []).append(wall)
+    return rooms, chests, categories
+
+def generate_storage(filled_slots, label_fraction=0.05, seed=0):
+    """Generate a synthetic warehouse with filled_slots filled slots.
+
+    Returns (layout, raw) where layout is (rooms, chests, categories) and raw
+    is the storage_data.json form. About label_fraction of the chests are
+    old-format label chests.
+    """
+    rng = random.Random(seed)
+    names, weights = item_vocabulary(rng)
+    slot_chests = math.ceil(filled_slots / SLOTS_FILLED_PER_CHEST)
+    label_chests = round(slot_chests * label_fraction / (1 - label_fraction))
+    layout = generate_layout(slot_chests + label_chests)
+    chest_ids = [chest_id for wall_chests in layout[1].values() for chest_id in wall_chests]
+    rng.shuffle(chest_ids)
+
+    raw = {}
+    remaining = filled_slots
+    for chest_id in chest_ids[:slot_chests]:
+        count = min(remaining, rng.randint(SLOTS_FILLED_PER_CHEST // 2, SLOTS_FILLED_PER_CHEST * 3 // 2),
+                    main.SLOTS_PER_CHEST)
+        # Keep enough chests for the rest, so the total comes out exact
+        count = max(count, remaining - (slot_chests - len(raw) - 1) * main.SLOTS_PER_CHEST)
+        items = rng.choices(names, weights, k=count)
+        raw[chest_id] = {str(slot): [item, 64 if rng.random() < 0.6 else rng.randint(1, 63)]
+                         for slot, item in zip(sorted(rng.sample(range(main.SLOTS_PER_CHEST), count)), items)}
+        remaining -= count
+    for chest_id in chest_ids[slot_chests:]:
+        raw[chest_id] = rng.choice(LABELS)
+    return layout, raw
+
+def summarize(samples, per_run=1):
+    """Summarize per-operation times (seconds) in milliseconds."""
+    samples = sorted(sample / per_run for sample in samples)
+    return {
+        "runs": len(samples),
+        "ops_per_run": per_run,
+        "mean_ms": sum(samples) / len(samples) * 1000,
+        "median_ms": samples[len(samples) // 2] * 1000,
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+        "min_ms": samples[0] * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+def time_runs(func, repeat, per_run=1, setup=None):
+    """Time repeat runs of func() (setup() runs untimed before each one)."""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, per_run)
+
+def random_commands(rng, count, names):
+    """Return count valid UPD/REM command lines for the configured layout."""
+    walls = main.wall_order
+    commands = []
+    for _ in range(count):
+        wall = rng.choice(walls)
+        number = rng.randint(1, len(main.chests[wall]))
+        slot = rng.randrange(main.SLOTS_PER_CHEST)
+        if rng.random() < 0.7:
+            commands.append(f"UPD:{wall}:{number}:{slot}:({rng.choice(names)}, {rng.randint(1, 64)})")
+        else:
+            commands.append(f"REM:{wall}:{number}:{slot}")
+    return commands
+
+class FakeScreen:
+    """Stands in for a curses window; records when each key is read.
+
+    Reads with a timeout set (the search debounce) time out, as if every key
+    were typed after a pause, so each key gets its own frame.
+    """
+
+    def __init__(self, keys, lines, cols):
+        self.keys = list(keys)
+        self.lines = lines
+        self.cols = cols
+        self.delay = -1
+        self.key_times = []
+
+    def getch(self):
+        if self.delay >= 0:
+            return -1
+        self.key_times.append(time.perf_counter())
+        return self.keys.pop(0) if self.keys else ord('q')
+
+    def addstr(self, y, x, text, attr=0):
+        if not 0 <= y < self.lines:
+            raise curses.error("addstr() returned ERR")
+
+    def getstr(self, *args):
+        return b""
+
+    def erase(self): pass
+    def clrtoeol(self): pass
+    def move(self, y, x): pass
+    def refresh(self): pass
+    def noutrefresh(self): pass
+    def nodelay(self, flag): pass
+    def timeout(self, delay):
+        self.delay = delay
+    def idlok(self, flag): pass
+
+def time_tui_frames(keys, lines=50, cols=120):
+    """Run chest_tui on a fake screen and time the frames drawn after each key.
+
+    The first frame (which includes load_data) is not counted.
+    """
+    screen = FakeScreen(keys + [ord('q')], lines, cols)
+    patched = {"LINES": lines, "COLS": cols, "color_pair": lambda n: n << 8, "doupdate": lambda: None,
+               "ungetch": lambda key: screen.keys.insert(0, key)}
+    for name in ("curs_set", "start_color", "init_pair", "echo", "noecho"):
+        patched[name] = lambda *args: None
+    saved = {name: getattr(curses, name, None) for name in patched}
+    for name, value in patched.items():
+        setattr(curses, name, value)
+    try:
+        main.chest_tui(screen)
+    finally:
+        for name, value in saved.items():
+            setattr(curses, name, value)
+    # Each gap between key reads is one key handled plus one frame drawn
+    frame_times = [end - start for start, end in zip(screen.key_times, screen.key_times[1:])]
+    return summarize(frame_times)
+
+def bench_size(filled_slots, repeat, seed):
+    """Run every benchmark on one generated storage and return the results."""
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    layout, raw = generate_storage(filled_slots, seed=seed)
+    generate_seconds = time.perf_counter() - start
+    main.configure_layout(*layout)
+    names, _ = item_vocabulary(random.Random(seed))
+    with open(main.SAVE_FILE, 'w') as f:
+        json.dump(raw, f)
+    results = {}
+
+    results["load_data"] = time_runs(main.load_data, repeat)
+    data = main.load_data()
+    results["build_search_index"] = time_runs(lambda: main.build_search_index(data), repeat)
+    results["build_chest_stats"] = time_runs(lambda: main.build_chest_stats(data), repeat)
+
+    def clear_search_cache():
+        main.search_cache = None
+    for query in SEARCH_QUERIES:
+        results[f"search_chests[{query}]"] = time_runs(lambda: main.search_chests(data, query), repeat,
+                                                       setup=clear_search_cache)
+    # Typing a query one key at a time reuses the earlier results
+    prefixes = [TYPED_QUERY[:end] for end in range(1, len(TYPED_QUERY) + 1)]
+    results["search_chests[typed]"] = time_runs(
+        lambda: [main.search_chests(data, prefix) for prefix in prefixes], repeat,
+        per_run=len(prefixes), setup=clear_search_cache)
+    for query in FUZZY_QUERIES:
+        results[f"fuzzy_search[{query}]"] = time_runs(lambda: main.fuzzy_search(data, query, 500), repeat)
+
+    chest_ids = list(main.chest_walls)
+    lookups = [rng.choice(chest_ids) for _ in range(10000)]
+    results["get_category_for_chest"] = time_runs(
+        lambda: [main.get_category_for_chest(chest_id) for chest_id in lookups], repeat, per_run=len(lookups))
+
+    commands = random_commands(rng, 1000, names)
+    results["parse_command"] = time_runs(
+        lambda: [main.parse_command(command, data) for command in commands], repeat, per_run=len(commands))
+
+    # Journal appends only: keep the journal from being folded into a snapshot
+    compact_records = main.JOURNAL_COMPACT_RECORDS
+    main.JOURNAL_COMPACT_RECORDS = float("inf")
+    save_commands = random_commands(rng, 100, names)
+    def queue_changes():
+        for command in save_commands:
+            main.parse_command(command, data)
+    try:
+        results["save_data[100 changes]"] = time_runs(lambda: main.save_data(data), repeat, setup=queue_changes)
+    finally:
+        main.JOURNAL_COMPACT_RECORDS = compact_records
+    results["compact_data"] = time_runs(lambda: main.compact_data(data), repeat)
+
+    results["tui_frame[scroll]"] = time_tui_frames([curses.KEY_DOWN] * 200 + [curses.KEY_NPAGE] * 20)
+    results["tui_frame[switch wall]"] = time_tui_frames([curses.KEY_RIGHT] * 50)
+    results["tui_frame[search typing]"] = time_tui_frames([ord('/')] + [ord(c) for c in TYPED_QUERY] + [27])
+
+    return {
+        "filled_slots": filled_slots,
+        "chests": len(raw),
+        "walls": len(main.wall_order),
+        "generate_seconds": generate_seconds,
+        "results": results,
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(sizes, repeat, seed):
+    """Benchmark each size in a scratch directory and return the report."""
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "repeat": repeat,
+        "seed": seed,
+        "sizes": [],
+    }
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            for filled_slots in sizes:
+                for name in (main.SAVE_FILE, main.JOURNAL_FILE):
+                    if os.path.exists(name):
+                        os.remove(name)
+                shutil.rmtree(main.HISTORY_DIR, ignore_errors=True)
+                print(f"benchmarking {filled_slots} filled slots...", file=sys.stderr)
+                report["sizes"].append(bench_size(filled_slots, repeat, seed))
+        finally:
+            os.chdir(cwd)
+    return report
+
+def compare_reports(old, new, threshold):
+    """Print the median time change of every operation; return the number of regressions."""
+    regressions = 0
+    old_sizes = {entry["filled_slots"]: entry["results"] for entry in old["sizes"]}
+    for entry in new["sizes"]:
+        old_results = old_sizes.get(entry["filled_slots"])
+        if old_results is None:
+            continue
+        print(f"{entry['filled_slots']} filled slots ({old.get('revision')} -> {new.get('revision')}):")
+        for name, result in entry["results"].items():
+            if name not in old_results:
+                continue
+            before, after = old_results[name]["median_ms"], result["median_ms"]
+            ratio = after / before if before else float("inf")
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"  {name:32} {before:10.4f} ms -> {after:10.4f} ms  x{ratio:.2f}{flag}")
+    return regressions
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the storage tracker on synthetic warehouses")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma-separated filled slot counts (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per operation (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the generated storages")
+    parser.add_argument("--output", metavar="FILE", help="write the JSON report to FILE instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two JSON reports instead of running benchmarks")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="slowdown ratio reported as a regression by --compare (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path, 'r') as f:
+                reports.append(json.load(f))
+        return 1 if compare_reports(*reports, args.threshold) else 0
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    report = run_benchmarks(sizes, args.repeat, args.seed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
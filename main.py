@@ -1,7 +1,52 @@
-import curses
+"""Minecraft storage tracker: a curses TUI, a headless CLI and a Python API.
+
+Scripts can import this module and use the same functions the TUI does:
+load_data()/save_data(), search_chests(), fuzzy_search(), find_items(),
+get_chest_stats()/get_wall_stats(), parse_command() and run_batch().
+curses (and sqlite3 for the SQLite backend) are imported only when needed,
+so importing or running a query starts quickly; run the CLI as
+`python -m main --search QUERY` so the module's cached bytecode is used.
+
+`python -m main --place FILE` plans where incoming items go (plan_placements()),
+topping up partial stacks before using empty slots; --consolidate plans
+merging scattered stacks back into their categories (plan_consolidation()).
+Both only list the plan unless --apply is given. `--materials FILE` (b in the
+TUI) checks a bill of materials, crafting through recipes.json, and lists the
+chests to pick from (check_materials()). `--export csv|jsonl|columnar` streams
+one row per filled slot (export_rows()), optionally filtered by --wall,
+--category or --item.
+
+`python -m main --import-world WORLD` fills chests from a world save's region
+files, using the chest coordinates in world_import.json.
+
+The TUI reads storage_data.json on a background thread and shows each wall
+as soon as its chests are in (load_data(progressive=True)); chests that
+can't be read are listed in load_errors instead of failing the load, and
+storage_data.json is not rewritten without them until accept_partial_load()
+(--accept-partial, or A in the TUI).
+
+`--backend sharded` keeps each wall in its own file under storage_data.shards
+(`--migrate-shards` splits storage_data.json) and reads a wall only when it is
+first shown or searched.
+
+Every save is an undo step (u/r in the TUI, undo()/redo()) and is logged to
+storage_data.history; --history, --diff N and --restore N go back in time.
+
+`python -m main --serve` runs a storage server that owns the data; while its
+socket exists, other TUIs and commands go through it and see each other's
+changes as they happen.
+"""
+import atexit
+import functools
+import heapq
 import json
 import os
+import struct
 import sys
+import threading
+import time
+from array import array
+from collections import deque
 
 # Define chests by wall
 chests = {
@@ -102,75 +147,2994 @@ categories = {
     ]
 }
 
-SAVE_FILE = "storage_data.json"
+# Storage rooms and their walls, in navigation order
+rooms = {"Main": ["A", "B", "C", "D"]}
+
+SLOTS_PER_CHEST = 54  # Double chest
+
+# Interned item names: item ID -> name and name -> item ID. ID 0 marks an empty slot.
+item_names = [None]
+item_names_lower = [None]
+item_ids = {}
+
+def intern_item(item_name):
+    """Return the integer ID for an item name, assigning one on first use."""
+    item_id = item_ids.get(item_name)
+    if item_id is None:
+        item_id = item_ids[item_name] = len(item_names)
+        item_names.append(item_name)
+        item_names_lower.append(item_name.lower())
+    return item_id
+
+_EMPTY_SLOTS = array('I', [0]) * SLOTS_PER_CHEST
+
+class Chest:
+    """A double chest: fixed arrays of item IDs and quantities, one entry per slot.
+
+    Chests from the old label format keep their text in label and hold no
+    items; slot chests have label None. order is None while the filled slots
+    were stored in slot order, else the slots in the order they were first
+    filled, which is the order storage_data.json and search results list them.
+    """
+    __slots__ = ("label", "items", "qtys", "order")
+
+    def __init__(self, label=None):
+        self.label = label
+        self.items = _EMPTY_SLOTS[:]
+        self.qtys = _EMPTY_SLOTS[:]
+        self.order = None
+
+    def filled_slots(self):
+        """Return the filled slots in the order they were filled."""
+        items = self.items
+        if self.order is None:
+            return [slot for slot, item_id in enumerate(items) if item_id]
+        filled = [slot for slot in self.order if items[slot]]
+        if len(filled) < len(items) - items.count(0):  # Some filled without set_slot
+            listed = set(filled)
+            filled += [slot for slot, item_id in enumerate(items) if item_id and slot not in listed]
+        return filled
+
+    def slots(self):
+        """Yield (slot, item_name, qty) for every filled slot."""
+        items, qtys = self.items, self.qtys
+        for slot in self.filled_slots():
+            yield slot, item_names[items[slot]], qtys[slot]
+
+    def note_filled(self, slot):
+        """Put a slot that was empty last in the order."""
+        if self.order is not None:
+            if slot in self.order:
+                self.order.remove(slot)
+            self.order.append(slot)
+        elif any(self.items[slot + 1:]):
+            self.order = [filled for filled in self.filled_slots() if filled != slot] + [slot]
+
+def chest_from_json(value, problems=None):
+    """Build a Chest from its storage_data.json form (label string or slot dict).
+
+    Slot entries that are not [name, qty] for slots 0-53 are dropped; given a
+    problems list, a message for each thing dropped is appended to it.
+    """
+    if not isinstance(value, dict):
+        if not isinstance(value, str) and problems is not None:
+            problems.append(f"not a label or slots ({type(value).__name__}), kept as an empty chest")
+        return Chest(value if isinstance(value, str) else "")
+    chest = Chest()
+    order = []
+    for slot_key, slot_value in value.items():
+        try:
+            slot = int(slot_key)
+        except (ValueError, TypeError):
+            slot = -1
+        if (0 <= slot < SLOTS_PER_CHEST and isinstance(slot_value, (list, tuple)) and len(slot_value) >= 2
+                and isinstance(slot_value[0], str) and isinstance(slot_value[1], int)
+                and 0 <= slot_value[1] <= 0xFFFFFFFF):
+            chest.qtys[slot] = slot_value[1]
+            chest.items[slot] = intern_item(slot_value[0])
+            order.append(slot)
+        elif problems is not None:
+            problems.append(f"dropped slot {slot_key!r}: {json.dumps(slot_value)[:40]}")
+    if any(slot > next_slot for slot, next_slot in zip(order, order[1:])):
+        chest.order = list(dict.fromkeys(order))
+    return chest
+
+def chest_to_json(chest):
+    """Return the storage_data.json form of a Chest."""
+    if chest.label is not None:
+        return chest.label
+    return {str(slot): [item_name, qty] for slot, item_name, qty in chest.slots()}
+
+def new_storage():
+    """Return data for a storage where every chest is empty.
+
+    Only chests that have been written to are stored; layout chests missing
+    from data are shown and searched as empty.
+    """
+    return {}
+
+def data_from_json(raw):
+    """Build the in-memory model from decoded storage_data.json contents."""
+    return {chest_id: chest_from_json(value) for chest_id, value in raw.items()}
+
+def data_to_json(data):
+    """Return the storage_data.json form of the in-memory model.
+
+    Shards of sharded data that have not been read are taken from their files
+    without loading them.
+    """
+    raw = {chest_id: chest_to_json(chest) for chest_id, chest in dict.items(data)}
+    for shard in sorted(data.unloaded) if isinstance(data, ShardedStorage) else ():
+        raw.update(data.shard_json(shard))
+    return raw
+
+# Hot-path instrumentation: call counts and latency histograms per operation.
+# Collection is off unless enabled (--metrics, or the TUI's metrics overlay);
+# while off the timed functions run unwrapped.
+METRICS_ENABLED = False
+METRICS_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)  # Bucket upper bounds
+metrics = {}  # name -> [count, total_seconds, max_seconds, bucket counts (one extra for overflow)]
+
+def record_metric(name, seconds):
+    """Add one timed call of name to the metrics."""
+    entry = metrics.get(name)
+    if entry is None:
+        entry = metrics[name] = [0, 0.0, 0.0, [0] * (len(METRICS_BUCKETS_MS) + 1)]
+    entry[0] += 1
+    entry[1] += seconds
+    if seconds > entry[2]:
+        entry[2] = seconds
+    ms = seconds * 1000
+    bucket = 0
+    while bucket < len(METRICS_BUCKETS_MS) and ms > METRICS_BUCKETS_MS[bucket]:
+        bucket += 1
+    entry[3][bucket] += 1
+
+_timed_functions = {}  # function name -> (metric name, unwrapped function)
+
+def timed(name):
+    """Decorator registering a module function to be timed under name when metrics are enabled."""
+    def decorate(func):
+        _timed_functions[func.__name__] = (name, func)
+        return func
+    return decorate
+
+def _timing_wrapper(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record_metric(name, time.perf_counter() - start)
+    return wrapper
+
+def set_metrics_enabled(enabled):
+    """Turn timing on or off by swapping the timed module functions for timing wrappers."""
+    global METRICS_ENABLED
+    METRICS_ENABLED = enabled
+    module = globals()
+    for func_name, (name, func) in _timed_functions.items():
+        module[func_name] = _timing_wrapper(name, func) if enabled else func
+
+def _bucket_percentile(entry, fraction):
+    """Return the upper bound (ms) of the bucket holding the given fraction of calls."""
+    target = entry[0] * fraction
+    seen = 0
+    for bound, count in zip(METRICS_BUCKETS_MS, entry[3]):
+        seen += count
+        if seen >= target:
+            return bound
+    return entry[2] * 1000
+
+def metrics_summary():
+    """Return {name: {count, mean_ms, max_ms, p50_ms, p95_ms, buckets}} for the recorded calls.
+
+    Percentiles are bucket upper bounds (the max for the overflow bucket).
+    """
+    labels = [f"<={bound}ms" for bound in METRICS_BUCKETS_MS] + [f">{METRICS_BUCKETS_MS[-1]}ms"]
+    return {name: {"count": entry[0],
+                   "mean_ms": entry[1] / entry[0] * 1000,
+                   "max_ms": entry[2] * 1000,
+                   "p50_ms": _bucket_percentile(entry, 0.5),
+                   "p95_ms": _bucket_percentile(entry, 0.95),
+                   "buckets": dict(zip(labels, entry[3]))}
+            for name, entry in metrics.items() if entry[0]}
+
+def write_metrics(path):
+    """Write metrics_summary() to path as JSON."""
+    with open(path, 'w') as f:
+        json.dump(metrics_summary(), f, indent=2)
+
+SAVE_FILE = "storage_data.json"
+# Append-only log of slot/chest changes since the last snapshot of SAVE_FILE
+JOURNAL_FILE = "storage_data.journal"
+JOURNAL_COMPACT_RECORDS = 500  # Fold the journal into the snapshot after this many records
+
+# Storage backend: "json", "sqlite" (optional SQLite file) or "sharded" (per-wall files, below)
+STORAGE_BACKEND = "json"
+SQLITE_FILE = "storage_data.db"
+
+# Change log for the loaded data: records not yet persisted and the number
+# of records already in JOURNAL_FILE.
+journal = None
+sqlite_conn = None
+
+def _apply_journal_record(data, record):
+    """Replay one journal record onto decoded storage_data.json contents."""
+    op, chest_id = record[0], record[1]
+    if op == "U":
+        if not isinstance(data.get(chest_id), dict):
+            data[chest_id] = {}
+        data[chest_id][record[2]] = [record[3], record[4]]
+    elif op == "R":
+        if isinstance(data.get(chest_id), dict):
+            data[chest_id].pop(record[2], None)
+    elif op == "C":
+        data[chest_id] = record[2]
+    else:
+        raise ValueError(f"Unknown journal record '{op}'")
+
+def _read_journal(path):
+    """Return the records in a journal file.
+
+    A torn or corrupt line (e.g. from a crash mid-write) ends the journal and
+    is cut off so later appends start from the last good line. A save of
+    several records is one ["G", records] line, so it is replayed whole or
+    not at all.
+    """
+    if not os.path.exists(path):
+        return []
+    records = []
+    good_end = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            group = record[1] if isinstance(record, list) and len(record) == 2 and record[0] == "G" else [record]
+            if not isinstance(group, list) or not all(_valid_record(member) for member in group):
+                break
+            records.extend(group)
+            good_end += len(line)
+    if good_end < os.path.getsize(path):
+        with open(path, 'r+b') as f:
+            f.truncate(good_end)
+    return records
+
+def _replay_journal(data):
+    """Apply JOURNAL_FILE to data and return the number of records replayed."""
+    records = _read_journal(JOURNAL_FILE)
+    for record in records:
+        _apply_journal_record(data, record)
+    return len(records)
+
+def _write_snapshot(raw):
+    """Write storage_data.json contents to SAVE_FILE atomically (temp file + rename).
+
+    Chests are written in walk order, which lets a progressive load show each
+    wall as soon as it has been read.
+    """
+    tmp_file = SAVE_FILE + ".tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump({chest_id: raw[chest_id] for chest_id in sorted(raw, key=_chest_walk_key)}, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, SAVE_FILE)
+
+def _append_journal(records):
+    """Append change records to the backend's journal file as one line and sync them to disk."""
+    if not records:
+        return
+    line = json.dumps(records[0] if len(records) == 1 else ["G", records], separators=(',', ':'))
+    with open(SHARD_JOURNAL_FILE if STORAGE_BACKEND == "sharded" else JOURNAL_FILE, 'a') as f:
+        f.write(line + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def _record(data, *record):
+    """Queue a change record for the loaded data."""
+    if journal is not None and journal["data"] is data:
+        journal["pending"].append(record)
+
+# Chest-by-chest reading of SAVE_FILE: a chest that can't be read is reported
+# in load_errors (and SAVE_FILE is copied aside before a compaction can drop
+# it) instead of failing the whole load. Such a load is partial: SAVE_FILE is
+# not rewritten from it until accept_partial_load().
+LOAD_CHUNK_CHARS = 1 << 20  # Characters of SAVE_FILE read at a time
+_ENTRY_START = '\n  "'  # How _write_snapshot's indentation starts each chest
+load_errors = []  # (chest ID or None, message) for what the last load could not read
+partial_load = False  # The loaded data lacks chests of SAVE_FILE, and that has not been accepted
+partial_load_accepted = False  # accept_partial_load() was called since the last load
+
+def accept_partial_load():
+    """Let SAVE_FILE be rewritten from data that lacks the chests the last load could not read."""
+    global partial_load, partial_load_accepted
+    partial_load = False
+    partial_load_accepted = True
+
+def _parse_problem(msg, text, pos):
+    """Describe a parse error found at text.buf[pos] the way json does."""
+    if msg.endswith(" at"):  # e.g. "Invalid control character at"
+        msg = msg[:-3]
+    return f"{msg} at {text.where(pos)}"
+
+class _SnapshotText:
+    """The part of SAVE_FILE being parsed, read in LOAD_CHUNK_CHARS pieces."""
+
+    def __init__(self, read):
+        self.read = read
+        self.buf = read(LOAD_CHUNK_CHARS)
+        self.eof = not self.buf
+        self.base = 0    # Offset in the file of buf[0]
+        self.line = 1    # Line and column of buf[0]
+        self.column = 1
+
+    def read_more(self, pos):
+        """Drop buf before pos and add the next piece of the file; returns pos's new place (0)."""
+        more = self.read(LOAD_CHUNK_CHARS)
+        self.eof = not more
+        self.line, self.column = self.position(pos)
+        self.base += pos
+        self.buf = self.buf[pos:] + more
+        return 0
+
+    def position(self, pos):
+        newlines = self.buf.count("\n", 0, pos)
+        if not newlines:
+            return self.line, self.column + pos
+        return self.line + newlines, pos - self.buf.rfind("\n", 0, pos)
+
+    def where(self, pos):
+        line, column = self.position(pos)
+        return f"line {line} column {column} (char {self.base + pos})"
+
+    def content(self, pos):
+        """Return where the next non-whitespace character from pos is, reading on as needed; None at the end."""
+        while True:
+            end = json.decoder.WHITESPACE.match(self.buf, pos).end()
+            if end < len(self.buf):
+                return end
+            if self.eof:
+                return None
+            # Keep the end of the whitespace: it may hold the start of a chest's line
+            cut = max(pos, end - len(_ENTRY_START))
+            pos = self.read_more(cut) + end - cut
+
+    def entry(self, pos):
+        """Return where the next chest starts from pos, reading on as needed; None if none does."""
+        while True:
+            found = self.buf.find(_ENTRY_START, pos)
+            if found >= 0:
+                return found + 1
+            if self.eof:
+                return None
+            pos = self.read_more(max(pos, len(self.buf) - len(_ENTRY_START) + 1))
+
+def _iter_snapshot(read):
+    """Parse storage_data.json contents one chest at a time, yielding (chest_id, value, problem).
+
+    read(size) returns the next characters of the file. A chest whose JSON is
+    malformed yields (chest_id, None, message) and parsing carries on at the
+    next chest, found by _write_snapshot's indentation (in a file without it,
+    the rest of the file is lost); so does a stray "}" that would end the
+    object early. Raises ValueError if the contents are not a JSON object.
+    """
+    decoder = json.JSONDecoder()
+    skip = json.decoder.WHITESPACE.match
+    text = _SnapshotText(read)
+    pos = skip(text.buf).end()
+    if not text.buf.startswith("{", pos):
+        raise ValueError(f"{SAVE_FILE} does not hold a JSON object")
+    pos += 1
+    last_error = None
+    while True:
+        if not text.eof and len(text.buf) - pos < LOAD_CHUNK_CHARS // 2:
+            pos = text.read_more(pos)
+        pos = text.content(pos)
+        if pos is None:
+            yield None, None, f"{SAVE_FILE} ends before its closing '}}'"
+            return
+        buf = text.buf
+        chest_id = None
+        value = None
+        if not buf.startswith("}", pos):
+            try:
+                chest_id, end = decoder.raw_decode(buf, pos)
+                if not isinstance(chest_id, str):
+                    chest_id = None
+                    raise json.JSONDecodeError("Expecting a chest ID", buf, pos)
+                end = skip(buf, end).end()
+                if not buf.startswith(":", end):
+                    raise json.JSONDecodeError("Expecting ':' delimiter", buf, end)
+                value, end = decoder.raw_decode(buf, skip(buf, end + 1).end())
+                end = skip(buf, end).end()
+                if not buf.startswith((",", "}"), end):
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buf, end)
+            except json.JSONDecodeError as e:
+                # The chest may just run past the end of buf: read on unless the
+                # same error comes back with the next chest already in view
+                error = (e.msg, e.pos - pos)
+                if not text.eof and (error != last_error or buf.find(_ENTRY_START, e.pos) < 0):
+                    last_error = error
+                    pos = text.read_more(pos)
+                    continue
+                last_error = None
+                yield chest_id, None, _parse_problem(e.msg, text, e.pos)
+                pos = text.entry(e.pos)
+                if pos is None:
+                    return
+                continue
+            last_error = None
+            if buf.startswith(",", end):
+                yield chest_id, value, None
+                pos = end + 1
+                continue
+            pos = end
+        # A "}" ends the object only if nothing but whitespace follows it
+        after = text.content(pos + 1)
+        if after is None:
+            if chest_id is not None:
+                yield chest_id, value, None
+            return
+        problem = _parse_problem("Extra data", text, after)
+        pos = text.entry(max(0, after - len(_ENTRY_START) + 1))
+        if pos is None:
+            # Something after the end of the object
+            if chest_id is not None:
+                yield chest_id, value, None
+            yield None, None, problem
+            return
+        # A stray "}" inside the object: the chest before it is cut short
+        yield chest_id, None, problem
+
+def _copy_unreadable_snapshot(errors):
+    """Keep a copy of SAVE_FILE as it was read when some of it could not be."""
+    copy_path = SAVE_FILE + ".unreadable"
+    if not errors or not os.path.exists(SAVE_FILE):
+        return
+    if not os.path.exists(copy_path) or os.path.getmtime(copy_path) < os.path.getmtime(SAVE_FILE):
+        import shutil
+        shutil.copyfile(SAVE_FILE, copy_path)
+
+def _read_snapshot():
+    """Return SAVE_FILE's contents and the (chest_id, message) list of chests that could not be read.
+
+    A copy of the file is kept (see _copy_unreadable_snapshot) before anything
+    can write the readable part back without the rest.
+    """
+    raw = {}
+    errors = []
+    if os.path.exists(SAVE_FILE):
+        with open(SAVE_FILE, 'r') as f:
+            try:
+                raw = json.load(f)  # All in one go when the file is sound
+            except ValueError as e:
+                f.seek(0)
+                raw = {}
+                for chest_id, value, problem in _iter_snapshot(f.read):
+                    if problem is None:
+                        raw[chest_id] = value
+                    else:
+                        errors.append((chest_id, problem))
+                if not errors:  # Whatever json found wrong, the load is still partial
+                    errors.append((None, str(e)))
+        if not isinstance(raw, dict):
+            raise ValueError(f"{SAVE_FILE} does not hold a JSON object")
+        _copy_unreadable_snapshot(errors)
+    return raw, errors
+
+def _load_json_data():
+    """Read the JSON snapshot, replay the journal on top of it and build the model.
+
+    Returns the data, the journal size, the (chest_id, message) problems found
+    and whether some of the snapshot could not be read at all.
+    """
+    raw, errors = _read_snapshot()
+    partial = bool(errors)
+    records = _replay_journal(raw)
+    data = {}
+    problems = []
+    for chest_id, value in raw.items():
+        data[chest_id] = chest_from_json(value, problems)
+        if problems:
+            errors.append((chest_id, "; ".join(problems)))
+            problems.clear()
+    return data, records, errors, partial
+
+# Progressive loading (the TUI): a thread parses SAVE_FILE while the UI adds
+# the parsed chests to its data between frames, so the first wall shows long
+# before a large file is read. _write_snapshot writes chests in walk order,
+# so once a chest of a later wall arrives every earlier wall is complete.
+# Once a chest arrives out of that order, the remaining walls complete only
+# at the end, and a chest whose wall was already shown is added to it (or,
+# if the wall's chest has changed since, reported and the load made partial).
+LOAD_MERGE_SECONDS = 0.03  # Time per TUI frame spent adding parsed chests
+LOAD_POLL_MS = 10  # Key wait per TUI frame while loading, leaving the parse thread time to run
+LOAD_QUEUE_CHESTS = 1024  # Parsed chests waiting for merge() before the parse thread pauses
+progressive_load = None
+
+class LoadingStorage(dict):
+    """Chest data being filled in by a progressive load; unloaded holds the walls not complete yet."""
+
+    def __init__(self, walls):
+        dict.__init__(self)
+        self.unloaded = set(walls)
+
+class ProgressiveLoad:
+    """Parses SAVE_FILE on a background thread; merge() adds what it has parsed to the data.
+
+    Only merge(), on the UI thread, touches the data, search index and stats,
+    so the parsing thread needs no locks.
+    """
+
+    def __init__(self, data, records):
+        self.data = data
+        self.records = {}  # chest_id -> journal records still to replay on it
+        for record in records:
+            self.records.setdefault(record[1], []).append(record)
+        self.parsed = deque()
+        self.errors = []
+        self.size = os.path.getsize(SAVE_FILE) if os.path.exists(SAVE_FILE) else 0
+        self.read_chars = 0
+        self.failure = None
+        self.cancelled = False
+        self.in_order = True  # Every chest so far came in walk order
+        self.seen = set()     # Chest IDs added from SAVE_FILE
+        self.journal_only = {}  # chest_id -> (its journal records, JSON form shown) for chests not read yet of complete walls
+        self.next_wall = 0    # Position in wall_order of the first wall not complete
+        self.thread = threading.Thread(target=self._parse, name="progressive-load", daemon=True)
+        self.thread.start()
+
+    def _parse(self):
+        try:
+            if self.size:
+                with open(SAVE_FILE, 'r') as f:
+                    def read(size):
+                        text = f.read(size)
+                        self.read_chars += len(text)
+                        return text
+                    for entry in _iter_snapshot(read):
+                        while len(self.parsed) >= LOAD_QUEUE_CHESTS and not self.cancelled:
+                            time.sleep(0.005)  # Leave the UI thread to catch up
+                        if self.cancelled:
+                            return
+                        self.parsed.append(entry)
+        except (OSError, ValueError) as e:
+            self.failure = e
+
+    def progress(self):
+        """Return how much of SAVE_FILE has been read, in percent."""
+        return min(99, self.read_chars * 100 // self.size) if self.size else 99
+
+    def has_chest(self, chest_id):
+        """Return whether a chest's wall is complete, so it can be shown and changed."""
+        wall = chest_walls.get(chest_id)
+        return wall is not None and wall not in self.data.unloaded
+
+    def _replayed(self, chest_id, value, loaded, problems):
+        """Put a chest with its journal records replayed in loaded (unless the journal leaves none)."""
+        raw = {} if value is None else {chest_id: value}
+        for record in self.records.pop(chest_id, ()):
+            _apply_journal_record(raw, record)
+        if chest_id in raw:
+            loaded[chest_id] = chest_from_json(raw[chest_id], problems)
+
+    def merge(self, seconds):
+        """Add parsed chests to the data for about seconds; returns True once the load is done."""
+        global progressive_load
+        if self.failure is not None:
+            raise self.failure
+        deadline = time.perf_counter() + seconds
+        data = self.data
+        parsing = self.thread.is_alive()  # Checked first so nothing parsed after it is missed
+        loaded = {}
+        walls = []
+        problems = []
+        while self.parsed:
+            chest_id, value, problem = self.parsed.popleft()
+            position = _chest_walk_key(chest_id)[0] if chest_id is not None else None
+            if position is not None and position < self.next_wall:
+                self.in_order = False
+            if problem is not None:
+                self.errors.append((chest_id, problem))
+                self._set_partial()
+                continue
+            replacing = False
+            if chest_id in self.journal_only:
+                # Read after its wall was completed from the journal alone: unless
+                # it was changed since, replay the journal on what was read instead
+                records, shown = self.journal_only.pop(chest_id)
+                current = loaded.get(chest_id, dict.get(data, chest_id))
+                if (chest_to_json(current) if current is not None else None) == shown:
+                    loaded.pop(chest_id, None)
+                    self.records[chest_id] = records
+                    replacing = True
+            if not replacing and (chest_id in loaded or dict.__contains__(data, chest_id)):
+                if position < self.next_wall and chest_id not in self.seen:
+                    # Its wall was shown (and could be changed) before the chest was read
+                    self.errors.append((chest_id, "read after its wall was shown, kept the chest as shown"))
+                    self._set_partial()
+                else:
+                    self.errors.append((chest_id, "stored twice, kept the first"))
+                continue
+            self.seen.add(chest_id)
+            self._replayed(chest_id, value, loaded, problems)
+            if problems:
+                self.errors.append((chest_id, "; ".join(problems)))
+                problems.clear()
+            if self.in_order:
+                walls.extend(self._complete_walls(position, loaded))
+            if len(loaded) >= 32:
+                self._add(loaded, walls)
+                loaded, walls = {}, []
+                if time.perf_counter() > deadline:
+                    break
+        done = not parsing and not self.parsed and self.failure is None
+        if done:
+            walls.extend(self._complete_walls(len(wall_order), loaded))
+            for chest_id in list(self.records):  # Chests only the journal has
+                self._replayed(chest_id, None, loaded, problems)
+        self._add(loaded, walls)
+        if not done:
+            return False
+        self._finish()
+        progressive_load = None
+        return True
+
+    def _add(self, loaded, walls):
+        if not loaded and not walls:
+            return
+        index = _active_index(self.data)
+        for chest_id in loaded:
+            if index is not None and dict.__contains__(self.data, chest_id):
+                _unindex_chest(index, chest_id, dict.__getitem__(self.data, chest_id))  # Replaced (see merge)
+        dict.update(self.data, loaded)
+        self.data.unloaded.difference_update(walls)
+        _chests_loaded(self.data, loaded, walls)
+
+    def _complete_walls(self, position, loaded):
+        """Mark the walls before position complete, adding their journal-only chests to loaded."""
+        walls = wall_order[self.next_wall:position]
+        self.next_wall = max(self.next_wall, position)
+        for wall in walls:
+            for chest_id in chests[wall]:
+                if chest_id in self.records and not dict.__contains__(self.data, chest_id):
+                    records = self.records[chest_id]
+                    self._replayed(chest_id, None, loaded, [])
+                    self.journal_only[chest_id] = (records, chest_to_json(loaded[chest_id]) if chest_id in loaded else None)
+        return walls
+
+    def _set_partial(self):
+        global partial_load, partial_load_accepted
+        partial_load, partial_load_accepted = True, False
+
+    def _finish(self):
+        global load_errors
+        self.data.unloaded.clear()
+        load_errors = self.errors
+        _copy_unreadable_snapshot(self.errors)
+
+    def cancel(self):
+        self.cancelled = True
+
+def _start_progressive_load():
+    """Start reading SAVE_FILE in the background; returns the (empty) data and the journal size."""
+    global progressive_load
+    records = _read_journal(JOURNAL_FILE)
+    data = LoadingStorage(wall_order)
+    progressive_load = ProgressiveLoad(data, records)
+    return data, len(records)
+
+def loading_data(data):
+    """Return the progressive load still filling data, or None once data is complete."""
+    if progressive_load is not None and progressive_load.data is data:
+        return progressive_load
+    return None
+
+# Sharded JSON backend ("sharded"): the chests of each wall live in their own
+# file under SHARD_DIR, named after the wall letters their chest IDs start
+# with, and one journal holds the changes for all of them. A wall's file is
+# read the first time one of its chests is touched, and compaction rewrites
+# only the files the journal changed.
+SHARD_DIR = "storage_data.shards"
+SHARD_JOURNAL_FILE = os.path.join(SHARD_DIR, "journal")
+_OTHER_SHARD = "_other"  # Chest IDs that don't start with a letter
+
+def _shard_for(chest_id):
+    """Return the shard a chest is stored in: its wall, i.e. the letters its ID starts with."""
+    wall = chest_walls.get(chest_id)
+    if wall is not None:
+        return wall
+    end = 0
+    while end < len(chest_id) and chest_id[end].isalpha():
+        end += 1
+    return chest_id[:end].upper() or _OTHER_SHARD
+
+def _shard_path(shard):
+    return os.path.join(SHARD_DIR, shard + ".json")
+
+def _read_shard(shard):
+    """Return the storage_data.json form of the chests in one shard file."""
+    path = _shard_path(shard)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        raw = json.load(f)
+    if not isinstance(raw, dict):
+        raise ValueError(f"Invalid shard file {path}")
+    return raw
+
+def _write_shard(shard, raw):
+    """Replace one shard file atomically; a shard with no chests left is removed."""
+    path = _shard_path(shard)
+    if not raw:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path + ".tmp", 'w') as f:
+        json.dump(raw, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+def _records_by_shard(records):
+    shards = {}
+    for record in records:
+        shards.setdefault(_shard_for(record[1]), []).append(record)
+    return shards
+
+def _compact_shards():
+    """Fold the shard journal into the shard files it touches and empty it.
+
+    Works from the files alone, so the background writer can run it.
+    """
+    for shard, records in _records_by_shard(_read_journal(SHARD_JOURNAL_FILE)).items():
+        raw = _read_shard(shard)
+        for record in records:
+            _apply_journal_record(raw, record)
+        _write_shard(shard, raw)
+    # As with the JSON journal, replaying it again over the new files is harmless
+    with open(SHARD_JOURNAL_FILE, 'w'):
+        pass
+
+def write_shards(raw):
+    """Replace every shard file with storage_data.json contents and empty the shard journal."""
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    shards = {}
+    for chest_id, value in raw.items():
+        shards.setdefault(_shard_for(chest_id), {})[chest_id] = value
+    for name in os.listdir(SHARD_DIR):
+        if name.endswith(".json") and name[:-5] not in shards:
+            os.remove(os.path.join(SHARD_DIR, name))
+    for shard, shard_raw in shards.items():
+        _write_shard(shard, shard_raw)
+    with open(SHARD_JOURNAL_FILE, 'w'):
+        pass
+
+def migrate_json_to_shards(accept_partial=False):
+    """Split storage_data.json (with its journal) into per-wall shard files; returns the chest count.
+
+    Raises ValueError if some of the snapshot can't be read, unless accept_partial is set.
+    """
+    raw, errors = _read_snapshot()
+    if errors and not accept_partial:
+        raise ValueError(_load_errors_summary(errors))
+    _replay_journal(raw)
+    write_shards(raw)
+    return len(raw)
+
+class ShardedStorage(dict):
+    """Chest data of the sharded backend, reading each shard the first time it is needed.
+
+    Looking up a chest reads only that chest's shard; iterating over or
+    sizing the whole storage reads every shard first.
+    """
+
+    def __init__(self, shards, records):
+        dict.__init__(self)
+        self.unloaded = set(shards)  # Shards not read yet
+        self.records = records       # shard -> journal records not yet in its file
+
+    def shard_json(self, shard):
+        """Return an unread shard's storage_data.json form without loading it."""
+        raw = _read_shard(shard)
+        for record in self.records.get(shard, ()):
+            _apply_journal_record(raw, record)
+        return raw
+
+    def load_shard(self, shard):
+        if shard not in self.unloaded:
+            return
+        chests = data_from_json(self.shard_json(shard))
+        self.unloaded.discard(shard)
+        self.records.pop(shard, None)
+        dict.update(self, chests)
+        _chests_loaded(self, chests, [shard])
+
+    def load_all(self):
+        for shard in sorted(self.unloaded):
+            self.load_shard(shard)
+
+    def __getitem__(self, chest_id):
+        if self.unloaded:
+            self.load_shard(_shard_for(chest_id))
+        return dict.__getitem__(self, chest_id)
+
+    def get(self, chest_id, default=None):
+        if self.unloaded:
+            self.load_shard(_shard_for(chest_id))
+        return dict.get(self, chest_id, default)
+
+    def __contains__(self, chest_id):
+        if self.unloaded:
+            self.load_shard(_shard_for(chest_id))
+        return dict.__contains__(self, chest_id)
+
+    def __setitem__(self, chest_id, chest):
+        if self.unloaded:
+            self.load_shard(_shard_for(chest_id))  # Reading it later must not overwrite this
+        dict.__setitem__(self, chest_id, chest)
+
+    def __delitem__(self, chest_id):
+        if self.unloaded:
+            self.load_shard(_shard_for(chest_id))
+        dict.__delitem__(self, chest_id)
+
+    def pop(self, chest_id, *default):
+        if self.unloaded:
+            self.load_shard(_shard_for(chest_id))
+        return dict.pop(self, chest_id, *default)
+
+    def __iter__(self):
+        self.load_all()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self.load_all()
+        return dict.__len__(self)
+
+    def keys(self):
+        self.load_all()
+        return dict.keys(self)
+
+    def values(self):
+        self.load_all()
+        return dict.values(self)
+
+    def items(self):
+        self.load_all()
+        return dict.items(self)
+
+def _chests_loaded(data, loaded, walls):
+    """Add newly read chests to the search index and stats tracking data.
+
+    walls are the walls now read in full; their layout chests with nothing
+    stored are indexed as empty.
+    """
+    index = search_index if search_index is not None and search_index["data"] is data else None
+    if index is not None:
+        index["version"] += 1
+        for chest_id, chest in loaded.items():
+            _unindex_chest(index, chest_id, None)
+            _index_chest(index, chest_id, chest)
+        for wall in walls:
+            _index_absent_chests(index, data, chests.get(wall, ()))
+    if chest_stats is not None and chest_stats["data"] is data:
+        for chest_id, chest in loaded.items():
+            _store_chest_stats(chest_stats, chest_id, compute_chest_stats(chest))
+
+def _load_sharded_data():
+    """Open the shard files without reading any; returns the lazy data and the journal size."""
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    records = _read_journal(SHARD_JOURNAL_FILE)
+    pending = _records_by_shard(records)
+    shards = {name[:-5] for name in os.listdir(SHARD_DIR) if name.endswith(".json")}
+    return ShardedStorage(shards | pending.keys(), pending), len(records)
+
+def _ensure_shard(data, shard):
+    """Read a wall's shard if data is sharded and it has not been read yet."""
+    if isinstance(data, ShardedStorage) and shard in data.unloaded:
+        data.load_shard(shard)
+
+@timed("load_data")
+def load_data(progressive=False):
+    """Load the storage, listing the chests that could not be read fully in load_errors.
+
+    With progressive set (JSON backend only), return at once with data that a
+    background parse fills in as the TUI calls loading_data(data).merge().
+    """
+    global journal, history, history_log, load_errors, progressive_load, partial_load, partial_load_accepted
+    if background_writer is not None:
+        background_writer.flush()  # Read the files with every submitted change in them
+    if progressive_load is not None:
+        progressive_load.cancel()
+        progressive_load = None
+    load_errors = []
+    partial_load = partial_load_accepted = False
+    if storage_client is not None:
+        data = data_from_json(storage_client.load())
+        records = 0
+    elif STORAGE_BACKEND == "sqlite":
+        data = load_sqlite_data(open_sqlite())
+        records = 0
+    elif STORAGE_BACKEND == "sharded":
+        data, records = _load_sharded_data()
+    elif progressive:
+        data, records = _start_progressive_load()
+    else:
+        data, records, load_errors, partial_load = _load_json_data()
+    journal = {"data": data, "pending": [], "records": records}
+    history = {"data": data, "group": [], "undo": deque(maxlen=UNDO_LIMIT), "redo": [], "replaying": None}
+    history_log = None  # Opened by the first save, so loading never writes to the disk
+    build_search_index(data)
+    build_chest_stats(data)
+    return data
+
+def compact_data(data):
+    """Fold the journal into a fresh snapshot and start an empty journal."""
+    global journal
+    if partial_load and journal is not None and journal["data"] is data:
+        raise ValueError(f"{SAVE_FILE} could not be read fully; accept_partial_load() before rewriting it")
+    if background_writer is not None:
+        background_writer.flush()
+    if STORAGE_BACKEND == "sharded":
+        # The shard files and journal hold all of the loaded data's saved changes
+        if journal is not None and journal["data"] is data and not journal["pending"]:
+            _compact_shards()
+        else:
+            write_shards(data_to_json(data))
+        journal = {"data": data, "pending": [], "records": 0}
+        return
+    _write_snapshot(data_to_json(data))
+    # Replaying the old journal over the new snapshot is harmless, so a crash
+    # before this truncate loses nothing.
+    with open(JOURNAL_FILE, 'w'):
+        pass
+    journal = {"data": data, "pending": [], "records": 0}
+
+@timed("save_data")
+def save_data(data):
+    """Persist changes to data, writing only the change log when it tracks data.
+
+    While connected to a storage server the changes go to the server instead,
+    which may reject them with StorageConflict.
+    """
+    global journal
+    tracked = journal is not None and journal["data"] is data
+    group = _end_history_group() if history is not None and history["data"] is data else None
+    if storage_client is not None:
+        if tracked:
+            records, journal["pending"] = journal["pending"], []
+        else:
+            records = [("C", chest_id, chest_to_json(chest)) for chest_id, chest in data.items()]
+        try:
+            storage_client.sync(data, records)
+        except OSError:
+            if tracked:
+                journal["pending"][:0] = records  # Not sent; keep them for the next save
+            raise
+        except StorageConflict:
+            # The server's contents are back in place, so there is nothing to undo
+            for stack in (history["undo"], history["redo"]) if group is not None else ():
+                if stack and stack[-1] is group:
+                    stack.pop()
+            raise
+        return
+    if tracked and journal["pending"] and history_log is None:
+        _start_history_log(data, group or ())
+    if tracked and background_writer is not None:
+        if journal["pending"]:
+            background_writer.submit(journal["pending"], (time.time(), journal["pending"]))
+            journal["pending"] = []
+        return
+    if STORAGE_BACKEND == "sqlite":
+        conn = open_sqlite()
+        if tracked:
+            apply_sqlite_records(conn, journal["pending"])
+            if journal["pending"]:
+                _append_history([(time.time(), journal["pending"])])
+            journal["pending"] = []
+        else:
+            write_sqlite_data(conn, data)
+            journal = {"data": data, "pending": [], "records": 0}
+        return
+    if not tracked:
+        # Data was not loaded through load_data, so there is no change log for it
+        compact_data(data)
+        return
+    if journal["pending"]:
+        _append_journal(journal["pending"])
+        _append_history([(time.time(), journal["pending"])])
+        journal["records"] += len(journal["pending"])
+        journal["pending"] = []
+    if journal["records"] >= JOURNAL_COMPACT_RECORDS and loading_data(data) is None and not partial_load:
+        compact_data(data)  # (Not while part of the snapshot is still unread or could not be)
+
+# Background writer: while it runs, save_data only hands the change records
+# to a thread that writes them, so the UI never waits on the disk.
+SAVE_COALESCE_SECONDS = 0.25  # Saves within this window are written together
+background_writer = None
+
+class BackgroundWriter:
+    """Thread persisting save_data's change records, coalescing bursts into one write.
+
+    For the JSON backend records are appended to JOURNAL_FILE, and the journal
+    is folded into SAVE_FILE from the files themselves (no access to the live
+    data); the sharded backend does the same with its own journal and the
+    shard files it touches; the SQLite backend applies them through the thread's own connection.
+    A failed write keeps its records queued and is raised by the next
+    submit() or flush().
+    """
+
+    def __init__(self, records):
+        self.records = records  # Records already in JOURNAL_FILE
+        self.queue = []
+        self.history = []  # Saved change groups for HISTORY_DIR
+        self.busy = False
+        self.flushing = False
+        self.stopping = False
+        self.error = None
+        self.conn = None
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+        self.thread.start()
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            self.cond.notify_all()  # Let the thread retry
+            raise error
+
+    def submit(self, records, history_group=None):
+        with self.cond:
+            self.queue.extend(records)
+            if history_group is not None:
+                self.history.append(history_group)
+            self.cond.notify_all()
+            self._raise_error()
+
+    def flush(self):
+        """Block until every submitted record is on disk."""
+        with self.cond:
+            self.flushing = True
+            self.cond.notify_all()
+            try:
+                while (self.queue or self.busy) and self.error is None:
+                    self.cond.wait()
+            finally:
+                self.flushing = False
+            self._raise_error()
+
+    def stop(self):
+        """Flush and end the thread."""
+        try:
+            self.flush()
+        finally:
+            with self.cond:
+                self.stopping = True
+                self.cond.notify_all()
+            self.thread.join()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while (not self.queue or self.error is not None) and not self.stopping:
+                    self.cond.wait()
+                if self.stopping:
+                    if self.conn is not None:
+                        self.conn.close()
+                    return
+                # Let the rest of a burst arrive before writing
+                deadline = time.monotonic() + SAVE_COALESCE_SECONDS
+                while not self.flushing and not self.stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                records, self.queue = self.queue, []
+                groups, self.history = self.history, []
+                self.busy = True
+            error = None
+            try:
+                self._write(records, groups)
+            except Exception as e:
+                error = e
+            with self.cond:
+                self.busy = False
+                if error is not None:
+                    self.queue[:0] = records
+                    self.history[:0] = groups
+                    self.error = error
+                self.cond.notify_all()
+
+    def _write(self, records, groups):
+        if STORAGE_BACKEND == "sqlite":
+            if self.conn is None:
+                import sqlite3
+                self.conn = sqlite3.connect(SQLITE_FILE)
+            apply_sqlite_records(self.conn, records)
+            _append_history(groups)
+            return
+        _append_journal(records)
+        _append_history(groups)
+        self.records += len(records)
+        if self.records >= JOURNAL_COMPACT_RECORDS and STORAGE_BACKEND == "sharded":
+            _compact_shards()
+            self.records = 0
+        elif self.records >= JOURNAL_COMPACT_RECORDS:
+            raw, errors = _read_snapshot()
+            self.records = 0
+            if errors and not partial_load_accepted:
+                return  # Keep the unreadable chests in SAVE_FILE; the journal holds the changes
+            _replay_journal(raw)
+            _write_snapshot(raw)
+            with open(JOURNAL_FILE, 'w'):
+                pass
+
+def start_background_writer():
+    """Move saving of the data loaded by load_data onto a background thread."""
+    global background_writer
+    if background_writer is None:
+        background_writer = BackgroundWriter(journal["records"] if journal else 0)
+        atexit.register(stop_background_writer)
+
+def stop_background_writer():
+    """Write everything still pending (including unsaved changes) and go back to synchronous saves."""
+    global background_writer
+    writer = background_writer
+    if writer is None:
+        return
+    if journal is not None and journal["pending"]:
+        writer.submit(journal["pending"], (time.time(), journal["pending"]))
+        journal["pending"] = []
+    try:
+        writer.stop()
+    finally:
+        background_writer = None
+        if journal is not None:
+            journal["records"] = writer.records
+            # Anything the writer could not write goes back to the change log;
+            # history groups it could not write are dropped
+            journal["pending"][:0] = writer.queue
+
+# Undo/redo and time travel. Each change to the loaded data remembers what the
+# slot (or whole chest) held before; the changes between two saves form one
+# undo group. Saved groups are also logged to HISTORY_DIR in segments, each
+# starting from a compressed snapshot, and only the newest segments are kept,
+# so any state they cover can be rebuilt from the nearest snapshot.
+HISTORY_DIR = "storage_data.history"
+HISTORY_SEGMENT_GROUPS = 1000  # Saved groups per segment before the next snapshot
+HISTORY_SEGMENTS_KEPT = 20
+UNDO_LIMIT = 500  # Undo groups kept in memory
+
+# Undo state for the loaded data: the open group of (op, chest ID, slot, old
+# item ID, old qty) / (op, chest ID, old JSON form) deltas, the undo and redo
+# stacks, and whether an undo or redo is being applied.
+history = None
+# The segment being written: {"start": group number of its snapshot, "seq": last group logged, "count": groups in it}
+history_log = None
+
+def _remember(data, delta):
+    if history is not None and history["data"] is data:
+        history["group"].append(delta)
+
+def _end_history_group():
+    """Close the changes since the last save into an undo (or, while undoing, a redo) group.
+
+    Returns the group, or None if nothing changed.
+    """
+    group = history["group"]
+    if not group:
+        return None
+    history["group"] = []
+    if history["replaying"] == "undo":
+        history["redo"].append(group)
+    else:
+        history["undo"].append(group)
+        if history["replaying"] is None:
+            history["redo"].clear()
+    return group
+
+def _replay_group(data, group, mode):
+    """Put back the old contents remembered in a group, newest change first, and save."""
+    history["replaying"] = mode
+    try:
+        for delta in reversed(group):
+            if delta[0] == "S":
+                _, chest_id, slot, item_id, qty = delta
+                if item_id:
+                    set_slot(data, chest_id, slot, item_names[item_id], qty)
+                else:
+                    clear_slot(data, chest_id, slot)
+            else:
+                set_chest(data, delta[1], chest_from_json(delta[2]) if delta[2] is not None else Chest())
+        save_data(data)
+    finally:
+        history["replaying"] = None
+    return len(group)
+
+def undo(data):
+    """Revert the last saved group of changes to data; returns the number of changes reverted."""
+    if history is None or history["data"] is not data:
+        return 0
+    save_data(data)  # Unsaved changes become the group to undo
+    if not history["undo"]:
+        return 0
+    return _replay_group(data, history["undo"].pop(), "undo")
+
+def redo(data):
+    """Reapply the last undone group of changes; returns the number of changes reapplied."""
+    if history is None or history["data"] is not data:
+        return 0
+    save_data(data)  # Unsaved changes start a new line of history, dropping the redo stack
+    if not history["redo"]:
+        return 0
+    return _replay_group(data, history["redo"].pop(), "redo")
+
+def _history_path(start, kind):
+    return os.path.join(HISTORY_DIR, f"{start:010d}.{kind}")
+
+def _history_segments():
+    """Return the group numbers of the kept snapshots, oldest first."""
+    if not os.path.isdir(HISTORY_DIR):
+        return []
+    return sorted(int(name.split(".")[0]) for name in os.listdir(HISTORY_DIR) if name.endswith(".snapshot.json.gz"))
+
+def _write_history_snapshot(seq, raw):
+    import gzip
+    path = _history_path(seq, "snapshot.json.gz")
+    with gzip.open(path + ".tmp", 'wt', compresslevel=1) as f:
+        json.dump(raw, f, separators=(',', ':'))
+    os.replace(path + ".tmp", path)
+
+def _read_history_snapshot(seq):
+    import gzip
+    with gzip.open(_history_path(seq, "snapshot.json.gz"), 'rt') as f:
+        return json.load(f)
+
+def _read_history_lines(start):
+    """Yield (group, line length) for the segment starting at start, ending at a torn or corrupt line."""
+    path = _history_path(start, "groups.jsonl")
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                return
+            yield entry, len(line)
+
+def _read_history_groups(start):
+    return (entry for entry, _ in _read_history_lines(start))
+
+def _open_history_log(raw):
+    """Find the segment to log to, starting the history with a snapshot of raw() if there is none."""
+    starts = _history_segments()
+    if not starts:
+        os.makedirs(HISTORY_DIR, exist_ok=True)
+        _write_history_snapshot(0, raw())
+        return {"start": 0, "seq": 0, "count": 0}
+    start = starts[-1]
+    log = {"start": start, "seq": start, "count": 0}
+    good_end = 0
+    for entry, length in _read_history_lines(start):
+        log["seq"] = entry["seq"]
+        log["count"] += 1
+        good_end += length
+    path = _history_path(start, "groups.jsonl")
+    if os.path.exists(path) and good_end < os.path.getsize(path):
+        with open(path, 'r+b') as f:  # Cut off a record torn by a crash
+            f.truncate(good_end)
+    return log
+
+def _start_history_log(data, group):
+    """Open the history log for the first save of the loaded data.
+
+    A new history starts from data as it was before that save, rebuilt by
+    putting back the old contents remembered in its undo group. Until a
+    progressive load has read every chest, a new history is not started.
+    """
+    global history_log
+    if history is None or history["data"] is not data:
+        return
+    if loading_data(data) is not None and not _history_segments():
+        return
+
+    def before():
+        raw = data_to_json(data)
+        for delta in reversed(group):
+            if delta[0] == "C":
+                if delta[2] is None:
+                    raw.pop(delta[1], None)
+                else:
+                    _apply_journal_record(raw, delta)
+            elif delta[3]:
+                _apply_journal_record(raw, ("U", delta[1], str(delta[2]), item_names[delta[3]], delta[4]))
+            else:
+                _apply_journal_record(raw, ("R", delta[1], str(delta[2])))
+        return raw
+
+    history_log = _open_history_log(before)
+
+def _append_history(groups):
+    """Log saved change groups [(time, records)], starting a new segment when this one is full."""
+    log = history_log
+    if log is None or not groups:
+        return
+    lines = []
+    for saved_at, records in groups:
+        log["seq"] += 1
+        lines.append(json.dumps({"seq": log["seq"], "t": round(saved_at, 3), "records": records},
+                                separators=(',', ':')))
+    with open(_history_path(log["start"], "groups.jsonl"), 'a') as f:
+        f.write("\n".join(lines) + "\n")
+    log["count"] += len(groups)
+    if log["count"] >= HISTORY_SEGMENT_GROUPS:
+        _write_history_snapshot(log["seq"], _history_raw(log["seq"]))
+        log["start"], log["count"] = log["seq"], 0
+        for start in _history_segments()[:-HISTORY_SEGMENTS_KEPT]:
+            for kind in ("snapshot.json.gz", "groups.jsonl"):
+                if os.path.exists(_history_path(start, kind)):
+                    os.remove(_history_path(start, kind))
+
+def _history_raw(seq):
+    """Return the storage_data.json contents as they were after saved group seq."""
+    starts = [start for start in _history_segments() if start <= seq]
+    if not starts:
+        raise ValueError(f"Change {seq} is older than the kept history")
+    raw = _read_history_snapshot(starts[-1])
+    last = starts[-1]
+    for entry in _read_history_groups(starts[-1]):
+        if entry["seq"] > seq:
+            break
+        for record in entry["records"]:
+            _apply_journal_record(raw, record)
+        last = entry["seq"]
+    if last != seq:
+        raise ValueError(f"No change {seq} in the history")
+    return raw
+
+def history_entries():
+    """Return (group number, save time, change count) for every saved group in the kept history."""
+    if background_writer is not None:
+        background_writer.flush()
+    return [(entry["seq"], entry["t"], len(entry["records"]))
+            for start in _history_segments() for entry in _read_history_groups(start)]
+
+def history_state(seq):
+    """Return the data as it was after saved group seq (0 is where the history starts)."""
+    if background_writer is not None:
+        background_writer.flush()
+    return data_from_json(_history_raw(seq))
+
+def _diff_raw(before, after):
+    rows = []
+    for chest_id in sorted(before.keys() | after.keys()):
+        old, new = before.get(chest_id, {}), after.get(chest_id, {})
+        if old == new:
+            continue
+        old_label = old if isinstance(old, str) else None
+        new_label = new if isinstance(new, str) else None
+        if old_label != new_label:
+            rows.append((chest_id, None, old_label, new_label))
+        old_slots = old if isinstance(old, dict) else {}
+        new_slots = new if isinstance(new, dict) else {}
+        for slot in sorted(old_slots.keys() | new_slots.keys(), key=int):
+            old_stack, new_stack = old_slots.get(slot), new_slots.get(slot)
+            if old_stack != new_stack:
+                rows.append((chest_id, int(slot), tuple(old_stack) if old_stack else None,
+                             tuple(new_stack) if new_stack else None))
+    return rows
+
+def history_diff(data, seq, other_seq=None):
+    """Compare the state after saved group seq with the one after other_seq (default: data now).
+
+    Returns sorted (chest ID, slot, before, after) rows: before/after are
+    (item name, qty) or None, or for label changes (slot None) the label.
+    """
+    if background_writer is not None:
+        background_writer.flush()
+    after = _history_raw(other_seq) if other_seq is not None else data_to_json(data)
+    return _diff_raw(_history_raw(seq), after)
+
+def restore_history(data, seq):
+    """Make data what it was after saved group seq, as one undoable change; returns the chests changed."""
+    if background_writer is not None:
+        background_writer.flush()
+    raw = _history_raw(seq)
+    changed = 0
+    for chest_id in sorted(raw.keys() | data.keys()):
+        value = raw.get(chest_id, {})
+        if (chest_to_json(data[chest_id]) if chest_id in data else {}) != value:
+            set_chest(data, chest_id, chest_from_json(value))
+            changed += 1
+    save_data(data)
+    return changed
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    name_lower TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_name_lower ON items (name_lower);
+-- label is NULL for slot chests and the label text for old label chests;
+-- wall follows the layout in use ("" outside it), see _sqlite_refresh_walls
+CREATE TABLE IF NOT EXISTS chests (
+    id TEXT PRIMARY KEY,
+    wall TEXT NOT NULL,
+    label TEXT
+);
+CREATE INDEX IF NOT EXISTS chests_wall ON chests (wall);
+CREATE TABLE IF NOT EXISTS slots (
+    chest_id TEXT NOT NULL REFERENCES chests (id),
+    slot TEXT NOT NULL,
+    item_id INTEGER NOT NULL REFERENCES items (id),
+    qty INTEGER NOT NULL,
+    PRIMARY KEY (chest_id, slot)
+);
+CREATE INDEX IF NOT EXISTS slots_item ON slots (item_id);
+"""
+
+def open_sqlite():
+    """Return the connection to SQLITE_FILE, creating the schema on first use."""
+    global sqlite_conn
+    if sqlite_conn is None:
+        import sqlite3
+        sqlite_conn = sqlite3.connect(SQLITE_FILE)
+        sqlite_conn.executescript(SQLITE_SCHEMA)
+        _sqlite_refresh_walls(sqlite_conn)
+    return sqlite_conn
+
+def _sqlite_refresh_walls(conn):
+    """Set each chest's wall column to its wall in the current layout ("" for chests outside it)."""
+    stale = [(chest_walls.get(chest_id, ""), chest_id) for chest_id, wall in conn.execute("SELECT id, wall FROM chests")
+             if chest_walls.get(chest_id, "") != wall]
+    if stale:
+        with conn:
+            conn.executemany("UPDATE chests SET wall = ? WHERE id = ?", stale)
+
+def load_sqlite_data(conn):
+    """Build the in-memory model from the SQLite tables."""
+    data = {}
+    for chest_id, label in conn.execute("SELECT id, label FROM chests ORDER BY id"):
+        data[chest_id] = Chest(label)
+    # SQLite item IDs -> interned item IDs
+    interned = {row_id: intern_item(name) for row_id, name in conn.execute("SELECT id, name FROM items")}
+    for chest_id, slot_key, item_id, qty in conn.execute("SELECT chest_id, slot, item_id, qty FROM slots"):
+        slot = int(slot_key)
+        data[chest_id].qtys[slot] = qty
+        data[chest_id].items[slot] = interned[item_id]
+    return data
+
+def _sqlite_item_id(conn, item_name):
+    row = conn.execute("SELECT id FROM items WHERE name = ?", (item_name,)).fetchone()
+    if row:
+        return row[0]
+    return conn.execute("INSERT INTO items (name, name_lower) VALUES (?, ?)",
+                        (item_name, item_name.lower())).lastrowid
+
+def _sqlite_set_chest(conn, chest_id, chest_data):
+    """Replace one chest's row and slots from its storage_data.json form."""
+    label = chest_data if isinstance(chest_data, str) else None
+    conn.execute("INSERT INTO chests (id, wall, label) VALUES (?, ?, ?) "
+                 "ON CONFLICT (id) DO UPDATE SET label = excluded.label",
+                 (chest_id, chest_walls.get(chest_id, ""), label))
+    conn.execute("DELETE FROM slots WHERE chest_id = ?", (chest_id,))
+    if isinstance(chest_data, dict):
+        for slot_key, value in chest_data.items():
+            if isinstance(value, (list, tuple)) and len(value) >= 2 and isinstance(value[0], str):
+                conn.execute("INSERT INTO slots (chest_id, slot, item_id, qty) VALUES (?, ?, ?, ?)",
+                             (chest_id, str(slot_key), _sqlite_item_id(conn, value[0]), value[1]))
+
+def apply_sqlite_records(conn, records):
+    """Apply change records to the SQLite tables in one transaction."""
+    if not records:
+        return
+    with conn:
+        for record in records:
+            op, chest_id = record[0], record[1]
+            if op == "U":
+                conn.execute("INSERT INTO chests (id, wall, label) VALUES (?, ?, NULL) "
+                             "ON CONFLICT (id) DO UPDATE SET label = NULL",
+                             (chest_id, chest_walls.get(chest_id, "")))
+                conn.execute("INSERT INTO slots (chest_id, slot, item_id, qty) VALUES (?, ?, ?, ?) "
+                             "ON CONFLICT (chest_id, slot) DO UPDATE SET item_id = excluded.item_id, qty = excluded.qty",
+                             (chest_id, record[2], _sqlite_item_id(conn, record[3]), record[4]))
+            elif op == "R":
+                conn.execute("DELETE FROM slots WHERE chest_id = ? AND slot = ?", (chest_id, record[2]))
+            elif op == "C":
+                _sqlite_set_chest(conn, chest_id, record[2])
+
+def write_sqlite_data(conn, data):
+    """Replace everything in the SQLite tables with data."""
+    with conn:
+        conn.execute("DELETE FROM slots")
+        conn.execute("DELETE FROM chests")
+        for chest_id, chest in data.items():
+            _sqlite_set_chest(conn, chest_id, chest_to_json(chest))
+
+def migrate_json_to_sqlite(accept_partial=False):
+    """Copy the JSON snapshot and journal (including old label chests) into SQLITE_FILE.
+
+    Raises ValueError if some of the snapshot can't be read, unless accept_partial is set.
+    """
+    data, _, errors, partial = _load_json_data()
+    if partial and not accept_partial:
+        raise ValueError(_load_errors_summary(errors))
+    write_sqlite_data(open_sqlite(), data)
+    return len(data)
+
+def sqlite_search_items(conn, query):
+    """Return (chest_id, slot, item_name, qty) rows whose item name contains query, like find_items().
+
+    Matching runs over the distinct item names; slots are then found through
+    the slots_item index.
+    """
+    # CROSS JOIN keeps items as the outer loop, so slots are looked up by item_id
+    rows = conn.execute("SELECT s.chest_id, s.slot, i.name, s.qty FROM items i "
+                        "CROSS JOIN slots s ON s.item_id = i.id WHERE instr(i.name_lower, ?) > 0 "
+                        "ORDER BY s.chest_id, CAST(s.slot AS INTEGER)", (query.lower(),))
+    return [(chest_id, int(slot), item_name, qty) for chest_id, slot, item_name, qty in rows]
+
+_SQL_WHITESPACE = " \t\n\r"  # Characters trim() drops, standing in for str.strip()
+
+def sqlite_wall_stats(conn, wall):
+    """Return (filled_chests, total_chests, total_items) for a wall from the SQLite tables, like get_wall_stats()."""
+    filled_labels = conn.execute("SELECT COUNT(*) FROM chests WHERE wall = ? AND trim(label, ?) != ''",
+                                 (wall, _SQL_WHITESPACE)).fetchone()[0]
+    filled_slots, total_items = conn.execute(
+        "SELECT COUNT(CASE WHEN total > 0 THEN 1 END), COALESCE(SUM(total), 0) FROM "
+        "(SELECT SUM(s.qty) AS total FROM chests c JOIN slots s ON s.chest_id = c.id "
+        "JOIN items i ON i.id = s.item_id WHERE c.wall = ? AND trim(i.name, ?) != '' GROUP BY c.id)",
+        (wall, _SQL_WHITESPACE)).fetchone()
+    return (filled_labels + filled_slots, len(chests[wall]), total_items)
+
+def _sqlite_queries(data):
+    """Return the SQLite connection if queries on data can go to the tables instead of memory.
+
+    That is when data is None (nothing loaded) or what load_data() read from
+    SQLITE_FILE, with every change to it written there and no background
+    writer that could still be holding some.
+    """
+    if STORAGE_BACKEND != "sqlite" or storage_client is not None or background_writer is not None:
+        return None
+    if data is not None and (journal is None or journal["data"] is not data or journal["pending"]):
+        return None
+    return open_sqlite()
+
+def _parse_chest_range(range_str):
+    """Split a range like "A01–A05" or "A01-A05" (or a single "A26") into its first and last chest IDs."""
+    for separator in ("–", "-"):
+        if separator in range_str:
+            start, end = range_str.split(separator, 1)
+            return start.strip(), end.strip()
+    return range_str.strip(), range_str.strip()
+
+def compile_categories(chests, categories):
+    """Compile the category ranges into direct lookup tables.
+
+    Returns (chest_categories, category_starts): chest ID -> category name, and
+    wall -> set of positions in the wall's chest list where a new category
+    header begins. Overlapping, malformed or missing ranges raise ValueError.
+    """
+    chest_categories = {}
+    category_starts = {}
+    problems = []
+    for wall, wall_chests in chests.items():
+        prefix = len(wall)
+        positions = {}
+        for pos, chest_id in enumerate(wall_chests):
+            try:
+                positions[int(chest_id[prefix:])] = pos
+            except ValueError:
+                problems.append(f"Chest {chest_id} has no chest number")
+        for range_str, category in categories.get(wall, []):
+            start, end = _parse_chest_range(range_str)
+            try:
+                start_num, end_num = int(start[prefix:]), int(end[prefix:])
+            except ValueError:
+                problems.append(f"Malformed category range '{range_str}' on wall {wall}")
+                continue
+            if start[:prefix] != wall or end[:prefix] != wall or start_num > end_num:
+                problems.append(f"Malformed category range '{range_str}' on wall {wall}")
+                continue
+            for chest_num in range(start_num, end_num + 1):
+                chest_id = wall_chests[positions[chest_num]] if chest_num in positions else None
+                if chest_id is None:
+                    problems.append(f"Category range '{range_str}' covers unknown chest "
+                                    f"{wall}{str(chest_num).zfill(len(start) - prefix)}")
+                elif chest_id in chest_categories:
+                    problems.append(f"Chest {chest_id} is in both '{chest_categories[chest_id]}' and '{category}'")
+                else:
+                    chest_categories[chest_id] = category
+        missing = [cid for cid in wall_chests if cid not in chest_categories]
+        if missing:
+            listed = ", ".join(missing[:10]) + (f" (+{len(missing) - 10} more)" if len(missing) > 10 else "")
+            problems.append(f"Wall {wall} chests without a category: {listed}")
+
+        # A header starts wherever the category differs from the chest above it
+        starts = set()
+        previous = None
+        for pos, chest_id in enumerate(wall_chests):
+            category = chest_categories.get(chest_id, "Unknown")
+            if category != previous:
+                starts.add(pos)
+            previous = category
+        category_starts[wall] = starts
+    if problems:
+        raise ValueError("Invalid category definitions:\n  " + "\n  ".join(problems))
+    return chest_categories, category_starts
+
+# Optional layout file replacing the built-in rooms, walls and categories above:
+# {"rooms": [{"name": "Main", "walls": [{"id": "A", "chests": 35,
+#   "categories": [["A01-A05", "Stone"], ...]}, ...]}, ...]}
+# Chest IDs are the wall ID plus the chest number, zero-padded to two digits
+# (or to "digits" if the wall sets it). The command line reads it at startup;
+# scripts importing this module call configure_layout(*read_layout(LAYOUT_FILE)).
+LAYOUT_FILE = "storage_layout.json"
+
+# Lookup tables derived from the layout by configure_layout
+chest_walls = {}     # chest ID -> wall
+wall_order = []      # every wall, room by room, in navigation order
+wall_positions = {}  # wall -> position in wall_order
+wall_rooms = {}      # wall -> room name
+chest_categories = {}
+category_starts = {}
+category_chests = {}  # category -> its chest IDs in navigation order
+overflow_categories = {}  # category taking what doesn't fit elsewhere -> its wall, in navigation order
+category_keywords = {}  # word of a category name -> categories, overflow ones left out
+keyword_matches = {}    # word of an item name -> {category: score}, filled as items are placed
+
+def read_layout(path):
+    """Read a layout file and return (rooms, chests, categories) in the built-in form."""
+    with open(path, 'r') as f:
+        raw = json.load(f)
+    new_rooms = {}
+    new_chests = {}
+    new_categories = {}
+    problems = []
+    room_list = raw.get("rooms") if isinstance(raw, dict) else None
+    if not isinstance(room_list, list) or not room_list:
+        raise ValueError(f"Invalid layout file {path}: expected a non-empty \"rooms\" list")
+    for room in room_list:
+        name = room.get("name") if isinstance(room, dict) else None
+        if not isinstance(name, str) or not name.strip() or name in new_rooms:
+            problems.append(f"Room {name!r} needs a unique name")
+            continue
+        new_rooms[name] = []
+        for wall_def in room.get("walls", []):
+            wall = wall_def.get("id") if isinstance(wall_def, dict) else None
+            if not isinstance(wall, str) or not wall.isalpha():
+                problems.append(f"Room {name}: wall ID {wall!r} must be letters only")
+                continue
+            wall = wall.upper()
+            count = wall_def.get("chests")
+            if wall in new_chests:
+                problems.append(f"Wall {wall} is defined more than once")
+                continue
+            if not isinstance(count, int) or count < 1:
+                problems.append(f"Wall {wall}: chest count must be a positive integer")
+                continue
+            digits = wall_def.get("digits", 2)
+            if not isinstance(digits, int) or digits < 1:
+                problems.append(f"Wall {wall}: digits must be a positive integer")
+                continue
+            new_rooms[name].append(wall)
+            new_chests[wall] = [f"{wall}{str(i).zfill(digits)}" for i in range(1, count + 1)]
+            entries = wall_def.get("categories", [])
+            if not isinstance(entries, list):
+                problems.append(f"Wall {wall}: categories must be a list of [range, name] pairs")
+                entries = []
+            new_categories[wall] = []
+            for entry in entries:
+                if not isinstance(entry, (list, tuple)) or len(entry) != 2:
+                    problems.append(f"Wall {wall}: category entry {entry!r} must be [range, name]")
+                    continue
+                range_str, category = entry
+                new_categories[wall].append((str(range_str).upper(), str(category)))
+        if not new_rooms[name]:
+            problems.append(f"Room {name} has no walls")
+    if problems:
+        raise ValueError(f"Invalid layout file {path}:\n  " + "\n  ".join(problems))
+    return new_rooms, new_chests, new_categories
+
+def layout_to_json():
+    """Return the current layout in layout file form."""
+    room_list = []
+    for name, room_walls in rooms.items():
+        wall_defs = []
+        for wall in room_walls:
+            wall_chests = chests[wall]
+            wall_defs.append({"id": wall, "chests": len(wall_chests),
+                              "digits": len(wall_chests[0]) - len(wall),
+                              "categories": [list(entry) for entry in categories.get(wall, [])]})
+        room_list.append({"name": name, "walls": wall_defs})
+    return {"rooms": room_list}
+
+OVERFLOW_WORD = "overflow"  # Categories with this in their name take what doesn't fit elsewhere
+
+def _name_words(name):
+    """Lower-case words of a name, with a plural "s" dropped."""
+    words = "".join(c if c.isalnum() else " " for c in name.lower()).split()
+    return [word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+            for word in words]
+
+def configure_layout(new_rooms, new_chests, new_categories):
+    """Switch to a new layout, rebuilding the chest, wall and category lookups.
+
+    The layout is validated first; an invalid one raises ValueError and leaves
+    the current layout in place.
+    """
+    new_rooms = {name: list(room_walls) for name, room_walls in new_rooms.items()}
+    new_chests = dict(new_chests)
+    new_categories = dict(new_categories)
+    new_wall_order = [wall for room_walls in new_rooms.values() for wall in room_walls]
+    if sorted(new_wall_order) != sorted(new_chests):
+        raise ValueError("Every wall must belong to exactly one room")
+    new_chest_walls = {cid: wall for wall, wall_chests in new_chests.items() for cid in wall_chests}
+    if len(new_chest_walls) != sum(len(wall_chests) for wall_chests in new_chests.values()):
+        raise ValueError("Chest IDs must be unique across walls")
+    compiled_categories, compiled_starts = compile_categories(new_chests, new_categories)
+    new_category_chests = {}
+    for wall in new_wall_order:
+        for chest_id in new_chests[wall]:
+            new_category_chests.setdefault(compiled_categories[chest_id], []).append(chest_id)
+    new_overflow = {category: new_chest_walls[chest_ids[0]]
+                    for category, chest_ids in new_category_chests.items()
+                    if OVERFLOW_WORD in category.lower()}
+    new_keywords = {}
+    for category in new_category_chests:
+        if category not in new_overflow:
+            for word in set(_name_words(category)):
+                new_keywords.setdefault(word, []).append(category)
+
+    # Update the tables in place so references held elsewhere stay current
+    for table, value in ((rooms, new_rooms), (chests, new_chests), (categories, new_categories),
+                         (chest_walls, new_chest_walls), (chest_categories, compiled_categories),
+                         (category_starts, compiled_starts), (category_chests, new_category_chests),
+                         (category_keywords, new_keywords), (keyword_matches, {}),
+                         (overflow_categories, new_overflow)):
+        table.clear()
+        table.update(value)
+    wall_order[:] = new_wall_order
+    wall_positions.clear()
+    wall_positions.update((wall, pos) for pos, wall in enumerate(wall_order))
+    wall_rooms.clear()
+    wall_rooms.update((wall, name) for name, room_walls in rooms.items() for wall in room_walls)
+
+configure_layout(rooms, chests, categories)
+
+def _join_choices(choices):
+    """Join choices as "A", "A or B" or "A, B, or C"."""
+    if len(choices) <= 2:
+        return " or ".join(choices)
+    return ", ".join(choices[:-1]) + ", or " + choices[-1]
+
+def get_category_for_chest(chest_id):
+    """Get the category description for a given chest ID."""
+    return chest_categories.get(chest_id, "Unknown")
+
+# Inverted search index for the loaded data. Kept in sync by the mutation
+# helpers below so that searching never has to walk every slot.
+search_index = None
+ALL_SLOTS_FREE = (1 << SLOTS_PER_CHEST) - 1  # Free-slot mask of an empty chest
+
+def _index_slot(index, chest_id, slot, item_id, qty):
+    if item_id and item_names[item_id]:
+        locations = index["items"].setdefault(item_id, {})
+        locations.setdefault(chest_id, {})[slot] = qty
+        totals = index["totals"]
+        totals[item_id] = totals.get(item_id, 0) + qty
+
+def _unindex_slot(index, chest_id, slot, item_id):
+    if not item_id or not item_names[item_id]:
+        return
+    locations = index["items"].get(item_id)
+    if not locations or chest_id not in locations:
+        return
+    qty = locations[chest_id].pop(slot, None)
+    if qty is not None:
+        index["totals"][item_id] -= qty
+    if not locations[chest_id]:
+        del locations[chest_id]
+        if not locations:
+            del index["items"][item_id]
+            del index["totals"][item_id]
+
+def _index_chest(index, chest_id, chest):
+    index["chests"][chest_id] = chest_id.lower()
+    if chest.label is not None:
+        index["labels"][chest_id] = chest.label.lower()
+        # A chest with an old label is never picked for new stacks; a cleared one is empty
+        index["free"][chest_id] = 0 if chest.label.strip() else ALL_SLOTS_FREE
+    else:
+        free = 0
+        for slot, item_id in enumerate(chest.items):
+            if item_id:
+                _index_slot(index, chest_id, slot, item_id, chest.qtys[slot])
+            else:
+                free |= 1 << slot
+        index["free"][chest_id] = free
+
+def _unindex_chest(index, chest_id, chest):
+    index["chests"].pop(chest_id, None)
+    index["labels"].pop(chest_id, None)
+    index["free"].pop(chest_id, None)
+    if chest is None:
+        return
+    for slot, item_id in enumerate(chest.items):
+        if item_id:
+            _unindex_slot(index, chest_id, slot, item_id)
+
+def build_search_index(data):
+    """Build the inverted item index (item ID -> chest ID -> slot -> qty) for data.
+
+    The index also keeps the item ledger (item ID -> total quantity stored) and
+    a bitmask of the empty slots in each chest.
+    """
+    global search_index
+    index = {"data": data, "items": {}, "totals": {}, "chests": {}, "labels": {}, "free": {}, "version": 0}
+    # Sharded or progressively loaded data is indexed as its walls are read
+    for chest_id, chest in dict.items(data):
+        _index_chest(index, chest_id, chest)
+    unloaded = getattr(data, "unloaded", ())
+    for wall, wall_chests in chests.items():
+        if wall not in unloaded:
+            _index_absent_chests(index, data, wall_chests)
+    search_index = index
+    return index
+
+def _index_absent_chests(index, data, chest_ids):
+    # Layout chests with nothing stored search like empty label chests
+    for chest_id in chest_ids:
+        if not dict.__contains__(data, chest_id):
+            index["chests"][chest_id] = chest_id.lower()
+            index["labels"][chest_id] = ""
+            index["free"][chest_id] = ALL_SLOTS_FREE
+
+def get_search_index(data):
+    """Return the search index for data, building it if data is not the indexed one.
+
+    Searching covers every chest, so any unread shards of sharded data are read.
+    """
+    if search_index is None or search_index["data"] is not data:
+        build_search_index(data)
+    if isinstance(data, ShardedStorage) and data.unloaded:
+        data.load_all()
+    return search_index
+
+def _active_index(data):
+    """Return the search index if it tracks data, so mutations can update it."""
+    if search_index is not None and search_index["data"] is data:
+        search_index["version"] += 1
+        return search_index
+    return None
+
+# Per-chest aggregates and per-wall rollups for the loaded data. Only the
+# chest a mutation touches is recomputed.
+chest_stats = None
+
+def compute_chest_stats(chest):
+    """Return (total_quantity, distinct_items, filled) for a single chest.
+
+    A slot chest is filled when it holds a quantity above 0, not just named items.
+    """
+    if chest is None:
+        return (0, 0, False)
+    if chest.label is not None:
+        # Old label-based data
+        return (0, 0, chest.label.strip() != "")
+    total_quantity = 0
+    distinct = set()
+    for item_id, qty in zip(chest.items, chest.qtys):
+        if item_id and item_names[item_id].strip():
+            total_quantity += qty
+            distinct.add(item_id)
+    return (total_quantity, len(distinct), total_quantity > 0)
+
+def _store_chest_stats(cache, chest_id, stats):
+    """Record a chest's aggregates, moving its old contribution out of the wall rollup."""
+    old = cache["chests"].get(chest_id)
+    cache["chests"][chest_id] = stats
+    wall = chest_walls.get(chest_id)
+    if wall is None:
+        return
+    rollup = cache["walls"][wall]
+    if old is not None:
+        rollup[0] -= old[2]
+        rollup[1] -= old[0]
+    rollup[0] += stats[2]
+    rollup[1] += stats[0]
+
+def build_chest_stats(data):
+    """Compute aggregates for every chest in data and the per-wall rollups."""
+    global chest_stats
+    cache = {"data": data, "chests": {}, "walls": {wall: [0, 0] for wall in chests}}
+    for chest_id, chest in dict.items(data):  # Sharded data adds each shard as it is read
+        _store_chest_stats(cache, chest_id, compute_chest_stats(chest))
+    chest_stats = cache
+    return cache
+
+def _get_chest_stats_cache(data):
+    if chest_stats is None or chest_stats["data"] is not data:
+        return build_chest_stats(data)
+    return chest_stats
+
+def get_chest_stats(data, chest_id):
+    """Return cached (total_quantity, distinct_items, filled) for a chest."""
+    cache = _get_chest_stats_cache(data)
+    _ensure_shard(data, _shard_for(chest_id))
+    return cache["chests"].get(chest_id, (0, 0, False))
+
+def get_wall_stats(data, wall):
+    """Return cached (filled_chests, total_chests, total_items) for a wall."""
+    conn = _sqlite_queries(data)
+    if conn is not None:
+        return sqlite_wall_stats(conn, wall)
+    cache = _get_chest_stats_cache(data)
+    _ensure_shard(data, wall)
+    filled_chests, total_items = cache["walls"][wall]
+    return (filled_chests, len(chests[wall]), total_items)
+
+def _refresh_chest_stats(data, chest_id):
+    if chest_stats is not None and chest_stats["data"] is data:
+        _store_chest_stats(chest_stats, chest_id, compute_chest_stats(data.get(chest_id)))
+
+def set_slot(data, chest_id, slot, item_name, qty):
+    """Store an item stack in a chest slot, converting old label chests to slots."""
+    index = _active_index(data)
+    chest = data.get(chest_id)
+    remember = history is not None and history["data"] is data
+    if remember:
+        if chest is None or chest.label is not None:
+            old = ("C", chest_id, chest.label if chest is not None else None)
+        else:
+            old = ("S", chest_id, slot, chest.items[slot], chest.qtys[slot])
+    if chest is None:
+        chest = Chest()
+        chest.qtys[slot] = qty  # Oversized quantities fail before data changes
+        data[chest_id] = chest
+        if index is not None:
+            index["chests"][chest_id] = chest_id.lower()
+            index["labels"].pop(chest_id, None)
+    else:
+        chest.qtys[slot] = qty
+    if chest.label is not None:
+        chest.label = None
+        if index is not None:
+            index["labels"].pop(chest_id, None)
+            index["free"][chest_id] = ALL_SLOTS_FREE
+    item_id = intern_item(item_name)
+    if index is not None:
+        _unindex_slot(index, chest_id, slot, chest.items[slot])
+        _index_slot(index, chest_id, slot, item_id, qty)
+        index["free"][chest_id] = index["free"].get(chest_id, ALL_SLOTS_FREE) & ~(1 << slot)
+    if not chest.items[slot]:
+        chest.note_filled(slot)
+    chest.items[slot] = item_id
+    _record(data, "U", chest_id, str(slot), item_name, qty)
+    if remember:
+        history["group"].append(old)
+    _refresh_chest_stats(data, chest_id)
+
+def clear_slot(data, chest_id, slot):
+    """Empty a chest slot and return its (item_name, qty), or None if it was empty."""
+    chest = data.get(chest_id)
+    if chest is None or not chest.items[slot]:
+        return None
+    item_id, qty = chest.items[slot], chest.qtys[slot]
+    chest.items[slot] = 0
+    chest.qtys[slot] = 0
+    _record(data, "R", chest_id, str(slot))
+    _remember(data, ("S", chest_id, slot, item_id, qty))
+    index = _active_index(data)
+    if index is not None:
+        _unindex_slot(index, chest_id, slot, item_id)
+        index["free"][chest_id] = index["free"].get(chest_id, 0) | (1 << slot)
+    _refresh_chest_stats(data, chest_id)
+    return item_names[item_id], qty
+
+def set_chest(data, chest_id, chest):
+    """Replace a whole chest, e.g. with Chest(label) for a labelled or cleared chest."""
+    index = _active_index(data)
+    if index is not None:
+        _unindex_chest(index, chest_id, data.get(chest_id))
+    if history is not None and history["data"] is data:
+        history["group"].append(("C", chest_id, chest_to_json(data[chest_id]) if chest_id in data else None))
+    data[chest_id] = chest
+    _record(data, "C", chest_id, chest_to_json(chest))
+    if index is not None:
+        _index_chest(index, chest_id, chest)
+    _refresh_chest_stats(data, chest_id)
+
+def _chest_search_result(chest, chest_id, query_lower, matched_ids):
+    """Build the (chest_id, label) search result for a matching slot chest."""
+    if matched_ids:
+        items = chest.items
+        if chest.order is not None:
+            items = [items[slot] for slot in chest.filled_slots()]
+        found_items = [item_names[item_id] for item_id in items if item_id in matched_ids]
+        if found_items:
+            # Show first few matching items
+            item_summary = ", ".join(found_items[:3])
+            if len(found_items) > 3:
+                item_summary += f" (+{len(found_items)-3} more)"
+            return (chest_id, item_summary)
+    if query_lower in chest_id.lower():
+        # Just chest ID matched
+        return (chest_id, f"{sum(chest.qtys)} items")
+    return None
+
+# Recent search results for the indexed data, so extending a query only
+# re-checks the previous matches and backspacing reuses earlier results.
+SEARCH_CACHE_QUERIES = 64
+search_cache = None
+
+def _evaluate_search(data, index, query_lower, candidates, item_pool):
+    """Run a search over candidate chest IDs, matching item IDs from item_pool.
+
+    Returns (matched_ids, result_chest_ids, results).
+    """
+    # Item names are matched once per distinct item, not once per slot
+    matched_ids = set()
+    name_matches = set()
+    index_items = index["items"]
+    for item_id in item_pool:
+        if item_id in index_items and query_lower in item_names_lower[item_id]:
+            matched_ids.add(item_id)
+            name_matches.update(index_items[item_id])
+
+    results = []
+    labels = index["labels"]
+    index_chests = index["chests"]
+    for chest_id in candidates:
+        chest_id_lower = index_chests.get(chest_id)
+        if chest_id_lower is None:
+            continue
+        if chest_id in labels:
+            # Old string format
+            if query_lower in labels[chest_id] or query_lower in chest_id_lower:
+                results.append((chest_id, data[chest_id].label if chest_id in data else ""))
+        elif chest_id in name_matches or query_lower in chest_id_lower:
+            result = _chest_search_result(data[chest_id], chest_id, query_lower,
+                                          matched_ids if chest_id in name_matches else None)
+            if result:
+                results.append(result)
+    results.sort()
+    return matched_ids, {chest_id for chest_id, _ in results}, results
+
+@timed("search_chests")
+def search_chests(data, query):
+    """Search for chests containing the query string."""
+    global search_cache
+    index = get_search_index(data)
+    query_lower = query.lower()
+    if search_cache is None or search_cache["index"] is not index or search_cache["version"] != index["version"]:
+        search_cache = {"index": index, "version": index["version"], "queries": {}}
+    cached = search_cache["queries"]
+
+    if query_lower in cached:
+        entry = cached.pop(query_lower)
+    else:
+        # A query containing an earlier one can only match a subset of its results
+        base = None
+        for previous, previous_entry in cached.items():
+            if previous in query_lower and (base is None or len(previous_entry[1]) < len(base[1])):
+                base = previous_entry
+        if base is None:
+            entry = _evaluate_search(data, index, query_lower, index["chests"], index["items"])
+        else:
+            entry = _evaluate_search(data, index, query_lower, base[1], base[0])
+        if len(cached) >= SEARCH_CACHE_QUERIES:
+            del cached[next(iter(cached))]
+    cached[query_lower] = entry
+    return list(entry[2])
+
+def find_items(data, query):
+    """Return (chest_id, slot, item_name, qty) for every stack whose item name contains query."""
+    conn = _sqlite_queries(data)
+    if conn is not None:
+        return sqlite_search_items(conn, query)
+    query_lower = query.lower()
+    found = []
+    for item_id, locations in get_search_index(data)["items"].items():
+        if query_lower in item_names_lower[item_id]:
+            for chest_id, slots in locations.items():
+                found.extend((chest_id, slot, item_names[item_id], qty) for slot, qty in slots.items())
+    found.sort()
+    return found
+
+def item_total(data, item_name):
+    """Return the total quantity of item_name stored across every chest."""
+    item_id = item_ids.get(item_name)
+    return get_search_index(data)["totals"].get(item_id, 0) if item_id else 0
+
+def item_ledger(data, item_name):
+    """Return (total_qty, [(chest_id, slot, qty)]) for an exact item name.
+
+    The total comes straight from the ledger; locations are in chest and slot order.
+    """
+    item_id = item_ids.get(item_name)
+    index = get_search_index(data)
+    if not item_id or item_id not in index["totals"]:
+        return 0, []
+    locations = [(chest_id, slot, qty) for chest_id, slots in index["items"][item_id].items()
+                 for slot, qty in slots.items()]
+    locations.sort()
+    return index["totals"][item_id], locations
+
+def item_totals(data, limit=None):
+    """Return [(item_name, total_qty, chest_count)] for every stored item, largest total first."""
+    index = get_search_index(data)
+    rows = [(item_names[item_id], total, len(index["items"][item_id]))
+            for item_id, total in index["totals"].items()]
+    rows.sort(key=lambda row: (-row[1], row[0]))
+    return rows[:limit] if limit is not None else rows
+
+# Placement planner: incoming items go to partial stacks first, then empty
+# slots, within the item's category and then the overflow categories. Partial
+# stacks come from the item index and empty slots from the free-slot masks, so
+# planning never walks the slots of every chest.
+STACK_SIZE = 64
+STACK_SIZES = {  # Items that stack to less than STACK_SIZE
+    "Ender Pearl": 16, "Egg": 16, "Snowball": 16, "Bucket": 16, "Honey Bottle": 16,
+    "Oak Sign": 16, "Spruce Sign": 16, "Birch Sign": 16, "Armor Stand": 16, "Banner": 16,
+    "Water Bucket": 1, "Lava Bucket": 1, "Milk Bucket": 1, "Potion": 1, "Splash Potion": 1,
+    "Enchanted Book": 1, "Totem of Undying": 1, "Elytra": 1, "Shield": 1, "Bow": 1,
+    "Crossbow": 1, "Trident": 1, "Saddle": 1, "Mushroom Stew": 1, "Rabbit Stew": 1,
+}
+_TOOL_WORDS = {"sword", "pickaxe", "axe", "shovel", "hoe", "helmet", "chestplate", "legging", "boot"}
+
+def stack_size(item_name):
+    """Return how many of item_name fit in one slot."""
+    size = STACK_SIZES.get(item_name)
+    if size is not None:
+        return size
+    if item_name.lower().startswith("music disc") or not _TOOL_WORDS.isdisjoint(_name_words(item_name)):
+        return 1  # Tools, armour and discs don't stack
+    return STACK_SIZE
+
+def _word_categories(word):
+    """Return {category: score} for one item name word: 2 for the same word, 1 for containing one."""
+    matches = keyword_matches.get(word)
+    if matches is None:
+        matches = {}
+        if not word.isdigit():
+            for keyword, names in category_keywords.items():
+                score = 2 if keyword == word else 1 if len(keyword) >= 4 and keyword in word else 0
+                for category in names if score else ():
+                    matches[category] = max(matches.get(category, 0), score)
+        keyword_matches[word] = matches
+    return matches
+
+def _keyword_categories(item_name):
+    """Return non-overflow categories sharing a word with item_name, best match first."""
+    scores = {}
+    for word in _name_words(item_name):
+        for category, score in _word_categories(word).items():
+            scores[category] = scores.get(category, 0) + score
+    return sorted(scores, key=lambda category: -scores[category])
+
+def _target_categories(index, item_id, item_name):
+    """Return the categories an item belongs in: where most of it is kept, else by name."""
+    kept = {}
+    for chest_id, slots in index["items"].get(item_id, {}).items():
+        category = chest_categories.get(chest_id)
+        if category is not None and category not in overflow_categories:
+            kept[category] = kept.get(category, 0) + sum(slots.values())
+    if kept:
+        return sorted(kept, key=lambda category: -kept[category])
+    return _keyword_categories(item_name)
+
+def _spill_categories(targets):
+    """Return the overflow categories, those on the target categories' walls first."""
+    target_walls = {chest_walls[category_chests[category][0]] for category in targets}
+    return sorted(overflow_categories, key=lambda category: overflow_categories[category] not in target_walls)
+
+def plan_placements(data, incoming):
+    """Plan where incoming items go without changing data.
+
+    incoming is a list of (item_name, qty) or (item_name, qty, category); an
+    item without a category goes where most of it is already kept, else to the
+    categories its name matches. Each item tops up its partial stacks, then
+    fills empty slots (chests already holding it first), in its categories and
+    then the overflow categories. Returns (placements, unplaced):
+    [(chest_id, slot, item_name, added, new_qty)] and [(item_name, qty)] that
+    found no room. An unknown category raises ValueError.
+    """
+    index = get_search_index(data)
+    category_lookup = {category.lower(): category for category in category_chests}
+    wanted = {}
+    for entry in incoming:
+        item_name, qty = entry[0], entry[1]
+        category = entry[2] if len(entry) > 2 else None
+        if category:
+            if category.lower() not in category_lookup:
+                raise ValueError(f"Unknown category '{category}'")
+            category = category_lookup[category.lower()]
+        key = (item_name, category or None)
+        wanted[key] = wanted.get(key, 0) + qty
+
+    free = {}     # chest ID -> free-slot mask once this plan's stacks are placed
+    held = {}     # item name -> {chest ID: {slot: qty}}, its stacks once this plan's are placed
+    cursors = {}  # category -> first chest in it that may still have a free slot
+    placements = []
+    unplaced = []
+    for (item_name, category), qty in wanted.items():
+        item_id = item_ids.get(item_name, 0)
+        limit = stack_size(item_name)
+        targets = [category] if category else _target_categories(index, item_id, item_name)
+        locations = held.get(item_name)
+        if locations is None:
+            locations = held[item_name] = {chest_id: dict(slots) for chest_id, slots
+                                           in index["items"].get(item_id, {}).items()}
+        for group in (targets, None):
+            if qty <= 0:
+                break
+            if group is None:
+                group = _spill_categories(targets)
+            group_set = set(group)
+            own_chests = sorted(chest_id for chest_id in locations
+                                if chest_categories.get(chest_id) in group_set)
+            # Partial stacks of the item first, including those earlier entries planned
+            partial = sorted((chest_id, slot, current) for chest_id in own_chests
+                             for slot, current in locations[chest_id].items() if current < limit)
+            for chest_id, slot, current in partial:
+                if qty <= 0:
+                    break
+                added = min(limit - current, qty)
+                placements.append((chest_id, slot, item_name, added, current + added))
+                locations[chest_id][slot] = current + added
+                qty -= added
+            # Then empty slots, next to the item where possible
+            for chest_id in own_chests:
+                if qty > 0:
+                    qty = _fill_free_slots(index, free, chest_id, item_name, qty, limit, placements, locations)
+            for name in group:
+                group_chests = category_chests[name]
+                pos = cursors.get(name, 0)
+                # Chests before the cursor are full, so each plan walks a category once
+                while pos < len(group_chests) and qty > 0:
+                    qty = _fill_free_slots(index, free, group_chests[pos], item_name, qty, limit, placements,
+                                           locations)
+                    if qty > 0:
+                        pos += 1
+                cursors[name] = pos
+        if qty > 0:
+            unplaced.append((item_name, qty))
+    return placements, unplaced
+
+def _fill_free_slots(index, free, chest_id, item_name, qty, limit, placements, locations):
+    """Put new stacks in a chest's empty slots, lowest first; return what is left over.
+
+    The new stacks are added to locations (chest ID -> {slot: qty} of the item).
+    """
+    mask = free.get(chest_id)
+    if mask is None:
+        mask = index["free"].get(chest_id, 0)
+    while mask and qty > 0:
+        bit = mask & -mask
+        mask ^= bit
+        added = min(limit, qty)
+        placements.append((chest_id, bit.bit_length() - 1, item_name, added, added))
+        locations.setdefault(chest_id, {})[bit.bit_length() - 1] = added
+        qty -= added
+    free[chest_id] = mask
+    return qty
+
+def parse_incoming(lines):
+    """Parse "Item Name, qty[, category]" lines for plan_placements.
+
+    Blank lines and lines starting with '#' are skipped. Returns (incoming,
+    errors) where errors is a list of (line_no, message).
+    """
+    incoming = []
+    errors = []
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = [part.strip() for part in line.split(',', 2)]
+        if len(parts) < 2 or not parts[0]:
+            errors.append((line_no, "Use: Item Name, qty[, category]"))
+            continue
+        try:
+            qty = int(parts[1])
+            if qty < 1:
+                raise ValueError
+        except ValueError:
+            errors.append((line_no, f"Invalid quantity '{parts[1]}'"))
+            continue
+        incoming.append((parts[0], qty) + tuple(parts[2:]))
+    return incoming, errors
+
+@timed("apply_placements")
+def apply_placements(data, placements):
+    """Apply planned placements as one saved change group and return how many slots changed."""
+    for chest_id, slot, item_name, added, new_qty in placements:
+        set_slot(data, chest_id, slot, item_name, new_qty)
+    save_data(data)
+    return len(placements)
+
+# Consolidation: each item's stacks are grouped through the item index and
+# packed into as few full stacks as possible inside its home category, the
+# stacks kept being those in the busiest chests so that sparse chests empty out.
+def _slots_used(index, free, chest_id):
+    mask = free.get(chest_id, index["free"].get(chest_id, 0))
+    return SLOTS_PER_CHEST - bin(mask).count("1")
+
+def _take_free_slot(index, free, chest_ids):
+    """Claim the lowest free slot in the first of chest_ids with room, or return None."""
+    for chest_id in chest_ids:
+        mask = free.get(chest_id, index["free"].get(chest_id, 0))
+        if mask:
+            bit = mask & -mask
+            free[chest_id] = mask ^ bit
+            return chest_id, bit.bit_length() - 1
+    return None
+
+def _pack_stacks(index, free, sources, dests, item_name, limit, home_chests, moves):
+    """Move sources into dests until each is full, claiming free home slots when dests run out.
+
+    Stacks are [chest_id, slot, qty] lists and are updated as moves are planned.
+    Returns the sources that still hold something.
+    """
+    pos = 0
+    left = []
+    for source in sources:
+        while source[2] > 0:
+            while pos < len(dests) and dests[pos][2] >= limit:
+                pos += 1
+            if pos == len(dests):
+                claimed = _take_free_slot(index, free, home_chests)
+                if claimed is None:
+                    break
+                dests.append([claimed[0], claimed[1], 0])
+            dest = dests[pos]
+            qty = min(limit - dest[2], source[2])
+            moves.append((source[0], source[1], dest[0], dest[1], item_name, qty))
+            dest[2] += qty
+            source[2] -= qty
+        if source[2] > 0:
+            left.append(source)
+        else:
+            free[source[0]] = free.get(source[0], index["free"].get(source[0], 0)) | (1 << source[1])
+    return left
+
+def plan_consolidation(data):
+    """Plan moves that merge partial stacks and bring items back into their category.
+
+    An item's home is the category holding most of it (else the one its name
+    matches). Its stacks elsewhere are moved home and its stacks at home are
+    merged into as few full stacks as the total needs, keeping those in the
+    fullest chests. Stacks that find no room at home are merged where they are.
+    Returns (moves, emptied): [(from_chest, from_slot, to_chest, to_slot,
+    item_name, qty)] in the order to apply them, and the chests left empty.
+    """
+    index = get_search_index(data)
+    free = {}  # chest ID -> free-slot mask once the planned moves are done
+    moves = []
+    for item_id, locations in sorted(index["items"].items(), key=lambda entry: item_names[entry[0]]):
+        item_name = item_names[item_id]
+        limit = stack_size(item_name)
+        targets = _target_categories(index, item_id, item_name)
+        home = targets[0] if targets else None
+        keep = []
+        stray = []
+        for chest_id, slots in locations.items():
+            at_home = home is None or chest_categories.get(chest_id) == home
+            for slot, qty in slots.items():
+                if qty:
+                    (keep if at_home else stray).append([chest_id, slot, qty])
+        if not stray and len(keep) < 2:
+            continue
+        used = {chest_id: _slots_used(index, free, chest_id) for chest_id in locations}
+        # Full stacks stay; of the rest, the largest in the fullest chests are topped up
+        keep.sort(key=lambda stack: (stack[2] >= limit, used[stack[0]], stack[2]), reverse=True)
+        needed = -(-sum(stack[2] for stack in keep + stray) // limit)
+        dests, extra = keep[:needed], keep[needed:]
+        home_chests = []
+        if home is not None:
+            home_chests = sorted({stack[0] for stack in keep}, key=lambda chest_id: -used[chest_id])
+            home_chests += category_chests[home]
+        stray.sort(key=lambda stack: (used[stack[0]], stack[2]))
+        extra.reverse()
+        left = _pack_stacks(index, free, stray + extra, dests, item_name, limit, home_chests, moves)
+        if len(left) > 1:
+            # No room at home: merge what is left in place
+            left.sort(key=lambda stack: (stack[2] >= limit, used[stack[0]], stack[2]), reverse=True)
+            needed = -(-sum(stack[2] for stack in left) // limit)
+            sources = left[needed:]
+            sources.reverse()
+            _pack_stacks(index, free, sources, left[:needed], item_name, limit, (), moves)
+    emptied = sorted(chest_id for chest_id, mask in free.items()
+                     if mask == ALL_SLOTS_FREE and index["free"].get(chest_id) != ALL_SLOTS_FREE)
+    return moves, emptied
+
+@timed("apply_moves")
+def apply_moves(data, moves):
+    """Carry out planned moves as one saved change group and return how many were made.
+
+    Every move is checked against data first; if any no longer fits (the
+    source is short or the destination holds another item) ValueError is
+    raised and nothing changes.
+    """
+    stacks = {}  # (chest ID, slot) -> (item ID, qty) as the earlier moves leave them
+    def stack_at(chest_id, slot):
+        if (chest_id, slot) not in stacks:
+            chest = data.get(chest_id)
+            if chest is None or chest.label is not None or not chest.items[slot]:
+                stacks[(chest_id, slot)] = (0, 0)
+            else:
+                stacks[(chest_id, slot)] = (chest.items[slot], chest.qtys[slot])
+        return stacks[(chest_id, slot)]
+    for from_chest, from_slot, to_chest, to_slot, item_name, qty in moves:
+        item_id = item_ids.get(item_name, 0)
+        source_id, source_qty = stack_at(from_chest, from_slot)
+        dest_id, dest_qty = stack_at(to_chest, to_slot)
+        if source_id != item_id or source_qty < qty:
+            raise ValueError(f"{from_chest} slot {from_slot} no longer holds {item_name} x{qty}")
+        if dest_id not in (0, item_id):
+            raise ValueError(f"{to_chest} slot {to_slot} now holds {item_names[dest_id]}")
+        if to_chest in data and data[to_chest].label is not None and data[to_chest].label.strip():
+            raise ValueError(f"{to_chest} has a label; clear it before moving items in")
+        stacks[(from_chest, from_slot)] = (item_id, source_qty - qty) if source_qty > qty else (0, 0)
+        stacks[(to_chest, to_slot)] = (item_id, dest_qty + qty)
+
+    for (chest_id, slot), (item_id, qty) in stacks.items():
+        if item_id:
+            chest = data.get(chest_id)
+            if chest is None or chest.label is not None or chest.items[slot] != item_id or chest.qtys[slot] != qty:
+                set_slot(data, chest_id, slot, item_names[item_id], qty)
+        else:
+            clear_slot(data, chest_id, slot)
+    save_data(data)
+    return len(moves)
+
+# Materials check: a bill of materials is expanded through the recipes file
+# and resolved against the item index in one pass, then turned into a pick
+# list that visits as few chests as it can, wall by wall.
+RECIPES_FILE = "recipes.json"  # {"Oak Planks": {"makes": 4, "from": {"Oak Log": 1}}, ...}
+
+def read_recipes(path=RECIPES_FILE):
+    """Read a recipes file into {item_name: (makes, {ingredient: qty})}."""
+    with open(path, 'r') as f:
+        raw = json.load(f)
+    if not isinstance(raw, dict):
+        raise ValueError(f"Invalid recipes file {path}: expected an object of item names")
+    recipes = {}
+    problems = []
+    for item_name, recipe in raw.items():
+        makes = recipe.get("makes", 1) if isinstance(recipe, dict) else None
+        ingredients = recipe.get("from") if isinstance(recipe, dict) else None
+        if not isinstance(makes, int) or makes < 1:
+            problems.append(f"{item_name}: \"makes\" must be a positive integer")
+        elif (not isinstance(ingredients, dict) or not ingredients
+              or not all(isinstance(qty, int) and qty > 0 for qty in ingredients.values())):
+            problems.append(f"{item_name}: \"from\" must map ingredients to positive quantities")
+        else:
+            recipes[item_name] = (makes, dict(ingredients))
+    if problems:
+        raise ValueError(f"Invalid recipes file {path}:\n  " + "\n  ".join(problems))
+    return recipes
+
+def _chest_walk_key(chest_id):
+    """Sort key putting chests in the order a walk along the walls reaches them."""
+    wall = chest_walls.get(chest_id)
+    return (wall_positions[wall] if wall is not None else len(wall_order), len(chest_id), chest_id)
+
+def check_materials(data, materials, recipes=None):
+    """Resolve a bill of materials against the stored items.
+
+    materials is a list of (item_name, qty); names match stored items exactly
+    or else ignoring case. Items short in storage are crafted from recipes
+    (item_name -> (makes, {ingredient: qty})) where one exists, using stock of
+    intermediate items first. Returns (picks, crafts, shortfalls):
+    [(chest_id, slot, item_name, qty)] to take, ordered wall by wall,
+    [(item_name, times)] to craft, and [(item_name, missing)].
+    A recipe that needs its own output raises ValueError.
+    """
+    index = get_search_index(data)
+    recipes = recipes or {}
+    folded = None
+    demand = {}
+    for entry in materials:
+        item_name, qty = entry[0], entry[1]
+        if item_name not in item_ids and item_name not in recipes:
+            if folded is None:
+                folded = {name.lower(): name for name in list(recipes) + item_names[1:] if name}
+            item_name = folded.get(item_name.lower(), item_name)
+        demand[item_name] = demand.get(item_name, 0) + qty
+
+    # Order the items so every recipe comes before its ingredients
+    order = []
+    state = {}  # item -> 1 while its ingredients are being visited, 2 once done
+    for root in demand:
+        stack = [(root, False)]
+        while stack:
+            item_name, done = stack.pop()
+            if done:
+                state[item_name] = 2
+                order.append(item_name)
+                continue
+            if state.get(item_name) == 2:
+                continue
+            if state.get(item_name) == 1:
+                raise ValueError(f"Recipe loop through {item_name}")
+            state[item_name] = 1
+            stack.append((item_name, True))
+            for ingredient in recipes.get(item_name, (0, {}))[1]:
+                if state.get(ingredient) != 2:
+                    stack.append((ingredient, False))
+    order.reverse()
+
+    take = {}  # item ID -> qty to pick
+    crafts = []
+    shortfalls = []
+    for item_name in order:
+        need = demand.get(item_name, 0)
+        if not need:
+            continue
+        item_id = item_ids.get(item_name, 0)
+        taken = min(need, index["totals"].get(item_id, 0))
+        if taken:
+            take[item_id] = taken
+        short = need - taken
+        if short and item_name in recipes:
+            makes, ingredients = recipes[item_name]
+            times = -(-short // makes)
+            crafts.append((item_name, times))
+            for ingredient, qty in ingredients.items():
+                demand[ingredient] = demand.get(ingredient, 0) + times * qty
+        elif short:
+            shortfalls.append((item_name, short))
+
+    # Greedy set cover over the chests holding what is needed: take the chest
+    # covering the largest share of the remaining needs, rescoring lazily
+    # since a chest's score only drops as other chests are picked
+    remaining = dict(take)
+    chest_items = {}  # chest ID -> {item ID: slots}
+    for item_id in take:
+        for chest_id, slots in index["items"][item_id].items():
+            chest_items.setdefault(chest_id, {})[item_id] = slots
+
+    def score(chest_id):
+        return sum(min(remaining[item_id], sum(slots.values())) / take[item_id]
+                   for item_id, slots in chest_items[chest_id].items() if remaining[item_id])
+
+    heap = [(-score(chest_id), _chest_walk_key(chest_id), chest_id) for chest_id in chest_items]
+    heapq.heapify(heap)
+    picks = []
+    left = sum(remaining.values())
+    while left and heap:
+        _, key, chest_id = heapq.heappop(heap)
+        current = score(chest_id)
+        if heap and current < -heap[0][0] - 1e-9:
+            if current > 0:
+                heapq.heappush(heap, (-current, key, chest_id))
+            continue
+        for item_id, slots in chest_items[chest_id].items():
+            # Largest stacks first, so as few slots as possible are emptied
+            for slot, qty in sorted(slots.items(), key=lambda entry: (-entry[1], entry[0])):
+                if not remaining[item_id]:
+                    break
+                qty = min(qty, remaining[item_id])
+                picks.append((chest_id, slot, item_names[item_id], qty))
+                remaining[item_id] -= qty
+                left -= qty
+    picks.sort(key=lambda pick: (_chest_walk_key(pick[0]), pick[1]))
+    return picks, crafts, shortfalls
+
+# Streaming export: export_rows() yields one row per filled slot and the
+# writers consume it row by row, so memory stays flat however large the
+# storage is. The columnar format stores each chunk of rows column by column,
+# strings dictionary-encoded and every column zlib-compressed:
+#   b"MCSTCOL1", then per chunk: row count (u32, 0 ends the file), the count of
+#   strings new to the dictionary (u32) and each as u16 length + UTF-8, then the
+#   wall, chest, category, slot, item and qty columns as u32 byte length +
+#   zlib data (slot u8, the rest u32, little-endian; strings as dictionary indexes)
+EXPORT_FIELDS = ("wall", "chest", "category", "slot", "item", "qty")
+EXPORT_FORMATS = ("csv", "jsonl", "columnar")
+EXPORT_CHUNK_ROWS = 65536  # Rows per columnar chunk, which bounds the writer's memory
+_COLUMNAR_MAGIC = b"MCSTCOL1"
+_COLUMN_TYPES = ("I", "I", "I", "B", "I", "I")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+
+def export_rows(data, walls=None, category=None, item=None):
+    """Yield (wall, chest_id, category, slot, item_name, qty) for every filled slot.
+
+    Chests come in navigation order, then any chests outside the layout (with
+    wall ""). walls limits the export to those walls, category to one category
+    (ignoring case) and item to items whose name contains it (ignoring case).
+    Old label chests have no slots and are left out. Unknown walls or
+    categories raise ValueError straight away, before any row is produced.
+    """
+    if category is not None:
+        matches = [name for name in category_chests if name.lower() == category.lower()]
+        if not matches:
+            raise ValueError(f"Unknown category '{category}'")
+        chest_list = category_chests[matches[0]]
+    if walls is not None:
+        walls = {wall.upper() for wall in walls}
+        unknown = walls.difference(chests)
+        if unknown:
+            raise ValueError(f"Unknown wall(s): {', '.join(sorted(unknown))}")
+    if category is None:
+        # Only the walls asked for, so sharded data reads just their shards
+        chest_list = [chest_id for wall in wall_order if walls is None or wall in walls for chest_id in chests[wall]]
+        if walls is None:
+            chest_list += sorted(chest_id for chest_id in data if chest_id not in chest_walls)
+    matched_ids = None
+    if item is not None:
+        item_lower = item.lower()
+        matched_ids = {item_id for item_id in get_search_index(data)["items"]
+                       if item_lower in item_names_lower[item_id]}
+    return _slot_rows(data, chest_list, walls, matched_ids)
+
+def _slot_rows(data, chest_list, walls, matched_ids):
+    for chest_id in chest_list:
+        wall = chest_walls.get(chest_id, "")
+        chest = data.get(chest_id)
+        if chest is None or chest.label is not None or (walls is not None and wall not in walls):
+            continue
+        chest_category = chest_categories.get(chest_id, "")
+        for slot, item_id in enumerate(chest.items):
+            if item_id and (matched_ids is None or item_id in matched_ids):
+                yield wall, chest_id, chest_category, slot, item_names[item_id], chest.qtys[slot]
+
+def write_csv(rows, f):
+    """Write export rows to a text file as CSV with a header line; return the row count."""
+    import csv
+    writer = csv.writer(f)
+    writer.writerow(EXPORT_FIELDS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+def write_jsonl(rows, f):
+    """Write export rows to a text file as one JSON object per line; return the row count."""
+    count = 0
+    for row in rows:
+        f.write(json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+def _write_column_chunk(f, columns, new_strings):
+    import zlib
+    f.write(_U32.pack(len(columns[3])))
+    f.write(_U32.pack(len(new_strings)))
+    for string in new_strings:
+        encoded = string.encode("utf-8")
+        f.write(_U16.pack(len(encoded)) + encoded)
+    for column in columns:
+        if sys.byteorder == "big":
+            column.byteswap()
+        block = zlib.compress(column.tobytes(), 6)
+        f.write(_U32.pack(len(block)) + block)
+
+def write_columnar(rows, f):
+    """Write export rows to a binary file in the chunked columnar format; return the row count."""
+    f.write(_COLUMNAR_MAGIC)
+    strings = {}  # string -> dictionary index
+    new_strings = []
+    columns = [array(code) for code in _COLUMN_TYPES]
+    count = 0
+    for row in rows:
+        for column, value in zip(columns, row):
+            if isinstance(value, str):
+                index = strings.get(value)
+                if index is None:
+                    index = strings[value] = len(strings)
+                    new_strings.append(value)
+                value = index
+            column.append(value)
+        count += 1
+        if len(columns[3]) == EXPORT_CHUNK_ROWS:
+            _write_column_chunk(f, columns, new_strings)
+            new_strings = []
+            columns = [array(code) for code in _COLUMN_TYPES]
+    if len(columns[3]):
+        _write_column_chunk(f, columns, new_strings)
+    f.write(_U32.pack(0))
+    return count
+
+def _read_exact(f, size):
+    buf = f.read(size)
+    if len(buf) != size:
+        raise ValueError("Columnar export is truncated")
+    return buf
 
-def load_data():
-    if os.path.exists(SAVE_FILE):
-        with open(SAVE_FILE, 'r') as f:
-            return json.load(f)
-    return {cid: "" for wall in chests.values() for cid in wall}
+def read_columnar(f):
+    """Yield the rows of a columnar export, one chunk in memory at a time."""
+    import zlib
+    if f.read(len(_COLUMNAR_MAGIC)) != _COLUMNAR_MAGIC:
+        raise ValueError("Not a columnar storage export")
+    strings = []
+    while True:
+        (count,) = _U32.unpack(_read_exact(f, 4))
+        if not count:
+            return
+        (new,) = _U32.unpack(_read_exact(f, 4))
+        for _ in range(new):
+            (length,) = _U16.unpack(_read_exact(f, 2))
+            strings.append(_read_exact(f, length).decode("utf-8"))
+        columns = []
+        for code in _COLUMN_TYPES:
+            (length,) = _U32.unpack(_read_exact(f, 4))
+            column = array(code, zlib.decompress(_read_exact(f, length)))
+            if sys.byteorder == "big":
+                column.byteswap()
+            if len(column) != count:
+                raise ValueError("Columnar export has a damaged chunk")
+            columns.append(column)
+        for wall, chest_id, category, slot, item_id, qty in zip(*columns):
+            yield strings[wall], strings[chest_id], strings[category], slot, strings[item_id], qty
 
-def save_data(data):
-    with open(SAVE_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+EXPORT_WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "columnar": write_columnar}
 
-def get_category_for_chest(chest_id):
-    """Get the category description for a given chest ID."""
-    wall = chest_id[0]
-    if wall not in categories:
-        return "Unknown"
-    
-    for range_str, category in categories[wall]:
-        # Parse range (e.g., "A01–A05" or "A26")
-        if "–" in range_str:
-            start, end = range_str.split("–")
-            start_num = int(start[1:])
-            end_num = int(end[1:])
-            chest_num = int(chest_id[1:])
-            if start_num <= chest_num <= end_num:
-                return category
+@timed("export_data")
+def export_data(data, path, fmt, walls=None, category=None, item=None):
+    """Stream the filtered slots of data to path ('-' for stdout) in fmt; return the row count."""
+    rows = export_rows(data, walls, category, item)
+    writer = EXPORT_WRITERS[fmt]
+    binary = fmt == "columnar"
+    if path == "-":
+        return writer(rows, sys.stdout.buffer if binary else sys.stdout)
+    # Write a temporary file first so a failed export never leaves half a file
+    temp_path = path + ".tmp"
+    try:
+        if binary:
+            f = open(temp_path, 'wb')
         else:
-            if range_str == chest_id:
-                return category
-    return "Unknown"
+            f = open(temp_path, 'w', newline='', encoding='utf-8')
+        with f:
+            count = writer(rows, f)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return count
 
-def search_chests(data, query):
-    """Search for chests containing the query string."""
+# Fuzzy search: item names are split into words and indexed by padded
+# trigrams, so typos and abbreviations ("irn ingt", "oak lg") still match.
+FUZZY_MIN_SIMILARITY = 0.4  # Lowest trigram similarity counted as a typo match
+item_tokens = [None]  # item ID -> [(word, trigrams)], parallel to item_names
+item_trigrams = {}    # trigram -> item IDs whose name has a word containing it
+
+def _trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _update_item_trigrams():
+    """Index the words of item names interned since the last fuzzy search."""
+    for item_id in range(len(item_tokens), len(item_names)):
+        tokens = [(word, _trigrams(word)) for word in item_names_lower[item_id].split()]
+        item_tokens.append(tokens)
+        for _, grams in tokens:
+            for gram in grams:
+                item_trigrams.setdefault(gram, set()).add(item_id)
+
+def _is_subsequence(word, token):
+    chars = iter(token)
+    return all(ch in chars for ch in word)
+
+def _word_score(word, word_grams, tokens):
+    """Score (0-1) how well one query word matches the best word of a name."""
+    best = 0.0
+    for token, token_grams in tokens:
+        if token == word:
+            return 1.0
+        if token.startswith(word):
+            score = 0.9
+        elif word in token:
+            score = 0.8
+        elif token[0] == word[0] and _is_subsequence(word, token):
+            score = 0.6 + 0.2 * len(word) / len(token)
+        else:
+            similarity = 2 * len(word_grams & token_grams) / (len(word_grams) + len(token_grams))
+            score = 0.7 * similarity if similarity >= FUZZY_MIN_SIMILARITY else 0.0
+        best = max(best, score)
+    return best
+
+def _fuzzy_score(query_lower, words, tokens, name_lower):
+    """Score a name (or label) against a whole query; 0 means no match."""
+    if name_lower == query_lower:
+        return 1.0
+    total = 0.0
+    for word, word_grams in words:
+        score = _word_score(word, word_grams, tokens)
+        if not score:
+            return 0.0
+        total += score
+    score = total / len(words)
+    if query_lower in name_lower:
+        score = max(score, 0.95)
+    return score
+
+def rank_items(data, query):
+    """Return {item_id: score} for stored items that fuzzily match query."""
+    index = get_search_index(data)
+    query_lower = " ".join(query.lower().split())
+    words = [(word, _trigrams(word)) for word in query_lower.split()]
+    if not words:
+        return {}
+    _update_item_trigrams()
+    live = index["items"]
+
+    # Candidates must share a trigram with every word (short words fall back
+    # to a substring check over the distinct item names)
+    candidates = None
+    for word, word_grams in words:
+        if len(word) < 3:
+            matches = {item_id for item_id in live if word in item_names_lower[item_id]
+                       or any(token[0] == word[0] for token, _ in item_tokens[item_id])}
+        else:
+            matches = set()
+            for gram in word_grams:
+                matches.update(item_trigrams.get(gram, ()))
+        candidates = matches if candidates is None else candidates & matches
+    scores = {}
+    for item_id in candidates:
+        if item_id in live:
+            score = _fuzzy_score(query_lower, words, item_tokens[item_id], item_names_lower[item_id])
+            if score:
+                scores[item_id] = score
+    return scores
+
+def fuzzy_find_items(data, query, limit=None):
+    """Return [(item_name, score, total_qty)] for items matching query, best first."""
+    totals = get_search_index(data)["totals"]
+    found = []
+    for item_id, score in rank_items(data, query).items():
+        found.append((item_names[item_id], score, totals[item_id]))
+    found.sort(key=lambda entry: (-entry[1], -entry[2], entry[0]))
+    return found[:limit] if limit is not None else found
+
+@timed("fuzzy_search")
+def fuzzy_search(data, query, limit=None):
+    """Rank chests by how well their items (or old labels) match a fuzzy query.
+
+    Chests are ordered by their best item score, then by the quantity of the
+    matching items. Returns [(chest_id, label)] like search_chests; labels are
+    only built for the chests returned.
+    """
+    index = get_search_index(data)
+    scores = rank_items(data, query)
+    best = {}
+    quantity = {}
+    for item_id, score in scores.items():
+        for chest_id, slots in index["items"][item_id].items():
+            if best.get(chest_id, 0.0) < score:
+                best[chest_id] = score
+            quantity[chest_id] = quantity.get(chest_id, 0) + sum(slots.values())
+
+    query_lower = " ".join(query.lower().split())
+    words = [(word, _trigrams(word)) for word in query_lower.split()]
+    if words:
+        for chest_id, label_lower in index["labels"].items():
+            if not label_lower:
+                continue
+            tokens = [(word, _trigrams(word)) for word in label_lower.split()]
+            score = _fuzzy_score(query_lower, words, tokens, label_lower) if tokens else 0.0
+            if score:
+                best[chest_id] = score
+                quantity[chest_id] = 0
+
+    rank_key = lambda chest_id: (-best[chest_id], -quantity[chest_id], chest_id)
+    if limit is None:
+        ranked = sorted(best, key=rank_key)
+    else:
+        ranked = heapq.nsmallest(limit, best, key=rank_key)
     results = []
-    query_lower = query.lower()
-    for chest_id, chest_data in data.items():
-        # Handle different data formats
-        if isinstance(chest_data, str):
-            # Old string format
-            if query_lower in chest_data.lower() or query_lower in chest_id.lower():
-                results.append((chest_id, chest_data))
-        elif isinstance(chest_data, dict):
-            # New slot format - search through item names
-            found_items = []
-            for value in chest_data.values():
-                if isinstance(value, list) and len(value) >= 2:
-                    item_name = value[0]
-                    if item_name and query_lower in item_name.lower():
-                        found_items.append(item_name)
-                elif isinstance(value, tuple) and len(value) >= 2:
-                    item_name = value[0]
-                    if item_name and query_lower in item_name.lower():
-                        found_items.append(item_name)
-            
-            # If we found matching items or chest ID matches, add to results
-            if found_items or query_lower in chest_id.lower():
-                if found_items:
-                    # Show first few matching items
-                    item_summary = ", ".join(found_items[:3])
-                    if len(found_items) > 3:
-                        item_summary += f" (+{len(found_items)-3} more)"
-                    results.append((chest_id, item_summary))
-                else:
-                    # Just chest ID matched
-                    total_quantity = sum(v[1] for v in chest_data.values() if isinstance(v, (list, tuple)) and len(v) >= 2)
-                    results.append((chest_id, f"{total_quantity} items"))
-    return sorted(results)
+    for chest_id in ranked:
+        chest = data[chest_id]
+        if chest.label is not None:
+            results.append((chest_id, chest.label))
+            continue
+        # Matching items in this chest, best match first
+        matched = {}
+        for item_id, qty in zip(chest.items, chest.qtys):
+            if item_id in scores:
+                matched[item_id] = matched.get(item_id, 0) + qty
+        items = sorted(matched.items(), key=lambda item: (-scores[item[0]], -item[1], item_names[item[0]]))
+        item_summary = ", ".join(f"{item_names[item_id]} x{qty}" for item_id, qty in items[:3])
+        if len(items) > 3:
+            item_summary += f" (+{len(items)-3} more)"
+        results.append((chest_id, item_summary))
+    return results
+
+def parse_command_line(command):
+    """Parse a command line without touching any data.
+
+    Returns ("UPD", chest_id, slot, item_name, qty) or ("REM", chest_id, slot),
+    or an error message string if the command is invalid.
+    """
+    command = command.strip()
+    if not command:
+        return "Empty command"
+        
+    # Split by colon
+    parts = command.split(':')
+    
+    if len(parts) < 4:
+        return "Invalid command format. Use: UPD:WALL:CHEST:SLOT:(Item,Qty) or REM:WALL:CHEST:SLOT"
+    
+    cmd_type = parts[0].upper()
+    wall = parts[1].upper()
+    chest_num = parts[2].zfill(2)  # Pad with zero if needed
+    slot_str = parts[3]
+    
+    # Validate wall
+    if wall not in chests:
+        return f"Invalid wall '{wall}'. Use {_join_choices(wall_order)}"
+    
+    # Validate chest number (chests are numbered from 1 along each wall)
+    wall_chests = chests[wall]
+    try:
+        chest_int = int(chest_num)
+        if chest_int < 1 or chest_int > len(wall_chests):
+            return (f"Invalid chest number for wall {wall}. "
+                    f"Use {wall_chests[0][len(wall):]}-{wall_chests[-1][len(wall):]}")
+    except ValueError:
+        return f"Invalid chest number '{chest_num}'"
+    
+    chest_id = wall_chests[chest_int - 1]
+    
+    # Validate slot
+    try:
+        slot = int(slot_str)
+        if slot < 0 or slot > 53:
+            return "Invalid slot number. Use 0-53"
+    except ValueError:
+        return f"Invalid slot number '{slot_str}'"
+    
+    # Handle command types
+    if cmd_type in ['UPD', '~']:
+        # Update command - need item data
+        if len(parts) < 5:
+            return "Update command needs item data: UPD:WALL:CHEST:SLOT:(ItemName,Qty)"
+        
+        item_data = ':'.join(parts[4:])  # Join remaining parts
+        
+        # Parse item data: (ItemName, Qty)
+        if not item_data.startswith('(') or not item_data.endswith(')'):
+            return "Item data must be in format: (ItemName, Qty)"
+        
+        item_content = item_data[1:-1]  # Remove parentheses
+        item_parts = [p.strip() for p in item_content.split(',')]
+        
+        if len(item_parts) != 2:
+            return "Item data must be: (ItemName, Qty)"
+        
+        item_name = item_parts[0].strip()
+        try:
+            qty = int(item_parts[1].strip())
+            if qty < 1:
+                return "Quantity must be positive"
+        except ValueError:
+            return f"Invalid quantity '{item_parts[1]}'"
+        
+        return ("UPD", chest_id, slot, item_name, qty)
+        
+    elif cmd_type in ['REM', '-']:
+        return ("REM", chest_id, slot)
+    
+    else:
+        return f"Unknown command '{cmd_type}'. Use UPD/~ for update or REM/- for remove"
 
+@timed("parse_command")
 def parse_command(command, data):
     """Parse and execute commands for quick chest updates.
     
@@ -187,105 +3151,656 @@ def parse_command(command, data):
     -:B:01:5
     """
     try:
-        command = command.strip()
-        if not command:
-            return "Empty command"
-            
-        # Split by colon
-        parts = command.split(':')
+        operation = parse_command_line(command)
+        if isinstance(operation, str):
+            return operation
         
-        if len(parts) < 4:
-            return "Invalid command format. Use: UPD:WALL:CHEST:SLOT:(Item,Qty) or REM:WALL:CHEST:SLOT"
+        if operation[0] == "UPD":
+            _, chest_id, slot, item_name, qty = operation
+            # Add/update the item (old label chests become slot chests)
+            set_slot(data, chest_id, slot, item_name, qty)
+            
+            return f"Updated {chest_id} slot {slot}: {item_name} x{qty}"
         
-        cmd_type = parts[0].upper()
-        wall = parts[1].upper()
-        chest_num = parts[2].zfill(2)  # Pad with zero if needed
-        slot_str = parts[3]
+        # Remove command
+        _, chest_id, slot = operation
+        chest = data.get(chest_id)
+        if chest is None or chest.label is not None:
+            return f"Chest {chest_id} has no items to remove"
         
-        # Validate wall
-        if wall not in ['A', 'B', 'C', 'D']:
-            return f"Invalid wall '{wall}'. Use A, B, C, or D"
+        if not chest.items[slot]:
+            return f"Slot {slot} in {chest_id} is already empty"
         
-        # Validate chest number
+        # Remove the item
+        item_name, qty = clear_slot(data, chest_id, slot)
+        return f"Removed from {chest_id} slot {slot}: {item_name} x{qty}"
+            
+    except Exception as e:
+        return f"Command error: {str(e)}"
+
+@timed("run_batch")
+def run_batch(lines, data):
+    """Validate a stream of command lines and apply them as one transaction.
+    
+    Blank lines and lines starting with '#' are skipped. Every line is checked
+    (REM lines against the state the earlier lines leave behind) before anything
+    is applied; if any line fails nothing changes. On success data is saved once.
+    Returns (applied_count, errors) where errors is a list of (line_no, message);
+    a storage server rejecting the save is reported with line_no None.
+    """
+    operations = []
+    errors = []
+    # Simulated state for REM checks: chest ID -> is slot chest, (chest ID, slot) -> filled
+    chest_is_slots = {}
+    slot_filled = {}
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        operation = parse_command_line(line)
+        if isinstance(operation, str):
+            errors.append((line_no, operation))
+            continue
+        chest_id, slot = operation[1], operation[2]
+        if operation[0] == "UPD":
+            chest_is_slots[chest_id] = True
+            slot_filled[(chest_id, slot)] = True
+        else:
+            if chest_id not in chest_is_slots:
+                chest_is_slots[chest_id] = chest_id in data and data[chest_id].label is None
+            if not chest_is_slots[chest_id]:
+                errors.append((line_no, f"Chest {chest_id} has no items to remove"))
+                continue
+            if (chest_id, slot) not in slot_filled:
+                slot_filled[(chest_id, slot)] = data[chest_id].items[slot] != 0
+            if not slot_filled[(chest_id, slot)]:
+                errors.append((line_no, f"Slot {slot} in {chest_id} is already empty"))
+                continue
+            slot_filled[(chest_id, slot)] = False
+        operations.append(operation)
+    
+    if errors:
+        return 0, errors
+    
+    for operation in operations:
+        if operation[0] == "UPD":
+            set_slot(data, *operation[1:])
+        else:
+            clear_slot(data, operation[1], operation[2])
+    if operations:
         try:
-            chest_int = int(chest_num)
-            if wall == 'D' and (chest_int < 1 or chest_int > 30):
-                return f"Invalid chest number for wall D. Use 01-30"
-            elif wall != 'D' and (chest_int < 1 or chest_int > 35):
-                return f"Invalid chest number for wall {wall}. Use 01-35"
-        except ValueError:
-            return f"Invalid chest number '{chest_num}'"
-        
-        chest_id = f"{wall}{chest_num}"
-        
-        # Validate slot
+            save_data(data)
+        except StorageConflict as e:
+            return 0, [(None, str(e))]
+    return len(operations), errors
+
+# Shared storage server: one process owns the data and applies the changes of
+# every connected TUI and CLI in order. Clients keep their own copy of the
+# data, send its change records on save_data, and apply the changes the
+# server pushes to them instead of reloading the files.
+STORAGE_SOCKET = "storage_data.sock"
+SERVER_POLL_MS = 100  # How often an idle TUI picks up changes pushed by the server
+storage_client = None  # StorageClient while connected to a server
+
+class StorageConflict(Exception):
+    """Changes rejected by the storage server because another client changed the same slots first."""
+
+def _encode_message(message):
+    return json.dumps(message, separators=(',', ':'), ensure_ascii=False).encode('utf-8') + b"\n"
+
+def _split_messages(parts, chunk):
+    """Add a received chunk to parts (the unfinished line) and return the lines it completes."""
+    if b"\n" not in chunk:
+        parts.append(chunk)
+        return []
+    lines = chunk.split(b"\n")
+    parts.append(lines[0])
+    lines[0] = b"".join(parts)
+    parts[:] = [lines.pop()]
+    return lines
+
+def _valid_record(record):
+    """Check that a change record received from a client is well formed."""
+    if not isinstance(record, list) or len(record) < 3 or not isinstance(record[1], str):
+        return False
+    if record[0] == "C":
+        return len(record) == 3 and isinstance(record[2], (str, dict))
+    if not (isinstance(record[2], str) and record[2].isdigit() and int(record[2]) < SLOTS_PER_CHEST):
+        return False
+    if record[0] == "R":
+        return len(record) == 3
+    return (record[0] == "U" and len(record) == 5 and isinstance(record[3], str)
+            and isinstance(record[4], int) and 0 <= record[4] <= 0xFFFFFFFF)
+
+def _apply_records(data, records):
+    """Apply change records (in their journal form) through set_slot/clear_slot/set_chest."""
+    for record in records:
+        op, chest_id = record[0], record[1]
+        if op == "U":
+            set_slot(data, chest_id, int(record[2]), record[3], record[4])
+        elif op == "R":
+            clear_slot(data, chest_id, int(record[2]))
+        else:
+            set_chest(data, chest_id, chest_from_json(record[2]))
+
+class StorageServer:
+    """Applies clients' change records to data one request at a time and pushes them to every client.
+
+    Each applied request gets the next sequence number, which becomes the
+    version of every slot (and chest) it changed. A request carries the last
+    sequence number its client has seen; if a slot it touches has changed
+    since, none of it is applied and the client is sent the current contents
+    of those slots instead.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.seq = 0
+        self.slot_versions = {}   # (chest_id, slot) -> seq of the last change to the slot
+        self.chest_versions = {}  # chest_id -> seq of the last change to any part of the chest
+        self.reset_versions = {}  # chest_id -> seq of the last whole-chest replacement
+        self.clients = {}         # socket -> {"parts", "out", "writing", "subscribed"}
+        self.selector = None
+
+    def _version(self, record):
+        chest_id = record[1]
+        if record[0] == "C":
+            return self.chest_versions.get(chest_id, 0)
+        return max(self.slot_versions.get((chest_id, record[2]), 0), self.reset_versions.get(chest_id, 0))
+
+    def _current(self, record):
+        """Return a record restoring the server's contents of what record changes."""
+        chest_id = record[1]
+        chest = self.data.get(chest_id)
+        if record[0] == "C" or chest is None or chest.label is not None:
+            return ["C", chest_id, chest_to_json(chest) if chest is not None else ""]
+        slot = int(record[2])
+        if chest.items[slot]:
+            return ["U", chest_id, record[2], item_names[chest.items[slot]], chest.qtys[slot]]
+        return ["R", chest_id, record[2]]
+
+    def apply(self, since, records):
+        """Apply a client's records unless they touch slots changed after sequence number since.
+
+        Returns (seq, None) once applied, or (None, repair records) if rejected.
+        """
+        if any(self._version(record) > since for record in records):
+            return None, [self._current(record) for record in records]
+        self.seq += 1
+        _apply_records(self.data, records)
+        for record in records:
+            chest_id = record[1]
+            self.chest_versions[chest_id] = self.seq
+            if record[0] == "C":
+                self.reset_versions[chest_id] = self.seq
+            else:
+                self.slot_versions[(chest_id, record[2])] = self.seq
+        save_data(self.data)
+        return self.seq, None
+
+    def serve_forever(self, listener):
+        """Accept clients on a listening socket and answer them until interrupted."""
+        import selectors
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(listener, selectors.EVENT_READ)
         try:
-            slot = int(slot_str)
-            if slot < 0 or slot > 53:
-                return "Invalid slot number. Use 0-53"
-        except ValueError:
-            return f"Invalid slot number '{slot_str}'"
-        
-        # Handle command types
-        if cmd_type in ['UPD', '~']:
-            # Update command - need item data
-            if len(parts) < 5:
-                return "Update command needs item data: UPD:WALL:CHEST:SLOT:(ItemName,Qty)"
-            
-            item_data = ':'.join(parts[4:])  # Join remaining parts
-            
-            # Parse item data: (ItemName, Qty)
-            if not item_data.startswith('(') or not item_data.endswith(')'):
-                return "Item data must be in format: (ItemName, Qty)"
-            
-            item_content = item_data[1:-1]  # Remove parentheses
-            item_parts = [p.strip() for p in item_content.split(',')]
-            
-            if len(item_parts) != 2:
-                return "Item data must be: (ItemName, Qty)"
-            
-            item_name = item_parts[0].strip()
+            while True:
+                for key, events in self.selector.select():
+                    conn = key.fileobj
+                    if conn is listener:
+                        self._accept(listener)
+                        continue
+                    if events & selectors.EVENT_WRITE and conn in self.clients:
+                        self._send(conn)
+                    if events & selectors.EVENT_READ and conn in self.clients:
+                        self._receive(conn)
+        finally:
+            for conn in list(self.clients):
+                self._drop(conn)
+            self.selector.close()
+
+    def _accept(self, listener):
+        import selectors
+        try:
+            conn, _ = listener.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        self.clients[conn] = {"parts": [], "out": bytearray(), "writing": False, "subscribed": False}
+        self.selector.register(conn, selectors.EVENT_READ)
+
+    def _drop(self, conn):
+        del self.clients[conn]
+        self.selector.unregister(conn)
+        conn.close()
+
+    def _receive(self, conn):
+        try:
+            chunk = conn.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            chunk = b""
+        if not chunk:
+            self._drop(conn)
+            return
+        for line in _split_messages(self.clients[conn]["parts"], chunk):
+            self._handle(conn, line)
+            if conn not in self.clients:
+                return
+
+    def _handle(self, conn, line):
+        try:
+            request = json.loads(line)
+            op = request["op"]
+        except (ValueError, TypeError, KeyError):
+            self._queue(conn, {"type": "error", "error": "Malformed request"})
+            return
+        if op == "hello":
+            # The snapshot covers every change so far; later ones are pushed
+            self._queue(conn, {"type": "hello", "seq": self.seq, "data": data_to_json(self.data)})
+            self.clients[conn]["subscribed"] = True
+        elif op == "apply":
+            records, since = request.get("records"), request.get("seq")
+            if not isinstance(records, list) or not isinstance(since, int) or not all(map(_valid_record, records)):
+                self._queue(conn, {"type": "error", "error": "Invalid change records"})
+                return
+            seq, repairs = self.apply(since, records)
+            if seq is None:
+                self._queue(conn, {"type": "result", "applied": False, "repairs": repairs})
+                return
+            self.broadcast({"type": "event", "seq": seq, "records": records})
+            self._queue(conn, {"type": "result", "applied": True, "seq": seq})
+        else:
+            self._queue(conn, {"type": "error", "error": f"Unknown request '{op}'"})
+
+    def broadcast(self, message):
+        """Push a message to every client that has loaded the data."""
+        payload = _encode_message(message)
+        for conn, client in list(self.clients.items()):
+            if client["subscribed"] and conn in self.clients:
+                self._write(conn, payload)
+
+    def _queue(self, conn, message):
+        self._write(conn, _encode_message(message))
+
+    def _write(self, conn, payload):
+        client = self.clients[conn]
+        client["out"] += payload
+        if not client["writing"]:
+            self._send(conn)
+
+    def _send(self, conn):
+        """Send as much queued output as the socket takes; the selector waits to send the rest."""
+        import selectors
+        client = self.clients[conn]
+        try:
+            sent = conn.send(client["out"])
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._drop(conn)
+            return
+        del client["out"][:sent]
+        writing = bool(client["out"])
+        if writing != client["writing"]:
+            client["writing"] = writing
+            self.selector.modify(conn, selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0))
+
+def serve(socket_path=STORAGE_SOCKET):
+    """Load the data and run the storage server on a Unix socket until interrupted."""
+    import socket
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except OSError:
+            os.remove(socket_path)  # Left behind by a server that did not shut down
+        else:
+            raise RuntimeError(f"A storage server is already running on {socket_path}")
+        finally:
+            probe.close()
+    data = load_data()
+    start_background_writer()
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        listener.bind(socket_path)
+        listener.listen(64)
+        listener.setblocking(False)
+        StorageServer(data).serve_forever(listener)
+    finally:
+        listener.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        stop_background_writer()
+
+class StorageClient:
+    """Connection to a storage server, keeping the data loaded from it in step with the server."""
+
+    def __init__(self, socket_path=STORAGE_SOCKET):
+        import socket
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(socket_path)
+        except OSError:
+            self.sock.close()
+            raise
+        self.seq = 0  # Last server change applied to the local data
+        self.parts = []
+        self.lines = deque()
+
+    def _send(self, message):
+        self.sock.sendall(_encode_message(message))
+
+    def _receive(self, block=True):
+        """Return the next message from the server, or None if block is False and none is waiting."""
+        while not self.lines:
+            self.sock.setblocking(block)
             try:
-                qty = int(item_parts[1].strip())
-                if qty < 1:
-                    return "Quantity must be positive"
-            except ValueError:
-                return f"Invalid quantity '{item_parts[1]}'"
-            
-            # Initialize chest data if needed
-            if chest_id not in data:
-                data[chest_id] = {}
-            elif isinstance(data[chest_id], str):
-                data[chest_id] = {}
-            
-            # Add/update the item
-            data[chest_id][str(slot)] = [item_name, qty]
-            
-            return f"Updated {chest_id} slot {slot}: {item_name} x{qty}"
-            
-        elif cmd_type in ['REM', '-']:
-            # Remove command
-            if chest_id not in data or not isinstance(data[chest_id], dict):
-                return f"Chest {chest_id} has no items to remove"
-            
-            slot_key = str(slot)
-            if slot_key not in data[chest_id]:
-                return f"Slot {slot} in {chest_id} is already empty"
-            
-            # Remove the item
-            item_info = data[chest_id][slot_key]
-            del data[chest_id][slot_key]
-            
-            if isinstance(item_info, list) and len(item_info) >= 2:
-                return f"Removed from {chest_id} slot {slot}: {item_info[0]} x{item_info[1]}"
+                chunk = self.sock.recv(65536)
+            except BlockingIOError:
+                return None
+            finally:
+                self.sock.setblocking(True)
+            if not chunk:
+                raise ConnectionError("The storage server closed the connection")
+            self.lines.extend(_split_messages(self.parts, chunk))
+        return json.loads(self.lines.popleft())
+
+    def _apply(self, data, records):
+        """Apply the server's records to data without queueing them to be sent back or undone."""
+        pending = journal["pending"] if journal is not None and journal["data"] is data else None
+        group = history["group"] if history is not None and history["data"] is data else None
+        mark = len(pending) if pending is not None else 0
+        group_mark = len(group) if group is not None else 0
+        _apply_records(data, records)
+        if pending is not None:
+            del pending[mark:]
+        if group is not None:
+            del group[group_mark:]
+
+    def load(self):
+        """Fetch the server's data in its storage_data.json form."""
+        self._send({"op": "hello"})
+        while True:
+            message = self._receive()
+            if message.get("type") == "hello":
+                self.seq = message["seq"]
+                return message["data"]
+            if message.get("type") != "event":  # Events before the snapshot are already in it
+                raise ValueError(message.get("error", "Unexpected message from the storage server"))
+
+    def sync(self, data, records=()):
+        """Send change records made to data, then apply the changes pushed by the server.
+
+        Returns the number of records applied from the server. If the server
+        rejects the records, the slots involved get the server's contents
+        back and StorageConflict is raised.
+        """
+        if records:
+            self._send({"op": "apply", "seq": self.seq, "records": records})
+        applied = 0
+        while True:
+            message = self._receive(block=bool(records))
+            if message is None:
+                return applied
+            kind = message.get("type")
+            if kind == "event":
+                self._apply(data, message["records"])
+                self.seq = message["seq"]
+                applied += len(message["records"])
+            elif kind == "result":
+                if not message["applied"]:
+                    self._apply(data, message["repairs"])
+                    raise StorageConflict(f"{len(records)} change(s) not saved: another client "
+                                          "changed the same slots first")
+                return applied
             else:
-                return f"Removed item from {chest_id} slot {slot}"
-        
-        else:
-            return f"Unknown command '{cmd_type}'. Use UPD/~ for update or REM/- for remove"
-            
-    except Exception as e:
-        return f"Command error: {str(e)}"
+                raise ValueError(message.get("error", "Unexpected message from the storage server"))
+
+# World import: read chest contents straight from a Minecraft world's Anvil
+# region files. A config maps chest block coordinates to chest IDs; only the
+# chunks holding mapped chests are read, one region file per pool worker.
+IMPORT_CONFIG_FILE = "world_import.json"
+
+_NBT_NUMBERS = {1: struct.Struct(">b"), 2: struct.Struct(">h"), 3: struct.Struct(">i"),
+                4: struct.Struct(">q"), 5: struct.Struct(">f"), 6: struct.Struct(">d")}
+_NBT_ARRAYS = {7: 1, 11: 4, 12: 8}  # Array tag -> element size; arrays are kept as raw bytes
+_NBT_LENGTH = struct.Struct(">i")
+_NBT_NAME_LENGTH = struct.Struct(">H")
+
+def _read_nbt(buf, pos, tag):
+    """Decode the NBT payload of type tag at buf[pos:]; returns (value, position after it)."""
+    number = _NBT_NUMBERS.get(tag)
+    if number is not None:
+        return number.unpack_from(buf, pos)[0], pos + number.size
+    if tag == 8:
+        end = pos + 2 + _NBT_NAME_LENGTH.unpack_from(buf, pos)[0]
+        return buf[pos + 2:end].decode('utf-8', 'replace'), end
+    if tag in _NBT_ARRAYS:
+        end = pos + 4 + _NBT_LENGTH.unpack_from(buf, pos)[0] * _NBT_ARRAYS[tag]
+        return buf[pos + 4:end], end
+    if tag == 9:
+        item_tag = buf[pos]
+        length = _NBT_LENGTH.unpack_from(buf, pos + 1)[0]
+        pos += 5
+        values = []
+        for _ in range(length):
+            value, pos = _read_nbt(buf, pos, item_tag)
+            values.append(value)
+        return values, pos
+    if tag == 10:
+        compound = {}
+        while True:
+            child_tag = buf[pos]
+            if child_tag == 0:
+                return compound, pos + 1
+            name_end = pos + 3 + _NBT_NAME_LENGTH.unpack_from(buf, pos + 1)[0]
+            name = buf[pos + 3:name_end].decode('utf-8', 'replace')
+            compound[name], pos = _read_nbt(buf, name_end, child_tag)
+    raise ValueError(f"Unknown NBT tag {tag}")
+
+def read_nbt(buf):
+    """Decode an uncompressed NBT document and return its root compound."""
+    if not buf or buf[0] != 10:
+        raise ValueError("NBT data does not start with a compound")
+    name_end = 3 + _NBT_NAME_LENGTH.unpack_from(buf, 1)[0]
+    return _read_nbt(buf, name_end, 10)[0]
+
+def _read_chunk(f, region_dir, chunk_x, chunk_z, location):
+    """Read and decode one chunk of an open region file; returns None if it was never generated."""
+    import gzip
+    import zlib
+    sector = int.from_bytes(location[:3], 'big')
+    if sector == 0:
+        return None
+    f.seek(sector * 4096)
+    header = f.read(5)
+    if len(header) < 5:
+        raise ValueError("chunk lies past the end of the region file")
+    compression = header[4]
+    payload = f.read(int.from_bytes(header[:4], 'big') - 1)
+    if compression & 0x80:  # Oversized chunk kept in its own file
+        with open(os.path.join(region_dir, f"c.{chunk_x}.{chunk_z}.mcc"), 'rb') as external:
+            payload = external.read()
+        compression &= 0x7F
+    if compression == 1:
+        payload = gzip.decompress(payload)
+    elif compression == 2:
+        payload = zlib.decompress(payload)
+    elif compression != 3:
+        raise ValueError(f"unsupported chunk compression {compression}")
+    return read_nbt(payload)
+
+def _scan_region(task):
+    """Pool worker: read the chests at the wanted positions of one region file.
+
+    task is (region_dir, region_x, region_z, {chunk index: [positions]}).
+    Returns ({position: [(slot, item ID, count)]}, warnings).
+    """
+    region_dir, region_x, region_z, wanted = task
+    path = os.path.join(region_dir, f"r.{region_x}.{region_z}.mca")
+    found = {}
+    warnings = []
+    if not os.path.exists(path):
+        return found, [f"Region file {path} not found"]
+    with open(path, 'rb') as f:
+        locations = f.read(4096)
+        for chunk_index, positions in sorted(wanted.items()):
+            chunk_x = region_x * 32 + chunk_index % 32
+            chunk_z = region_z * 32 + chunk_index // 32
+            try:
+                root = _read_chunk(f, region_dir, chunk_x, chunk_z,
+                                   locations[chunk_index * 4:chunk_index * 4 + 4])
+            except (OSError, ValueError, IndexError, struct.error, EOFError) as e:
+                warnings.append(f"Chunk {chunk_x},{chunk_z} in {path} unreadable: {e}")
+                continue
+            if root is None:
+                continue
+            entities = root.get("block_entities")
+            if entities is None:  # Worlds from before 1.18
+                entities = root.get("Level", {}).get("TileEntities", [])
+            positions = set(positions)
+            for entity in entities:
+                position = (entity.get("x"), entity.get("y"), entity.get("z"))
+                if position in positions and isinstance(entity.get("Items"), list):
+                    found[position] = [(item.get("Slot", 0) & 0xFF, str(item.get("id", "")),
+                                        item.get("count", item.get("Count", 1)))
+                                       for item in entity["Items"]]
+    return found, warnings
+
+def _import_vector(value, what):
+    if isinstance(value, list) and len(value) == 3 and all(isinstance(v, int) for v in value):
+        return tuple(value)
+    raise ValueError(f"{what} must be [x, y, z] integers")
+
+def read_import_config(path):
+    """Read a world import config and return ({(x, y, z): (chest ID, first slot)}, item names).
+
+    "walls" places a wall's chests from "origin" one "step" apart, wrapping
+    every "row_length" chests by "row_step"; "half" is the offset of a double
+    chest's second block (slots 27-53). "chests" maps single chest IDs to
+    their one or two blocks and overrides the walls. "names" maps Minecraft
+    item IDs to the names used here; other IDs become e.g. "Oak Log".
+    """
+    with open(path, 'r') as f:
+        raw = json.load(f)
+    if not isinstance(raw, dict):
+        raise ValueError(f"Invalid import config {path}: expected an object")
+    placements = {}  # chest ID -> its blocks, first half first
+    problems = []
+    explicit = raw.get("chests", {})
+    for chest_id, blocks in explicit.items():
+        chest_id = chest_id.upper()
+        if chest_id not in chest_walls:
+            problems.append(f"Unknown chest {chest_id}")
+            continue
+        try:
+            if not isinstance(blocks, list) or not 1 <= len(blocks) <= 2:
+                raise ValueError("expected one or two [x, y, z] blocks")
+            placements[chest_id] = [_import_vector(block, "block") for block in blocks]
+        except ValueError as e:
+            problems.append(f"Chest {chest_id}: {e}")
+    for wall, spec in raw.get("walls", {}).items():
+        wall = wall.upper()
+        if wall not in chests:
+            problems.append(f"Unknown wall {wall}")
+            continue
+        try:
+            if not isinstance(spec, dict):
+                raise ValueError("expected an object")
+            origin = _import_vector(spec.get("origin"), "origin")
+            step = _import_vector(spec.get("step"), "step")
+            half = _import_vector(spec["half"], "half") if "half" in spec else None
+            row_length = spec.get("row_length", len(chests[wall]))
+            if not isinstance(row_length, int) or row_length < 1:
+                raise ValueError("row_length must be a positive integer")
+            row_step = _import_vector(spec.get("row_step"), "row_step") if "row_length" in spec else (0, 0, 0)
+        except ValueError as e:
+            problems.append(f"Wall {wall}: {e}")
+            continue
+        for i, chest_id in enumerate(chests[wall]):
+            if chest_id in placements:  # Placed explicitly
+                continue
+            column, row = i % row_length, i // row_length
+            first = tuple(o + column * s + row * r for o, s, r in zip(origin, step, row_step))
+            placements[chest_id] = [first] if half is None else [first, tuple(a + b for a, b in zip(first, half))]
+    positions = {}
+    for chest_id, blocks in placements.items():
+        for half_index, block in enumerate(blocks):
+            if block in positions:
+                problems.append(f"Block {block} is mapped to both {positions[block][0]} and {chest_id}")
+            positions[block] = (chest_id, half_index * (SLOTS_PER_CHEST // 2))
+    names = raw.get("names", {})
+    if not isinstance(names, dict) or not all(isinstance(v, str) for v in names.values()):
+        problems.append("names must map item IDs to strings")
+    if problems:
+        raise ValueError(f"Invalid import config {path}:\n  " + "\n  ".join(problems))
+    return positions, names
+
+def minecraft_item_name(item_id, names=None):
+    """Return the storage name for a Minecraft item ID, e.g. "minecraft:oak_log" -> "Oak Log"."""
+    if names and item_id in names:
+        return names[item_id]
+    return item_id.rpartition(":")[2].replace("_", " ").title()
+
+def import_world(data, world_path, config_path=IMPORT_CONFIG_FILE, workers=None):
+    """Replace the mapped chests in data with their contents in a world save, then save.
+
+    world_path is a world folder or its region folder. Region files are read
+    in parallel by up to workers processes (default: one per CPU). Chests
+    none of whose blocks hold a container are left unchanged.
+    Returns (imported chest count, warnings).
+    """
+    positions, names = read_import_config(config_path)
+    region_dir = os.path.join(world_path, "region")
+    if not os.path.isdir(region_dir):
+        region_dir = world_path
+    regions = {}  # (region x, region z) -> {chunk index: [positions]}
+    for x, y, z in positions:
+        chunk_x, chunk_z = x >> 4, z >> 4
+        chunk_index = (chunk_x & 31) + (chunk_z & 31) * 32
+        regions.setdefault((chunk_x >> 5, chunk_z >> 5), {}).setdefault(chunk_index, []).append((x, y, z))
+    tasks = [(region_dir, region_x, region_z, wanted) for (region_x, region_z), wanted in sorted(regions.items())]
+
+    found = {}
+    warnings = []
+    if workers == 1 or len(tasks) <= 1:
+        results = map(_scan_region, tasks)
+        pool = None
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(workers or os.cpu_count() or 1, len(tasks)))
+        results = pool.imap_unordered(_scan_region, tasks)
+    try:
+        for region_found, region_warnings in results:
+            found.update(region_found)
+            warnings.extend(region_warnings)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    contents = {}  # chest ID -> imported Chest
+    for position, (chest_id, first_slot) in sorted(positions.items(), key=lambda entry: entry[1]):
+        items = found.get(position)
+        if items is None:
+            warnings.append(f"{chest_id}: no container at {' '.join(map(str, position))}")
+            continue
+        chest = contents.setdefault(chest_id, Chest())
+        for slot, item_id, count in items:
+            slot += first_slot
+            if not (first_slot <= slot < SLOTS_PER_CHEST and item_id and isinstance(count, int) and count >= 0):
+                warnings.append(f"{chest_id}: skipped {item_id} in slot {slot - first_slot} "
+                                f"at {' '.join(map(str, position))}")
+                continue
+            chest.qtys[slot] = min(count, 0xFFFFFFFF)
+            chest.items[slot] = intern_item(minecraft_item_name(item_id, names))
+    for chest_id in sorted(contents):
+        set_chest(data, chest_id, contents[chest_id])
+    if contents:
+        save_data(data)
+    return len(contents), warnings
 
 def show_command_help():
     """Return help text for commands."""
@@ -302,26 +3817,136 @@ def show_command_help():
         "  REM:B:01:5",
         "  -:B:01:5",
         "",
-        "WALL: A, B, C, D",
-        "CHEST: 01-35 (01-30 for D)",
+        "WALL: " + ", ".join(wall_order[:12]) + (f", ... ({len(wall_order)} walls)" if len(wall_order) > 12 else ""),
+        "CHEST: " + _chest_number_help(),
         "SLOT: 0-53"
     ]
 
-def edit_item_in_slot(stdscr, chest_id, slot_data):
+def _chest_number_help():
+    """Describe the chest number range of each wall, e.g. "01-35 (01-30 for D)"."""
+    ranges = {}
+    for wall in wall_order:
+        wall_chests = chests[wall]
+        ranges.setdefault(f"{wall_chests[0][len(wall):]}-{wall_chests[-1][len(wall):]}", []).append(wall)
+    # The range most walls share is shown first, the others with their walls
+    common = max(ranges, key=lambda chest_range: len(ranges[chest_range]))
+    others = [f"{chest_range} for {', '.join(walls)}" for chest_range, walls in ranges.items()
+              if chest_range != common]
+    return common + (f" ({'; '.join(others)})" if others else "")
+
+class FrameBuffer:
+    """Draws frames onto a curses window, rewriting only what changed.
+
+    Each frame is drawn with addstr() between begin() and flush(). flush()
+    compares the frame with the previous one line by line: unchanged lines
+    are skipped, lines whose segments keep their positions and widths get
+    only the changed segments rewritten, and anything else is cleared and
+    redrawn. The window is pushed with noutrefresh()/doupdate().
+    """
+    __slots__ = ("window", "drawn", "frame")
+
+    def __init__(self, window):
+        self.window = window
+        self.drawn = {}  # y -> {x: (text, attr)} as last flushed
+        self.frame = {}
+
+    def begin(self):
+        self.frame = {}
+
+    def addstr(self, y, x, text, attr=0):
+        self.frame.setdefault(y, {})[x] = (text, attr)
+
+    def forget(self, y):
+        """Mark line y as overwritten outside the buffer (e.g. by a prompt)."""
+        self.drawn[y] = {}
+
+    def invalidate(self):
+        """Blank the window and forget the previous frame, e.g. after another view."""
+        self.window.erase()
+        self.drawn = {}
+
+    def flush(self):
+        window = self.window
+        for y in self.drawn.keys() - self.frame.keys():
+            window.move(y, 0)
+            window.clrtoeol()
+        for y, segments in self.frame.items():
+            old = self.drawn.get(y)
+            if old == segments:
+                continue
+            if (old and old.keys() == segments.keys()
+                    and all(len(old[x][0]) == len(text) for x, (text, _) in segments.items())):
+                # Same layout: overwrite just the segments that changed
+                for x, segment in segments.items():
+                    if old[x] != segment:
+                        window.addstr(y, x, *segment)
+            else:
+                window.move(y, 0)
+                window.clrtoeol()
+                for x in sorted(segments):
+                    window.addstr(y, x, *segments[x])
+        self.drawn = self.frame
+        window.noutrefresh()
+        import curses
+        curses.doupdate()
+
+_NO_CHEST = Chest()  # Shown for layout chests with nothing stored; never modified
+
+def _read_key(stdscr):
+    """Read a key; while connected to a storage server, give up with -1 after SERVER_POLL_MS.
+
+    While the storage is still loading, give up after LOAD_POLL_MS.
+    """
+    if progressive_load is not None:
+        stdscr.timeout(LOAD_POLL_MS)
+    elif storage_client is not None:
+        stdscr.timeout(SERVER_POLL_MS)
+    else:
+        return stdscr.getch()
+    try:
+        return stdscr.getch()
+    finally:
+        stdscr.timeout(-1)
+
+def _undo_from_tui(data, redo_changes=False):
+    """Undo (or redo) the last change group and return the message to show."""
+    try:
+        count = redo(data) if redo_changes else undo(data)
+    except StorageConflict as e:
+        return str(e)
+    if not count:
+        return "Nothing to redo" if redo_changes else "Nothing to undo"
+    return f"{'Redid' if redo_changes else 'Undid'} {count} change(s)"
+
+def _save_from_tui(data):
+    """save_data for the TUI: returns the message instead of raising when the server rejects changes."""
+    try:
+        save_data(data)
+    except StorageConflict as e:
+        return str(e)
+    return None
+
+def edit_item_in_slot(stdscr, data, chest_id):
     """TUI for managing items within a double chest (54 slots)."""
+    import curses
     selected_slot = 0
+    screen = FrameBuffer(stdscr)
+    screen.invalidate()
+    notice = None
     
     while True:
-        stdscr.clear()
+        chest = data.get(chest_id) or _NO_CHEST
+        frame_start = time.perf_counter() if METRICS_ENABLED else None
+        screen.begin()
         
         # Header
-        stdscr.addstr(0, 2, f"Double Chest {chest_id} - Item Management", curses.A_BOLD)
+        screen.addstr(0, 2, f"Double Chest {chest_id} - Item Management", curses.A_BOLD)
         
         # Display slots in a 9x6 grid (54 slots total)
         for row in range(6):
             for col in range(9):
                 slot_idx = row * 9 + col
-                item, qty = slot_data.get(slot_idx, ("", 0))
+                item, qty = item_names[chest.items[slot_idx]], chest.qtys[slot_idx]
                 
                 # Create abbreviated display (3 chars + quantity)
                 if item:
@@ -336,28 +3961,37 @@ def edit_item_in_slot(stdscr, chest_id, slot_data):
                 
                 # Highlight selected slot
                 if slot_idx == selected_slot:
-                    stdscr.addstr(y_pos, x_pos, display, curses.A_REVERSE)
+                    screen.addstr(y_pos, x_pos, display, curses.A_REVERSE)
                 else:
                     # Color filled slots differently
                     if item:
-                        stdscr.addstr(y_pos, x_pos, display, curses.color_pair(1))
+                        screen.addstr(y_pos, x_pos, display, curses.color_pair(1))
                     else:
-                        stdscr.addstr(y_pos, x_pos, display)
+                        screen.addstr(y_pos, x_pos, display)
         
         # Display full item info for selected slot
-        if slot_data.get(selected_slot):
-            full_item, full_qty = slot_data[selected_slot]
+        if chest.items[selected_slot]:
+            full_item, full_qty = item_names[chest.items[selected_slot]], chest.qtys[selected_slot]
             info_text = f"Selected: {full_item} (Quantity: {full_qty})"
         else:
             info_text = f"Selected: Slot {selected_slot + 1} [Empty]"
         
-        stdscr.addstr(9, 2, info_text[:curses.COLS - 4])
+        screen.addstr(9, 2, info_text[:curses.COLS - 4])
         
         # Instructions
-        stdscr.addstr(11, 2, "Arrow Keys: Navigate  |  Enter: Edit Item  |  Del: Clear Slot  |  q: Back to Chests")
+        screen.addstr(11, 2, "Arrow Keys: Navigate  |  Enter: Edit Item  |  Del: Clear Slot  |  u/r: Undo/redo  |  q: Back to Chests")
+        if notice:
+            screen.addstr(13, 2, notice[:curses.COLS - 4], curses.color_pair(4))
         
-        stdscr.refresh()
-        key = stdscr.getch()
+        screen.flush()
+        if frame_start is not None:
+            record_metric("edit_item_in_slot.frame", time.perf_counter() - frame_start)
+        key = _read_key(stdscr)
+        if key == -1 and storage_client is not None:
+            # Idle while connected to a storage server: send edits, take in others'
+            notice = _save_from_tui(data) or notice
+            continue
+        notice = None
         
         if key in [ord('q'), ord('Q')]:
             break
@@ -385,22 +4019,228 @@ def edit_item_in_slot(stdscr, chest_id, slot_data):
                     stdscr.clrtoeol()
                     qty_str = stdscr.getstr(14, 18, 10).decode('utf-8')
                     qty = int(qty_str) if qty_str.isdigit() else 1
-                    slot_data[selected_slot] = (item_name.strip(), qty)
+                    set_slot(data, chest_id, selected_slot, item_name.strip(), qty)
                 else:
                     # Empty name = clear slot
-                    if selected_slot in slot_data:
-                        del slot_data[selected_slot]
-            except (ValueError, KeyboardInterrupt):
+                    clear_slot(data, chest_id, selected_slot)
+                notice = _save_from_tui(data)  # Each edit is its own undo step
+            except (ValueError, OverflowError, KeyboardInterrupt):
                 pass
             curses.noecho()
+            screen.forget(13)
+            screen.forget(14)
         elif key in [curses.KEY_DC, ord('x'), ord('X')]:  # Delete key or 'x'
             # Clear selected slot
-            if selected_slot in slot_data:
-                del slot_data[selected_slot]
+            clear_slot(data, chest_id, selected_slot)
+            notice = _save_from_tui(data)
+        elif key in [ord('u'), ord('r')]:
+            notice = _undo_from_tui(data, key == ord('r'))
+
+def item_totals_view(stdscr, data):
+    """TUI listing every item by total quantity; Enter shows where an item is stored."""
+    import curses
+    screen = FrameBuffer(stdscr)
+    screen.invalidate()
+    rows = item_totals(data)
+    item_name = None  # Item whose locations are shown, or None for the totals list
+    selected_idx = 0
+    view_offset = 0
+    notice = None
+    
+    while True:
+        max_display_lines = curses.LINES - 6
+        screen.begin()
+        if item_name is None:
+            screen.addstr(0, 2, f"Item Totals ({len(rows)} items)", curses.A_BOLD)
+            lines = [f"{name[:40]:<40} {total:>10}  ({chest_count} chests)" for name, total, chest_count in rows]
+            instructions = "↑↓: Navigate  |  Enter: Show locations  |  q: Back to Chests"
+        else:
+            total, locations = item_ledger(data, item_name)
+            screen.addstr(0, 2, f"{item_name}: {total} total in {len(locations)} stacks", curses.A_BOLD)
+            lines = [f"{chest_id} slot {slot}: x{qty} ({get_category_for_chest(chest_id)})"
+                     for chest_id, slot, qty in locations]
+            instructions = "↑↓: Navigate  |  Enter: Open chest  |  q: Back to Totals"
+        
+        for idx in range(view_offset, min(view_offset + max_display_lines, len(lines))):
+            display = lines[idx][:curses.COLS - 4]
+            screen.addstr(idx - view_offset + 2, 2, display, curses.A_REVERSE if idx == selected_idx else 0)
+        if not lines:
+            screen.addstr(2, 2, "No items stored")
+        screen.addstr(curses.LINES - 2, 2, instructions[:curses.COLS - 4], curses.color_pair(3))
+        if len(lines) > max_display_lines:
+            scroll_info = f"[{view_offset + 1}-{min(view_offset + max_display_lines, len(lines))}/{len(lines)}]"
+            screen.addstr(curses.LINES - 1, curses.COLS - len(scroll_info) - 2, scroll_info)
+        if notice:
+            screen.addstr(curses.LINES - 1, 2, notice[:curses.COLS // 2], curses.color_pair(4))
+        screen.flush()
+        key = _read_key(stdscr)
+        if key == -1 and storage_client is not None:
+            # Idle while connected to a storage server: take in others' changes
+            seq = storage_client.seq
+            notice = _save_from_tui(data) or notice
+            if storage_client.seq != seq:
+                if item_name is None:
+                    rows = item_totals(data)
+                count = len(rows) if item_name is None else len(item_ledger(data, item_name)[1])
+                selected_idx = min(selected_idx, max(0, count - 1))
+            continue
+        notice = None
+        
+        if key in [ord('q'), ord('Q'), 27]:
+            if item_name is None:
+                break
+            # Back to the totals list, on the item just viewed
+            rows = item_totals(data)
+            names = [row[0] for row in rows]
+            selected_idx = names.index(item_name) if item_name in names else 0
+            view_offset = max(0, selected_idx - max_display_lines + 1)
+            item_name = None
+        elif key == curses.KEY_DOWN and selected_idx < len(lines) - 1:
+            selected_idx += 1
+            if selected_idx >= view_offset + max_display_lines:
+                view_offset += 1
+        elif key == curses.KEY_UP and selected_idx > 0:
+            selected_idx -= 1
+            if selected_idx < view_offset:
+                view_offset -= 1
+        elif key == curses.KEY_NPAGE and lines:
+            selected_idx = min(selected_idx + max_display_lines, len(lines) - 1)
+            view_offset = min(view_offset + max_display_lines, max(0, len(lines) - max_display_lines))
+        elif key == curses.KEY_PPAGE:
+            selected_idx = max(selected_idx - max_display_lines, 0)
+            view_offset = max(view_offset - max_display_lines, 0)
+        elif key in [curses.KEY_ENTER, 10, 13] and lines:
+            if item_name is None:
+                item_name = rows[selected_idx][0]
+                selected_idx = 0
+                view_offset = 0
+            else:
+                edit_item_in_slot(stdscr, data, locations[selected_idx][0])
+                notice = _save_from_tui(data)
+                screen.invalidate()
+                # The stack may have moved or gone
+                selected_idx = min(selected_idx, max(0, len(item_ledger(data, item_name)[1]) - 1))
+
+def materials_view(stdscr, data):
+    """TUI checking a bill of materials: shortfalls, crafts and the chests to pick from."""
+    import curses
+    curses.echo()
+    prompt = "Materials (Item, qty; Item, qty or a file): "
+    stdscr.addstr(curses.LINES - 1, 2, prompt)
+    stdscr.clrtoeol()
+    try:
+        text = stdscr.getstr(curses.LINES - 1, 2 + len(prompt), max(1, curses.COLS - len(prompt) - 3))
+        text = text.decode('utf-8').strip()
+    except KeyboardInterrupt:
+        text = ""
+    curses.noecho()
+    if not text:
+        return
+    try:
+        if os.path.isfile(text):
+            with open(text, 'r') as f:
+                materials, errors = parse_incoming(f)
+        else:
+            materials, errors = parse_incoming(text.split(';'))
+        if errors:
+            raise ValueError("; ".join(f"{line_no}: {message}" for line_no, message in errors))
+        recipes = read_recipes() if os.path.exists(RECIPES_FILE) else None
+        check_materials(data, materials, recipes)
+    except (OSError, ValueError) as e:
+        stdscr.addstr(curses.LINES - 1, 2, str(e)[:curses.COLS - 4], curses.color_pair(4))
+        stdscr.clrtoeol()
+        stdscr.refresh()
+        stdscr.getch()
+        return
+
+    screen = FrameBuffer(stdscr)
+    screen.invalidate()
+    selected_idx = 0
+    view_offset = 0
+    notice = None
+    while True:
+        picks, crafts, shortfalls = check_materials(data, materials, recipes)
+        rows = ([(f"Short: {item_name} x{missing}", curses.color_pair(4), None) for item_name, missing in shortfalls]
+                + [(f"Craft: {item_name} x{times}", curses.color_pair(2), None) for item_name, times in crafts]
+                + [(f"{chest_id} slot {slot}: take {item_name} x{qty} ({get_category_for_chest(chest_id)})", 0, chest_id)
+                   for chest_id, slot, item_name, qty in picks])
+        selected_idx = min(selected_idx, max(0, len(rows) - 1))
+        max_display_lines = curses.LINES - 6
+        screen.begin()
+        header = f"Materials: {len(picks)} picks from {len({pick[0] for pick in picks})} chests"
+        if shortfalls:
+            header += f", {len(shortfalls)} short"
+        screen.addstr(0, 2, header, curses.A_BOLD)
+        for idx in range(view_offset, min(view_offset + max_display_lines, len(rows))):
+            display, color = rows[idx][0][:curses.COLS - 4], rows[idx][1]
+            screen.addstr(idx - view_offset + 2, 2, display, curses.A_REVERSE if idx == selected_idx else color)
+        if not rows:
+            screen.addstr(2, 2, "Nothing needed")
+        instructions = "↑↓: Navigate  |  Enter: Open chest  |  q: Back to Chests"
+        screen.addstr(curses.LINES - 2, 2, instructions[:curses.COLS - 4], curses.color_pair(3))
+        if len(rows) > max_display_lines:
+            scroll_info = f"[{view_offset + 1}-{min(view_offset + max_display_lines, len(rows))}/{len(rows)}]"
+            screen.addstr(curses.LINES - 1, curses.COLS - len(scroll_info) - 2, scroll_info)
+        if notice:
+            screen.addstr(curses.LINES - 1, 2, notice[:curses.COLS // 2], curses.color_pair(4))
+        screen.flush()
+        key = _read_key(stdscr)
+        if key == -1 and storage_client is not None:
+            # Idle while connected to a storage server: the list is rebuilt from the new data
+            notice = _save_from_tui(data) or notice
+            continue
+        notice = None
+
+        if key in [ord('q'), ord('Q'), 27]:
+            break
+        elif key == curses.KEY_DOWN and selected_idx < len(rows) - 1:
+            selected_idx += 1
+            if selected_idx >= view_offset + max_display_lines:
+                view_offset += 1
+        elif key == curses.KEY_UP and selected_idx > 0:
+            selected_idx -= 1
+            if selected_idx < view_offset:
+                view_offset -= 1
+        elif key == curses.KEY_NPAGE and rows:
+            selected_idx = min(selected_idx + max_display_lines, len(rows) - 1)
+            view_offset = min(view_offset + max_display_lines, max(0, len(rows) - max_display_lines))
+        elif key == curses.KEY_PPAGE:
+            selected_idx = max(selected_idx - max_display_lines, 0)
+            view_offset = max(view_offset - max_display_lines, 0)
+        elif key in [curses.KEY_ENTER, 10, 13] and rows and rows[selected_idx][2] is not None:
+            edit_item_in_slot(stdscr, data, rows[selected_idx][2])
+            notice = _save_from_tui(data)
+            screen.invalidate()
+
+# Timings shown by the metrics overlay: metric name -> overlay label
+METRICS_OVERLAY = {"chest_tui.frame": "frame", "search_chests": "search", "fuzzy_search": "fuzzy",
+                   "parse_command": "cmd", "save_data": "save", "load_data": "load"}
+
+def metrics_overlay_text():
+    """Return the one-line status bar summary of the hot-path timings."""
+    parts = []
+    for name, label in METRICS_OVERLAY.items():
+        entry = metrics.get(name)
+        if entry and entry[0]:
+            parts.append(f"{label} {entry[1] / entry[0] * 1000:.2f}ms "
+                         f"p95<={_bucket_percentile(entry, 0.95)}ms x{entry[0]}")
+    return "  |  ".join(parts) or "No timings recorded yet"
+
+SEARCH_DEBOUNCE_MS = 40  # Keys arriving within this gap are searched together
+FUZZY_RESULT_LIMIT = 500  # Best fuzzy matches listed in the TUI
+
+def run_search(data, query, fuzzy=False):
+    """Run the exact or fuzzy search used by the TUI search mode."""
+    if fuzzy:
+        return fuzzy_search(data, query, FUZZY_RESULT_LIMIT)
+    return search_chests(data, query)
 
 def chest_tui(stdscr):
+    import curses
     curses.curs_set(0)
     stdscr.nodelay(0)
+    stdscr.idlok(True)  # Let curses scroll the terminal instead of repainting lines
+    screen = FrameBuffer(stdscr)
     
     # Initialize colors
     curses.start_color()
@@ -409,53 +4249,58 @@ def chest_tui(stdscr):
     curses.init_pair(3, curses.COLOR_CYAN, curses.COLOR_BLACK)   # Instructions
     curses.init_pair(4, curses.COLOR_RED, curses.COLOR_BLACK)    # Search mode
     
-    current_wall = "A"
+    current_wall = wall_order[0]
     selected_idx = 0
-    data = load_data()
+    data = load_data(progressive=True)  # Walls show as the file is read
     search_mode = False
+    fuzzy_mode = False
     search_query = ""
     search_results = []
     view_offset = 0
+    if storage_client is None:
+        start_background_writer()  # Saves below no longer wait on the disk
+    show_metrics = False
+    metrics_were_enabled = METRICS_ENABLED
+    notice = None  # Result of the last undo/redo, or changes the storage server rejected
 
     while True:
-        stdscr.clear()
+        loading = loading_data(data)
+        if loading is not None:
+            # Add what the background parse has read, then refresh what depends on it
+            if loading.merge(LOAD_MERGE_SECONDS):
+                loading = None
+                if partial_load:
+                    notice = f"A: accept partial load | {_load_errors_summary(load_errors)}"
+                elif load_errors:
+                    notice = _load_errors_summary(load_errors)
+            if search_mode and search_query:
+                search_results = run_search(data, search_query, fuzzy_mode)
+                selected_idx = min(selected_idx, max(0, len(search_results) - 1))
+        wall_loading = loading is not None and current_wall in data.unloaded
+        frame_start = time.perf_counter() if METRICS_ENABLED else None
+        screen.begin()
         
         # Header
         if search_mode:
-            header = f"Search Mode: '{search_query}' ({len(search_results)} results)"
-            stdscr.addstr(0, 2, header, curses.color_pair(4) | curses.A_BOLD)
+            mode_name = "Fuzzy Search" if fuzzy_mode else "Search Mode"
+            header = f"{mode_name}: '{search_query}' ({len(search_results)} results)"
+            if loading is not None:
+                header = f"{header[:-1]}, partial: {loading.progress()}% loaded)"
+            screen.addstr(0, 2, header, curses.color_pair(4) | curses.A_BOLD)
         else:
-            header = f"Minecraft Storage Tracker - Wall {current_wall}"
-            stdscr.addstr(0, 2, header, curses.A_BOLD)
+            if len(rooms) > 1:
+                header = f"Minecraft Storage Tracker - {wall_rooms[current_wall]} - Wall {current_wall}"
+            else:
+                header = f"Minecraft Storage Tracker - Wall {current_wall}"
+            screen.addstr(0, 2, header, curses.A_BOLD)
             
             # Show wall stats
-            wall_chests_data = {cid: data[cid] for cid in chests[current_wall]}
-            filled_chests = 0
-            total_items = 0
-            for chest_data in wall_chests_data.values():
-                if isinstance(chest_data, dict):
-                    # Sum up quantities from slot-based data (handle both string and list formats)
-                    chest_total = 0
-                    for value in chest_data.values():
-                        if isinstance(value, list) and len(value) >= 2:
-                            # Format: ["item_name", quantity]
-                            item_name, qty = value[0], value[1]
-                            if item_name and item_name.strip():
-                                chest_total += qty
-                        elif isinstance(value, tuple) and len(value) >= 2:
-                            # Format: ("item_name", quantity)
-                            item_name, qty = value[0], value[1]
-                            if item_name and item_name.strip():
-                                chest_total += qty
-                    if chest_total > 0:
-                        filled_chests += 1
-                        total_items += chest_total
-                elif isinstance(chest_data, str):
-                    # Old label-based data
-                    filled_chests += 1 if chest_data.strip() else 0
-            total_chests = len(wall_chests_data)
-            stats = f"({filled_chests}/{total_chests} chests, {total_items} items)"
-            stdscr.addstr(0, len(header) + 4, stats, curses.color_pair(1))
+            if wall_loading:
+                stats = f"(loading, {loading.progress()}%)"
+            else:
+                filled_chests, total_chests, total_items = get_wall_stats(data, current_wall)
+                stats = f"({filled_chests}/{total_chests} chests, {total_items} items)"
+            screen.addstr(0, len(header) + 4, stats, curses.color_pair(1))
 
         max_display_lines = curses.LINES - 6  # Leave space for header, categories, and instructions
         
@@ -473,51 +4318,37 @@ def chest_tui(stdscr):
                     display = display[:curses.COLS - 7] + "..."
                 
                 if display_idx == selected_idx:
-                    stdscr.addstr(y_pos, 2, display, curses.A_REVERSE)
+                    screen.addstr(y_pos, 2, display, curses.A_REVERSE)
                 else:
                     color = curses.color_pair(1) if label.strip() else 0
-                    stdscr.addstr(y_pos, 2, display, color)
+                    screen.addstr(y_pos, 2, display, color)
+        elif wall_loading:
+            screen.addstr(2, 2, f"Reading {SAVE_FILE}...")
         else:
             # Display current wall - single column only, simple scrolling
             wall_chests_list = chests[current_wall]
-            current_category = ""
+            wall_category_starts = category_starts[current_wall]
             display_line = 2
             
             for idx in range(view_offset, min(view_offset + max_display_lines, len(wall_chests_list))):
                 chest_id = wall_chests_list[idx]
                 
-                # Show category headers
-                category = get_category_for_chest(chest_id)
-                if category != current_category:
+                # Show category headers at range boundaries and at the top of the view
+                if idx == view_offset or idx in wall_category_starts:
                     if display_line < curses.LINES - 4:
-                        stdscr.addstr(display_line, 2, f"--- {category} ---", curses.color_pair(2) | curses.A_BOLD)
+                        category = get_category_for_chest(chest_id)
+                        screen.addstr(display_line, 2, f"--- {category} ---", curses.color_pair(2) | curses.A_BOLD)
                         display_line += 1
-                        current_category = category
                 
                 if display_line >= curses.LINES - 4:
                     break
                 
-                chest_data = data.get(chest_id, "")
-                if isinstance(chest_data, dict):
-                    # Sum up all quantities in the chest (handle both string and list formats)
-                    total_quantity = 0
-                    for value in chest_data.values():
-                        if isinstance(value, list) and len(value) >= 2:
-                            # Format: ["item_name", quantity]
-                            item_name, qty = value[0], value[1]
-                            if item_name and item_name.strip():
-                                total_quantity += qty
-                        elif isinstance(value, tuple) and len(value) >= 2:
-                            # Format: ("item_name", quantity)
-                            item_name, qty = value[0], value[1]
-                            if item_name and item_name.strip():
-                                total_quantity += qty
-                    if total_quantity > 0:
-                        display_label = f"{total_quantity} items"
-                    else:
-                        display_label = "<empty>"
-                elif isinstance(chest_data, str):
-                    display_label = chest_data if chest_data.strip() else "<empty>"
+                chest = data.get(chest_id)
+                total_quantity, distinct_items, filled = get_chest_stats(data, chest_id)
+                if chest is not None and chest.label is not None:
+                    display_label = chest.label if chest.label.strip() else "<empty>"
+                elif total_quantity > 0:
+                    display_label = f"{total_quantity} items"
                 else:
                     display_label = "<empty>"
                 
@@ -527,38 +4358,25 @@ def chest_tui(stdscr):
                     display = display[:curses.COLS - 7] + "..."
                 
                 if idx == selected_idx:
-                    stdscr.addstr(display_line, 2, display, curses.A_REVERSE)
+                    screen.addstr(display_line, 2, display, curses.A_REVERSE)
                 else:
-                    has_items = False
-                    if isinstance(chest_data, dict):
-                        # Check if chest has items (handle both string and list formats)
-                        for value in chest_data.values():
-                            if isinstance(value, list) and len(value) >= 2:
-                                item_name, qty = value[0], value[1]
-                                if item_name and item_name.strip():
-                                    has_items = True
-                                    break
-                            elif isinstance(value, tuple) and len(value) >= 2:
-                                item_name, qty = value[0], value[1]
-                                if item_name and item_name.strip():
-                                    has_items = True
-                                    break
-                    elif isinstance(chest_data, str):
-                        has_items = chest_data.strip() != ""
-                    
-                    color = curses.color_pair(1) if has_items else 0
-                    stdscr.addstr(display_line, 2, display, color)
+                    color = curses.color_pair(1) if filled or distinct_items else 0
+                    screen.addstr(display_line, 2, display, color)
                 
                 display_line += 1
 
         # Instructions
         if search_mode:
-            instructions = "ESC: Exit search  |  ↑↓: Navigate  |  Enter: Edit  |  Backspace: Delete char  |  Type: Search"
+            instructions = "ESC: Exit search  |  ↑↓: Navigate  |  Enter: Edit  |  Tab: Fuzzy/exact  |  Backspace: Delete char  |  Type: Search"
         else:
-            instructions = "←→: Switch wall  |  ↑↓: Navigate  |  Enter: Edit  |  /: Search  |  :: Command  |  ?: Help  |  q: Quit"
+            instructions = "←→: Switch wall  |  ↑↓: Navigate  |  Enter: Edit  |  /: Search  |  t: Totals  |  b: Materials  |  u/r: Undo/redo  |  :: Command  |  ?: Help  |  m: Metrics  |  q: Quit"
+            if len(rooms) > 1:
+                instructions = "[]: Switch room  |  " + instructions
         
         if curses.LINES > 2:
-            stdscr.addstr(curses.LINES - 2, 2, instructions[:curses.COLS - 4], curses.color_pair(3))
+            screen.addstr(curses.LINES - 2, 2, instructions[:curses.COLS - 4], curses.color_pair(3))
+        if show_metrics and curses.LINES > 3:
+            screen.addstr(curses.LINES - 3, 2, metrics_overlay_text()[:curses.COLS - 4], curses.A_REVERSE)
             
         # Show scroll indicator
         if not search_mode:
@@ -568,13 +4386,37 @@ def chest_tui(stdscr):
             
         if total_items > max_display_lines:
             scroll_info = f"[{view_offset + 1}-{min(view_offset + max_display_lines, total_items)}/{total_items}]"
-            stdscr.addstr(curses.LINES - 1, curses.COLS - len(scroll_info) - 2, scroll_info)
+            screen.addstr(curses.LINES - 1, curses.COLS - len(scroll_info) - 2, scroll_info)
+        if notice:
+            screen.addstr(curses.LINES - 1, 2, notice[:curses.COLS // 2], curses.color_pair(4))
         
-        stdscr.refresh()
-        key = stdscr.getch()
+        screen.flush()
+        if frame_start is not None:
+            record_metric("chest_tui.frame", time.perf_counter() - frame_start)
+        key = _read_key(stdscr)
+        if key == -1 and storage_client is not None:
+            # Idle while connected to a storage server: show others' changes
+            seq = storage_client.seq
+            notice = _save_from_tui(data) or notice
+            if storage_client.seq != seq and search_mode and search_query:
+                search_results = run_search(data, search_query, fuzzy_mode)
+                selected_idx = min(selected_idx, max(0, len(search_results) - 1))
+            continue
+        if key == -1:
+            continue  # Nothing typed while loading: go on reading
+        notice = None
+        if loading is not None and (key in (ord(':'), ord('t'), ord('T'), ord('b'), ord('B'), ord('u'), ord('r'))
+                                    and not search_mode):
+            # These work on the whole storage, so they wait for all of it
+            notice = f"Still reading {SAVE_FILE} ({loading.progress()}%)"
+            continue
 
         if key in [ord('q'), ord('Q')] and not search_mode:
             break
+        elif key == curses.KEY_F2 or (key in [ord('m'), ord('M')] and not search_mode):
+            # Toggle the metrics overlay; showing it turns timing on
+            show_metrics = not show_metrics
+            set_metrics_enabled(show_metrics or metrics_were_enabled)
         elif key == 27:  # ESC key
             if search_mode:
                 search_mode = False
@@ -596,7 +4438,7 @@ def chest_tui(stdscr):
                 command = stdscr.getstr(curses.LINES - 1, 11, 80).decode('utf-8')
                 if command.strip():
                     result = parse_command(command, data)
-                    save_data(data)  # Save after command execution
+                    result = _save_from_tui(data) or result  # Save after command execution
                     
                     # Show result message
                     stdscr.addstr(curses.LINES - 1, 2, result[:curses.COLS - 4])
@@ -605,29 +4447,47 @@ def chest_tui(stdscr):
             except KeyboardInterrupt:
                 pass
             curses.noecho()
+            screen.forget(curses.LINES - 1)
         elif key == ord('?') and not search_mode:
             # Show help
-            stdscr.clear()
+            stdscr.erase()
             stdscr.addstr(0, 2, "Command Help", curses.A_BOLD)
             help_lines = show_command_help()
             for i, line in enumerate(help_lines):
                 if i + 2 < curses.LINES - 2:
-                    stdscr.addstr(i + 2, 2, line)
+                    stdscr.addstr(i + 2, 2, line[:curses.COLS - 4])
             stdscr.addstr(curses.LINES - 1, 2, "Press any key to continue...")
             stdscr.refresh()
             stdscr.getch()
+            screen.invalidate()
         elif search_mode:
-            if key == curses.KEY_BACKSPACE or key == 127:
-                if search_query:
-                    search_query = search_query[:-1]
-                    search_results = search_chests(data, search_query)
-                    selected_idx = 0
-                    view_offset = 0
-            elif 32 <= key <= 126:  # Printable characters
-                search_query += chr(key)
-                search_results = search_chests(data, search_query)
+            if key == 9:  # Tab toggles fuzzy matching
+                fuzzy_mode = not fuzzy_mode
+                search_results = run_search(data, search_query, fuzzy_mode)
                 selected_idx = 0
                 view_offset = 0
+            elif key in (curses.KEY_BACKSPACE, 127) or 32 <= key <= 126:  # Backspace or printable
+                # Take in the rest of a burst of typing or a paste before searching once
+                changed = False
+                while True:
+                    if key in (curses.KEY_BACKSPACE, 127):
+                        if search_query:
+                            search_query = search_query[:-1]
+                            changed = True
+                    else:
+                        search_query += chr(key)
+                        changed = True
+                    stdscr.timeout(SEARCH_DEBOUNCE_MS)
+                    key = stdscr.getch()
+                    stdscr.timeout(-1)
+                    if not (key in (curses.KEY_BACKSPACE, 127) or 32 <= key <= 126):
+                        if key != -1:
+                            curses.ungetch(key)
+                        break
+                if changed:
+                    search_results = run_search(data, search_query, fuzzy_mode)
+                    selected_idx = 0
+                    view_offset = 0
             elif key == curses.KEY_DOWN:
                 if search_results:
                     selected_idx = min(selected_idx + 1, len(search_results) - 1)
@@ -643,28 +4503,38 @@ def chest_tui(stdscr):
             elif key in [curses.KEY_ENTER, 10, 13] and search_results:
                 # Edit selected search result
                 chest_id, _ = search_results[selected_idx]
+                if loading is not None and not loading.has_chest(chest_id):
+                    notice = f"{chest_id} is still loading"
+                    continue
                 curses.echo()
                 stdscr.addstr(curses.LINES - 3, 2, "Enter new label: ")
                 stdscr.clrtoeol()
                 try:
                     label = stdscr.getstr(curses.LINES - 3, 18, 50).decode('utf-8')
-                    data[chest_id] = label
-                    save_data(data)
+                    set_chest(data, chest_id, Chest(label))
+                    notice = _save_from_tui(data)
                     # Update search results
-                    search_results = search_chests(data, search_query)
-                except:
-                    pass
+                    search_results = run_search(data, search_query, fuzzy_mode)
+                except (ValueError, KeyError) as e:
+                    notice = f"Could not relabel {chest_id}: {e}"
                 curses.noecho()
+                screen.forget(curses.LINES - 3)
         else:
             # Normal navigation mode
             if key == curses.KEY_RIGHT:
-                walls = list(chests.keys())
-                current_wall = walls[(walls.index(current_wall) + 1) % len(walls)]
+                current_wall = wall_order[(wall_positions[current_wall] + 1) % len(wall_order)]
                 selected_idx = 0
                 view_offset = 0
             elif key == curses.KEY_LEFT:
-                walls = list(chests.keys())
-                current_wall = walls[(walls.index(current_wall) - 1) % len(walls)]
+                current_wall = wall_order[(wall_positions[current_wall] - 1) % len(wall_order)]
+                selected_idx = 0
+                view_offset = 0
+            elif key in [ord('['), ord(']')] and len(rooms) > 1:
+                # Jump to the first wall of the previous/next room
+                room_names = list(rooms)
+                step = 1 if key == ord(']') else -1
+                room = room_names[(room_names.index(wall_rooms[current_wall]) + step) % len(room_names)]
+                current_wall = rooms[room][0]
                 selected_idx = 0
                 view_offset = 0
             elif key == curses.KEY_DOWN:
@@ -693,40 +4563,380 @@ def chest_tui(stdscr):
             elif key == curses.KEY_PPAGE:  # Page Up
                 selected_idx = max(selected_idx - max_display_lines, 0)
                 view_offset = max(view_offset - max_display_lines, 0)
+            elif key == curses.KEY_HOME:
+                selected_idx = 0
+                view_offset = 0
+            elif key == curses.KEY_END:
+                selected_idx = len(chests[current_wall]) - 1
+                view_offset = max(0, len(chests[current_wall]) - max_display_lines)
+            elif key in [curses.KEY_ENTER, 10, 13, ord('d'), ord('D')] and wall_loading:
+                notice = f"Wall {current_wall} is still loading"
             elif key in [curses.KEY_ENTER, 10, 13]:
                 chest_id = chests[current_wall][selected_idx]
-                # Initialize slot data if it doesn't exist
-                if chest_id not in data:
-                    data[chest_id] = {}
-                elif isinstance(data[chest_id], str):
-                    # Convert old string format to slot format
-                    data[chest_id] = {}
-                
-                # Convert string keys to integers for slot data
-                slot_data = {}
-                if isinstance(data[chest_id], dict):
-                    for key, value in data[chest_id].items():
-                        # Convert string keys to int keys
-                        try:
-                            int_key = int(key)
-                            slot_data[int_key] = tuple(value) if isinstance(value, list) else value
-                        except (ValueError, TypeError):
-                            # Skip invalid keys
-                            pass
                 
-                edit_item_in_slot(stdscr, chest_id, slot_data)
-                
-                # Convert back to string keys for JSON storage
-                data[chest_id] = {str(k): list(v) if isinstance(v, tuple) else v for k, v in slot_data.items()}
-                save_data(data)
+                # Slot edits go straight into data; an old label chest becomes
+                # a slot chest once a slot is filled
+                edit_item_in_slot(stdscr, data, chest_id)
+                screen.invalidate()
+                notice = _save_from_tui(data)
+            elif key in [ord('t'), ord('T')]:
+                item_totals_view(stdscr, data)
+                screen.invalidate()
+            elif key in [ord('b'), ord('B')]:
+                materials_view(stdscr, data)
+                screen.invalidate()
+            elif key in [ord('u'), ord('r')]:
+                notice = _undo_from_tui(data, key == ord('r'))
+            elif key == ord('A') and partial_load:
+                accept_partial_load()
+                notice = f"{SAVE_FILE} will be rewritten without the chests that could not be read"
             elif key in [ord('d'), ord('D')]:
                 # Delete/clear current chest
                 chest_id = chests[current_wall][selected_idx]
-                data[chest_id] = ""
-                save_data(data)
+                set_chest(data, chest_id, Chest(""))
+                notice = _save_from_tui(data)
 
-    save_data(data)
+    _save_from_tui(data)
+    stop_background_writer()
+
+def _exit_on_signal(signum, frame):
+    sys.exit(128 + signum)
+
+def _load_errors_summary(errors):
+    return (f"{len(errors)} chest(s) in {SAVE_FILE} could not be read fully;"
+            f" the file as read is kept in {SAVE_FILE}.unreadable")
+
+def _report_load_errors():
+    for chest_id, message in load_errors:
+        print(f"{chest_id}: {message}" if chest_id is not None else message, file=sys.stderr)
+    if load_errors:
+        print(_load_errors_summary(load_errors), file=sys.stderr)
+    if partial_load:
+        print(f"Changes go to {JOURNAL_FILE} only; --accept-partial lets {SAVE_FILE} be rewritten without those chests",
+              file=sys.stderr)
+
+def _report_batch(applied, errors, what):
+    for number, message in errors:
+        print(f"{what} {number}: {message}" if number is not None else message, file=sys.stderr)
+    if errors:
+        print(f"{len(errors)} invalid {what}(s), no changes applied", file=sys.stderr)
+        return 1
+    print(f"Applied {applied} command(s)")
+    return 0
+
+def _place_items(data, args):
+    if args.place == "-":
+        incoming, errors = parse_incoming(sys.stdin)
+    else:
+        with open(args.place, 'r') as f:
+            incoming, errors = parse_incoming(f)
+    try:
+        if errors:
+            raise ValueError("\n".join(f"line {line_no}: {message}" for line_no, message in errors))
+        placements, unplaced = plan_placements(data, incoming)
+        if args.apply and placements:
+            apply_placements(data, placements)
+    except (ValueError, StorageConflict) as e:
+        print(e, file=sys.stderr)
+        return 1
+    rows = [(chest_id, slot, item_name, added, new_qty, get_category_for_chest(chest_id))
+            for chest_id, slot, item_name, added, new_qty in placements]
+    _print_rows(rows, args.json, ("chest", "slot", "item", "added", "qty", "category"),
+                "{0} slot {1}: +{3} {2} (now {4}, {5})")
+    for item_name, qty in unplaced:
+        print(f"No room for {item_name} x{qty}", file=sys.stderr)
+    if args.apply:
+        print(f"Placed {len(placements)} stack(s)", file=sys.stderr)
+    return 1 if unplaced else 0
+
+def _check_materials(data, args):
+    try:
+        if args.materials == "-":
+            materials, errors = parse_incoming(sys.stdin)
+        else:
+            with open(args.materials, 'r') as f:
+                materials, errors = parse_incoming(f)
+        if errors:
+            raise ValueError("\n".join(f"line {line_no}: {message}" for line_no, message in errors))
+        recipes = read_recipes(args.recipes) if os.path.exists(args.recipes) else None
+        picks, crafts, shortfalls = check_materials(data, materials, recipes)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    if args.json:
+        print(json.dumps({"picks": [dict(zip(("chest", "slot", "item", "qty"), pick)) for pick in picks],
+                          "crafts": [dict(zip(("item", "times"), craft)) for craft in crafts],
+                          "shortfalls": [dict(zip(("item", "missing"), short)) for short in shortfalls]},
+                         ensure_ascii=False))
+    else:
+        _print_rows(picks, False, (), "{0} slot {1}: take {2} x{3}")
+        _print_rows(crafts, False, (), "Craft {0} x{1}")
+        print(f"{len(picks)} pick(s) from {len({pick[0] for pick in picks})} chest(s)", file=sys.stderr)
+    for item_name, missing in shortfalls:
+        print(f"Short of {item_name} x{missing}", file=sys.stderr)
+    return 1 if shortfalls else 0
+
+def _consolidate(data, args):
+    moves, emptied = plan_consolidation(data)
+    if args.apply and moves:
+        try:
+            apply_moves(data, moves)
+        except (ValueError, StorageConflict) as e:
+            print(e, file=sys.stderr)
+            return 1
+    if args.json:
+        print(json.dumps({"moves": [dict(zip(("from_chest", "from_slot", "to_chest", "to_slot", "item", "qty"), move))
+                                    for move in moves], "emptied": emptied}, ensure_ascii=False))
+        return 0
+    _print_rows(moves, False, (), "{0} slot {1} -> {2} slot {3}: {4} x{5}")
+    print(f"{'Made' if args.apply else 'Planned'} {len(moves)} move(s), emptying {len(emptied)} chest(s)"
+          + (f": {', '.join(emptied)}" if emptied else ""), file=sys.stderr)
+    return 0
+
+def _stack_text(stack):
+    return f"{stack[0]} x{stack[1]}" if stack else "(empty)"
+
+def _print_rows(rows, as_json, fields, text_format):
+    if as_json:
+        print(json.dumps([dict(zip(fields, row)) for row in rows], ensure_ascii=False))
+    else:
+        for row in rows:
+            print(text_format.format(*row))
+
+def main(argv=None):
+    import argparse
+    global STORAGE_BACKEND
+    parser = argparse.ArgumentParser(description="Minecraft storage tracker (runs the TUI unless an action is given)")
+    actions = parser.add_mutually_exclusive_group()
+    actions.add_argument("--batch", metavar="FILE",
+                         help="apply a file of UPD/REM/~/- commands ('-' for stdin) as one transaction")
+    actions.add_argument("--command", "-c", metavar="CMD", action="append",
+                         help="apply a UPD/REM/~/- command (repeat for several, applied as one transaction)")
+    actions.add_argument("--search", "-s", metavar="QUERY", help="list chests matching QUERY")
+    actions.add_argument("--fuzzy", "-f", metavar="QUERY", help="list chests ranked by a fuzzy match of QUERY")
+    actions.add_argument("--find", metavar="QUERY", help="list every stack whose item name contains QUERY")
+    actions.add_argument("--stats", action="store_true", help="show filled chests and item totals per wall")
+    actions.add_argument("--totals", metavar="ITEM", nargs="?", const="",
+                         help="show the total stored of every item, largest first, or of ITEM and where it is")
+    actions.add_argument("--migrate-sqlite", action="store_true",
+                         help=f"copy {SAVE_FILE} into {SQLITE_FILE} and exit")
+    actions.add_argument("--migrate-shards", action="store_true",
+                         help=f"split {SAVE_FILE} into per-wall files in {SHARD_DIR} and exit")
+    actions.add_argument("--write-layout", action="store_true",
+                         help=f"write the current layout to {LAYOUT_FILE} as a starting point and exit")
+    actions.add_argument("--serve", action="store_true",
+                         help="run the shared storage server that other TUIs and commands connect to")
+    actions.add_argument("--history", action="store_true",
+                         help="list the saved change groups in the kept history, newest last")
+    actions.add_argument("--diff", metavar="N", type=int, help="show what changed since saved change group N")
+    actions.add_argument("--restore", metavar="N", type=int,
+                         help="put the storage back to how it was after saved change group N")
+    actions.add_argument("--place", metavar="FILE",
+                         help="plan where the 'Item, qty[, category]' lines in FILE ('-' for stdin) go")
+    actions.add_argument("--materials", metavar="FILE",
+                         help="check the 'Item, qty' bill of materials in FILE ('-' for stdin) and list what to pick")
+    actions.add_argument("--export", metavar="FORMAT", choices=EXPORT_FORMATS,
+                         help=f"write one row per filled slot as {_join_choices(EXPORT_FORMATS)} to --output")
+    actions.add_argument("--consolidate", action="store_true",
+                         help="plan merging partial stacks and moving items back into their category")
+    actions.add_argument("--import-world", metavar="WORLD",
+                         help="replace the chests mapped in the import config with their contents in a world save")
+    parser.add_argument("--backend", choices=["json", "sqlite", "sharded"], default=STORAGE_BACKEND,
+                        help=f"storage backend ({SAVE_FILE}, {SQLITE_FILE}, or per-wall files in {SHARD_DIR})")
+    parser.add_argument("--layout", metavar="FILE",
+                        help=f"read rooms, walls and categories from FILE instead of {LAYOUT_FILE}")
+    parser.add_argument("--limit", type=int, metavar="N", help="show at most N search results")
+    parser.add_argument("--json", action="store_true", help="print query results as JSON")
+    parser.add_argument("--apply", action="store_true",
+                        help="carry out the --place or --consolidate plan instead of only listing it")
+    parser.add_argument("--accept-partial", action="store_true",
+                        help=f"let {SAVE_FILE} be rewritten (or migrated) without the chests that could not be read")
+    parser.add_argument("--recipes", metavar="FILE", default=RECIPES_FILE,
+                        help=f"crafting recipes for --materials, used if the file exists (default {RECIPES_FILE})")
+    parser.add_argument("--output", "-o", metavar="FILE", default="-", help="--export destination (default stdout)")
+    parser.add_argument("--wall", metavar="WALL", action="append", help="only export WALL (repeat for several)")
+    parser.add_argument("--category", metavar="NAME", help="only export the chests of category NAME")
+    parser.add_argument("--item", metavar="QUERY", help="only export items whose name contains QUERY")
+    parser.add_argument("--import-config", metavar="FILE", default=IMPORT_CONFIG_FILE,
+                        help=f"chest coordinate config for --import-world (default {IMPORT_CONFIG_FILE})")
+    parser.add_argument("--workers", type=int, metavar="N", help="processes reading region files (default: one per CPU)")
+    parser.add_argument("--socket", metavar="PATH", default=STORAGE_SOCKET,
+                        help=f"storage server socket, used whenever it exists (default {STORAGE_SOCKET})")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="time load/save/search/commands/frames and write the counters and histograms to FILE at exit")
+    args = parser.parse_args(argv)
+    
+    STORAGE_BACKEND = args.backend
+    layout_path = args.layout
+    if layout_path is None and not args.write_layout and os.path.exists(LAYOUT_FILE):
+        layout_path = LAYOUT_FILE
+    if layout_path is not None:
+        try:
+            configure_layout(*read_layout(layout_path))
+        except (OSError, ValueError) as e:
+            print(f"Could not load layout: {e}", file=sys.stderr)
+            return 2
+    if args.metrics is None:
+        return _run_action(args)
+    set_metrics_enabled(True)
+    try:
+        return _run_action(args)
+    finally:
+        write_metrics(args.metrics)
+
+def _run_action(args):
+    """Run the action selected on the command line (the TUI if none)."""
+    global storage_client
+    if args.write_layout:
+        if os.path.exists(LAYOUT_FILE):
+            print(f"{LAYOUT_FILE} already exists", file=sys.stderr)
+            return 1
+        with open(LAYOUT_FILE, 'w') as f:
+            json.dump(layout_to_json(), f, indent=2, ensure_ascii=False)
+        print(f"Wrote {LAYOUT_FILE}")
+        return 0
+    if args.migrate_sqlite or args.migrate_shards:
+        try:
+            if args.migrate_sqlite:
+                count = migrate_json_to_sqlite(args.accept_partial)
+                print(f"Migrated {count} chests to {SQLITE_FILE}")
+            else:
+                count = migrate_json_to_shards(args.accept_partial)
+                print(f"Migrated {count} chests to {SHARD_DIR}; use --backend sharded")
+        except ValueError as e:
+            print(f"{e}; nothing migrated (--accept-partial migrates the rest)", file=sys.stderr)
+            return 1
+        return 0
+    
+    import signal
+    # Terminal hang-ups and kills unwind normally, so pending saves are flushed
+    for signum in (signal.SIGTERM, getattr(signal, "SIGHUP", None)):
+        if signum is not None:
+            signal.signal(signum, _exit_on_signal)
+    if args.serve:
+        print(f"Serving storage on {args.socket}", file=sys.stderr)
+        try:
+            serve(args.socket)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            return 1
+        except KeyboardInterrupt:
+            pass
+        return 0
+    if os.path.exists(args.socket):
+        try:
+            storage_client = StorageClient(args.socket)
+        except OSError as e:
+            print(f"Storage server at {args.socket} not reachable ({e}); using the files directly",
+                  file=sys.stderr)
+    
+    if (args.batch is None and args.command is None and args.search is None and args.fuzzy is None
+            and args.find is None and not args.stats and args.totals is None and args.import_world is None
+            and not args.history and args.diff is None and args.restore is None and args.place is None
+            and not args.consolidate and args.materials is None and args.export is None):
+        import curses
+        try:
+            curses.wrapper(chest_tui)
+        except ConnectionError as e:
+            print(f"Lost the storage server: {e}", file=sys.stderr)
+            return 1
+        finally:
+            stop_background_writer()
+        return 0
+    
+    if (args.stats or args.find is not None) and _sqlite_queries(None) is not None:
+        data = None  # The SQLite tables answer these without loading the storage
+    else:
+        data = load_data()
+        if args.accept_partial and partial_load:
+            accept_partial_load()
+        _report_load_errors()
+    if args.import_world is not None:
+        try:
+            count, warnings = import_world(data, args.import_world, args.import_config, args.workers)
+        except (OSError, ValueError, StorageConflict) as e:
+            print(f"Import failed: {e}", file=sys.stderr)
+            return 1
+        for warning in warnings:
+            print(warning, file=sys.stderr)
+        print(f"Imported {count} chest(s) from {args.import_world}")
+        return 0
+    if args.place is not None:
+        return _place_items(data, args)
+    if args.consolidate:
+        return _consolidate(data, args)
+    if args.materials is not None:
+        return _check_materials(data, args)
+    if args.export is not None:
+        try:
+            count = export_data(data, args.output, args.export, args.wall, args.category, args.item)
+        except (OSError, ValueError) as e:
+            print(f"Export failed: {e}", file=sys.stderr)
+            return 1
+        if args.output != "-":
+            print(f"Exported {count} row(s) to {args.output}", file=sys.stderr)
+        return 0
+    if args.history:
+        rows = [(seq, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(saved_at)), changes)
+                for seq, saved_at, changes in history_entries()]
+        _print_rows(rows[-args.limit:] if args.limit else rows, args.json, ("group", "time", "changes"),
+                    "{0}: {1}, {2} change(s)")
+        return 0
+    if args.diff is not None or args.restore is not None:
+        try:
+            if args.restore is not None:
+                print(f"Restored {restore_history(data, args.restore)} chest(s) to change group {args.restore}")
+                return 0
+            rows = history_diff(data, args.diff)
+        except (ValueError, StorageConflict) as e:
+            print(e, file=sys.stderr)
+            return 1
+        if args.json:
+            _print_rows(rows, True, ("chest", "slot", "before", "after"), None)
+            return 0
+        for chest_id, slot, before, after in rows:
+            if slot is None:
+                print(f"{chest_id} label: {before!r} -> {after!r}")
+            else:
+                print(f"{chest_id} slot {slot}: {_stack_text(before)} -> {_stack_text(after)}")
+        return 0
+    if args.command is not None:
+        return _report_batch(*run_batch(args.command, data), "command")
+    if args.batch is not None:
+        if args.batch == "-":
+            return _report_batch(*run_batch(sys.stdin, data), "line")
+        with open(args.batch, 'r') as f:
+            return _report_batch(*run_batch(f, data), "line")
+    
+    if args.stats:
+        rows = [(wall, wall_rooms[wall]) + get_wall_stats(data, wall) for wall in wall_order]
+        _print_rows(rows, args.json, ("wall", "room", "filled_chests", "total_chests", "total_items"),
+                    "{0}: {2}/{3} chests, {4} items")
+    elif args.totals == "":
+        rows = item_totals(data, args.limit)
+        _print_rows(rows, args.json, ("item", "total", "chests"), "{0}: {1} in {2} chests")
+    elif args.totals is not None:
+        total, locations = item_ledger(data, args.totals)
+        if args.json:
+            print(json.dumps({"item": args.totals, "total": total,
+                              "locations": [dict(zip(("chest", "slot", "qty"), row)) for row in locations]},
+                             ensure_ascii=False))
+        else:
+            print(f"{args.totals}: {total} total")
+            _print_rows(locations[:args.limit], False, (), "  {0} slot {1}: x{2}")
+    elif args.find is not None:
+        rows = find_items(data, args.find)[:args.limit]
+        _print_rows(rows, args.json, ("chest", "slot", "item", "qty"), "{0} slot {1}: {2} x{3}")
+    else:
+        if args.fuzzy is not None:
+            results = fuzzy_search(data, args.fuzzy, args.limit)
+        else:
+            results = search_chests(data, args.search)[:args.limit]
+        rows = [(chest_id, label if args.json or label.strip() else "<empty>", get_category_for_chest(chest_id))
+                for chest_id, label in results]
+        _print_rows(rows, args.json, ("chest", "label", "category"), "{0}: {1} ({2})")
+    return 0
 
 if __name__ == "__main__":
-    curses.wrapper(chest_tui)
-    
\ No newline at end of file
+    sys.exit(main())
+    
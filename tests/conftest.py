@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+
+@pytest.fixture(autouse=True)
+def storage_dir(tmp_path, monkeypatch):
+    """Run each test in its own directory with the default layout and no loaded data."""
+    monkeypatch.chdir(tmp_path)
+    layout = ({name: list(walls) for name, walls in main.rooms.items()},
+              {wall: list(chest_ids) for wall, chest_ids in main.chests.items()},
+              {wall: list(ranges) for wall, ranges in main.categories.items()})
+    for name, value in (("STORAGE_BACKEND", "json"), ("storage_client", None), ("background_writer", None),
+                        ("sqlite_conn", None), ("progressive_load", None), ("journal", None),
+                        ("history", None), ("history_log", None), ("search_index", None),
+                        ("search_cache", None), ("chest_stats", None), ("load_errors", []),
+                        ("partial_load", False), ("partial_load_accepted", False)):
+        monkeypatch.setattr(main, name, value)
+    yield tmp_path
+    main.stop_background_writer()
+    if main.progressive_load is not None:
+        main.progressive_load.cancel()
+        main.progressive_load.thread.join()
+    if main.sqlite_conn is not None:
+        main.sqlite_conn.close()
+    main.configure_layout(*layout)
+
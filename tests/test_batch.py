@@ -0,0 +1,39 @@
+import main
+
+
+def test_batch_applies_every_line_and_saves_once():
+    data = main.load_data()
+    lines = ["# restock", "", "UPD:A:01:0:(Stone, 64)", "~:A:1:1:(Cobblestone, 5)", "-:A:01:0"]
+    assert main.run_batch(lines, data) == (3, [])
+    assert main.chest_to_json(data["A01"]) == {"1": ["Cobblestone", 5]}
+    assert len(main._read_journal(main.JOURNAL_FILE)) == 3
+    assert main.chest_to_json(main.load_data()["A01"]) == {"1": ["Cobblestone", 5]}
+
+
+def test_batch_with_a_bad_line_changes_nothing():
+    data = main.load_data()
+    lines = ["UPD:A:01:0:(Stone, 64)", "UPD:Z:01:0:(Dirt, 1)", "UPD:A:01:99:(Dirt, 1)"]
+    applied, errors = main.run_batch(lines, data)
+    assert applied == 0
+    assert [line_no for line_no, _ in errors] == [2, 3]
+    assert "A01" not in data
+    assert main._read_journal(main.JOURNAL_FILE) == []
+
+
+def test_remove_is_checked_against_earlier_lines():
+    data = main.load_data()
+    ok = ["UPD:B:02:3:(Iron Ingot, 8)", "REM:B:02:3"]
+    assert main.run_batch(ok, data) == (2, [])
+
+    twice = ["UPD:B:02:3:(Iron Ingot, 8)", "REM:B:02:3", "REM:B:02:3"]
+    applied, errors = main.run_batch(twice, data)
+    assert applied == 0
+    assert errors == [(3, "Slot 3 in B02 is already empty")]
+    assert not any(data["B02"].items)
+
+
+def test_remove_from_a_label_chest_is_rejected():
+    main._write_snapshot({"A05": "old notes"})
+    data = main.load_data()
+    assert main.run_batch(["REM:A:05:0"], data) == (0, [(1, "Chest A05 has no items to remove")])
+    assert data["A05"].label == "old notes"
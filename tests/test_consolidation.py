@@ -0,0 +1,50 @@
+import pytest
+
+import main
+
+
+def _stacks(data, item_name):
+    return sorted((chest_id, slot, qty) for chest_id, slot, _, qty in main.find_items(data, item_name))
+
+
+def test_scattered_stacks_are_merged_at_home():
+    main._write_snapshot({"B02": {"0": ["Iron Ingot", 10]},
+                          "B03": {"5": ["Iron Ingot", 20], "6": ["Gold Ingot", 64]},
+                          "A31": {"0": ["Iron Ingot", 5]}})
+    data = main.load_data()
+    moves, emptied = main.plan_consolidation(data)
+    assert emptied == ["A31", "B02"]  # B03 is the fuller chest, so its stack is kept
+    assert _stacks(data, "Iron Ingot") == [("A31", 0, 5), ("B02", 0, 10), ("B03", 5, 20)]  # Planning changes nothing
+
+    assert main.apply_moves(data, moves) == len(moves)
+    stacks = _stacks(data, "Iron Ingot")
+    assert len(stacks) == 1 and stacks[0][2] == 35
+    assert main.chest_categories[stacks[0][0]] == "Ores & Ingots"
+    assert _stacks(data, "Gold Ingot") == [("B03", 6, 64)]
+    assert _stacks(main.load_data(), "Iron Ingot") == stacks
+
+
+def test_full_stacks_stay_and_partials_merge():
+    main._write_snapshot({"A01": {"0": ["Stone", 64], "1": ["Stone", 20], "2": ["Stone", 20]}})
+    data = main.load_data()
+    moves, emptied = main.plan_consolidation(data)
+    main.apply_moves(data, moves)
+    assert [qty for _, _, qty in _stacks(data, "Stone")] == [64, 40]
+    assert emptied == []
+
+
+def test_nothing_to_do_when_already_consolidated():
+    main._write_snapshot({"A01": {"0": ["Stone", 64], "1": ["Stone", 3]}})
+    assert main.plan_consolidation(main.load_data()) == ([], [])
+
+
+def test_stale_moves_change_nothing():
+    main._write_snapshot({"B02": {"0": ["Iron Ingot", 10]}, "B03": {"0": ["Iron Ingot", 20]}})
+    data = main.load_data()
+    moves, _ = main.plan_consolidation(data)
+    main.set_slot(data, moves[0][0], moves[0][1], "Iron Ingot", 1)
+    main.save_data(data)
+    before = main.data_to_json(data)
+    with pytest.raises(ValueError, match="no longer holds"):
+        main.apply_moves(data, moves)
+    assert main.data_to_json(data) == before
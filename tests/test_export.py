@@ -0,0 +1,82 @@
+import csv
+import io
+import json
+import os
+
+import pytest
+
+import main
+
+RAW = {
+    "A01": {"3": ["Stone", 64], "0": ["Cobblestone", 5]},
+    "A02": "old label",
+    "B02": {"1": ["Iron Ingot", 30], "2": ["Gold Ingot", 7]},
+    "C01": {"0": ["Wheat — bundled, \"dry\"", 12]},
+    "Z9": {"4": ["Stick", 4294967295]},
+}
+ROWS = [
+    ("A", "A01", "Stone", 0, "Cobblestone", 5),
+    ("A", "A01", "Stone", 3, "Stone", 64),
+    ("B", "B02", "Ores & Ingots", 1, "Iron Ingot", 30),
+    ("B", "B02", "Ores & Ingots", 2, "Gold Ingot", 7),
+    ("C", "C01", "Crops", 0, "Wheat — bundled, \"dry\"", 12),
+    ("", "Z9", "", 4, "Stick", 4294967295),
+]
+
+
+@pytest.fixture
+def data():
+    main._write_snapshot(RAW)
+    return main.load_data()
+
+
+def test_rows_and_filters(data):
+    assert list(main.export_rows(data)) == ROWS
+    assert list(main.export_rows(data, walls=["b"])) == ROWS[2:4]
+    assert list(main.export_rows(data, category="crops")) == ROWS[4:5]
+    assert list(main.export_rows(data, item="INGOT")) == ROWS[2:4]
+    with pytest.raises(ValueError, match="Unknown wall"):
+        main.export_rows(data, walls=["Q"])
+    with pytest.raises(ValueError, match="Unknown category"):
+        main.export_rows(data, category="Nowhere")
+
+
+def test_csv_round_trip(data):
+    assert main.export_data(data, "out.csv", "csv") == len(ROWS)
+    with open("out.csv", newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == list(main.EXPORT_FIELDS)
+    assert [(w, c, cat, int(s), i, int(q)) for w, c, cat, s, i, q in rows[1:]] == ROWS
+
+
+def test_jsonl_round_trip(data):
+    assert main.export_data(data, "out.jsonl", "jsonl") == len(ROWS)
+    with open("out.jsonl", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    assert [tuple(row[field] for field in main.EXPORT_FIELDS) for row in rows] == ROWS
+
+
+def test_columnar_round_trip_across_chunks(data, monkeypatch):
+    monkeypatch.setattr(main, "EXPORT_CHUNK_ROWS", 4)
+    assert main.export_data(data, "out.col", "columnar") == len(ROWS)
+    with open("out.col", "rb") as f:
+        assert list(main.read_columnar(f)) == ROWS
+
+
+def test_columnar_rejects_damaged_files(data):
+    buf = io.BytesIO()
+    main.write_columnar(main.export_rows(data), buf)
+    with pytest.raises(ValueError, match="truncated"):
+        list(main.read_columnar(io.BytesIO(buf.getvalue()[:-10])))
+    with pytest.raises(ValueError, match="Not a columnar"):
+        list(main.read_columnar(io.BytesIO(b"PK\x03\x04")))
+
+
+def test_failed_export_leaves_no_file(data, monkeypatch):
+    def fail(rows, f):
+        f.write("partial")
+        raise OSError("disk full")
+    monkeypatch.setitem(main.EXPORT_WRITERS, "csv", fail)
+    with pytest.raises(OSError):
+        main.export_data(data, "out.csv", "csv")
+    assert not os.path.exists("out.csv") and not os.path.exists("out.csv.tmp")
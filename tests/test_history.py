@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+import main
+
+
+def test_undo_and_redo_saved_groups():
+    main._write_snapshot({"A01": {"0": ["Stone", 5]}, "A02": "notes"})
+    data = main.load_data()
+    main.set_slot(data, "A01", 0, "Stone", 9)
+    main.set_slot(data, "A01", 1, "Dirt", 2)
+    main.save_data(data)
+    main.set_slot(data, "A02", 0, "Sand", 1)  # Label chest becomes a slot chest
+    main.save_data(data)
+
+    assert main.undo(data) == 1
+    assert data["A02"].label == "notes"
+    assert main.undo(data) == 2
+    assert main.chest_to_json(data["A01"]) == {"0": ["Stone", 5]}
+    assert main.undo(data) == 0
+
+    assert main.redo(data) == 2
+    assert main.chest_to_json(data["A01"]) == {"0": ["Stone", 9], "1": ["Dirt", 2]}
+    # Undone changes are saved like any other
+    assert main.data_to_json(main.load_data()) == {"A01": {"0": ["Stone", 9], "1": ["Dirt", 2]}, "A02": "notes"}
+
+
+def test_new_change_drops_the_redo_stack():
+    data = main.load_data()
+    main.set_slot(data, "B01", 0, "Coal", 3)
+    main.save_data(data)
+    main.undo(data)
+    main.set_slot(data, "B01", 1, "Coal", 4)
+    main.save_data(data)
+    assert main.redo(data) == 0
+    assert main.chest_to_json(data["B01"]) == {"1": ["Coal", 4]}
+
+
+def test_history_entries_state_diff_and_restore():
+    main._write_snapshot({"A01": {"0": ["Stone", 5]}})
+    data = main.load_data()
+    main.set_slot(data, "A01", 0, "Stone", 6)
+    main.save_data(data)
+    main.set_chest(data, "A01", main.Chest("moved"))
+    main.save_data(data)
+
+    assert [(seq, count) for seq, _, count in main.history_entries()] == [(1, 1), (2, 1)]
+    assert main.data_to_json(main.history_state(0)) == {"A01": {"0": ["Stone", 5]}}
+    assert main.data_to_json(main.history_state(1)) == {"A01": {"0": ["Stone", 6]}}
+    assert main.history_diff(data, 0, 1) == [("A01", 0, ("Stone", 5), ("Stone", 6))]
+    assert main.history_diff(data, 1) == [("A01", None, None, "moved"), ("A01", 0, ("Stone", 6), None)]
+
+    assert main.restore_history(data, 0) == 1
+    assert main.chest_to_json(data["A01"]) == {"0": ["Stone", 5]}
+    assert main.undo(data) == 1
+    assert data["A01"].label == "moved"
+    with pytest.raises(ValueError):
+        main.history_state(99)
+
+
+def test_segments_are_rolled_and_pruned(monkeypatch):
+    monkeypatch.setattr(main, "HISTORY_SEGMENT_GROUPS", 2)
+    monkeypatch.setattr(main, "HISTORY_SEGMENTS_KEPT", 2)
+    data = main.load_data()
+    for qty in range(1, 8):
+        main.set_slot(data, "C01", 0, "Wheat", qty)
+        main.save_data(data)
+
+    assert main._history_segments() == [4, 6]
+    assert [seq for seq, _, _ in main.history_entries()] == [5, 6, 7]
+    assert main.chest_to_json(main.history_state(5)["C01"]) == {"0": ["Wheat", 5]}
+    with pytest.raises(ValueError, match="older than the kept history"):
+        main.history_state(3)
+
+
+def test_torn_history_line_is_cut_off_on_the_next_load():
+    data = main.load_data()
+    main.set_slot(data, "C01", 0, "Wheat", 1)
+    main.save_data(data)
+    path = main._history_path(0, "groups.jsonl")
+    with open(path, "a") as f:
+        f.write('{"seq": 2, "t"')
+
+    data = main.load_data()
+    main.set_slot(data, "C01", 0, "Wheat", 2)
+    main.save_data(data)
+    assert [seq for seq, _, _ in main.history_entries()] == [1, 2]
+    with open(path) as f:
+        assert [json.loads(line)["seq"] for line in f] == [1, 2]
+    assert main.chest_to_json(main.history_state(2)["C01"]) == {"0": ["Wheat", 2]}
@@ -0,0 +1,83 @@
+import json
+import os
+
+import main
+
+
+def test_saves_append_to_the_journal_and_replay_on_load():
+    data = main.load_data()
+    main.set_slot(data, "A01", 0, "Stone", 64)
+    main.save_data(data)
+    main.set_slot(data, "A01", 1, "Cobblestone", 12)
+    main.clear_slot(data, "A01", 0)
+    main.save_data(data)
+
+    assert not os.path.exists(main.SAVE_FILE)
+    assert len(main._read_journal(main.JOURNAL_FILE)) == 3
+    data = main.load_data()
+    assert main.chest_to_json(data["A01"]) == {"1": ["Cobblestone", 12]}
+
+
+def test_torn_last_line_is_cut_off():
+    main._write_snapshot({"A01": {"0": ["Stone", 1]}})
+    main._append_journal([["U", "A01", "0", "Stone", 5]])
+    with open(main.JOURNAL_FILE, 'a') as f:
+        f.write('["U","A01","1","Dirt"')  # Crash mid-write
+    good_size = len(json.dumps(["U", "A01", "0", "Stone", 5], separators=(',', ':'))) + 1
+
+    data = main.load_data()
+    assert main.chest_to_json(data["A01"]) == {"0": ["Stone", 5]}
+    assert os.path.getsize(main.JOURNAL_FILE) == good_size
+
+    main.set_slot(data, "A01", 2, "Sand", 3)
+    main.save_data(data)
+    assert main.chest_to_json(main.load_data()["A01"]) == {"0": ["Stone", 5], "2": ["Sand", 3]}
+
+
+def test_corrupt_line_ends_the_journal():
+    with open(main.JOURNAL_FILE, 'w') as f:
+        f.write('["U","A01","0","Stone",5]\n')
+        f.write('not json\n')
+        f.write('["U","A01","1","Dirt",2]\n')
+    assert main._read_journal(main.JOURNAL_FILE) == [["U", "A01", "0", "Stone", 5]]
+    with open(main.JOURNAL_FILE) as f:
+        assert f.read() == '["U","A01","0","Stone",5]\n'
+
+
+def test_group_with_a_bad_record_is_not_replayed():
+    with open(main.JOURNAL_FILE, 'w') as f:
+        f.write('["G",[["U","A01","0","Stone",5],["U","A01","99","Dirt",2]]]\n')
+    assert main._read_journal(main.JOURNAL_FILE) == []
+    assert os.path.getsize(main.JOURNAL_FILE) == 0
+
+
+def test_save_of_several_changes_is_one_group_line():
+    data = main.load_data()
+    main.set_slot(data, "B02", 0, "Iron Ingot", 10)
+    main.set_slot(data, "B02", 1, "Gold Ingot", 4)
+    main.save_data(data)
+    with open(main.JOURNAL_FILE) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])[0] == "G"
+
+
+def test_journal_is_compacted_after_enough_records(monkeypatch):
+    monkeypatch.setattr(main, "JOURNAL_COMPACT_RECORDS", 3)
+    data = main.load_data()
+    for slot in range(3):
+        main.set_slot(data, "A02", slot, "Stone", slot + 1)
+        main.save_data(data)
+
+    assert os.path.getsize(main.JOURNAL_FILE) == 0
+    with open(main.SAVE_FILE) as f:
+        assert json.load(f) == {"A02": {"0": ["Stone", 1], "1": ["Stone", 2], "2": ["Stone", 3]}}
+
+
+def test_background_writer_persists_saves():
+    data = main.load_data()
+    main.start_background_writer()
+    main.set_slot(data, "C01", 5, "Wheat", 20)
+    main.save_data(data)
+    main.stop_background_writer()
+    assert main.chest_to_json(main.load_data()["C01"]) == {"5": ["Wheat", 20]}
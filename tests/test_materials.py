@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+import main
+
+
+def test_picks_come_from_as_few_chests_as_possible():
+    main._write_snapshot({"A01": {"0": ["Stone", 64], "1": ["Stone", 40]}, "A02": {"0": ["Stone", 64]},
+                          "A31": {"0": ["Dirt", 10]}})
+    picks, crafts, shortfalls = main.check_materials(main.load_data(), [("stone", 100), ("Dirt", 4)])
+    assert picks == [("A01", 0, "Stone", 64), ("A01", 1, "Stone", 36), ("A31", 0, "Dirt", 4)]
+    assert crafts == [] and shortfalls == []
+
+
+def test_short_items_are_crafted_from_stock_first():
+    main._write_snapshot({"A17": {"0": ["Oak Log", 10]}, "A19": {"0": ["Oak Planks", 2]}})
+    recipes = {"Oak Planks": (4, {"Oak Log": 1}), "Stick": (4, {"Oak Planks": 2})}
+    picks, crafts, shortfalls = main.check_materials(main.load_data(), [("Stick", 8), ("Oak Planks", 6)], recipes)
+    # 8 sticks take 4 planks; with the 6 asked for that is 10, 2 of them in stock
+    assert crafts == [("Stick", 2), ("Oak Planks", 2)]
+    assert sorted(picks) == [("A17", 0, "Oak Log", 2), ("A19", 0, "Oak Planks", 2)]
+    assert shortfalls == []
+
+
+def test_missing_items_are_shortfalls():
+    main._write_snapshot({"B05": {"0": ["Diamond", 3]}})
+    recipes = {"Diamond Block": (1, {"Diamond": 9})}
+    picks, crafts, shortfalls = main.check_materials(main.load_data(), [("Diamond Block", 1), ("Emerald", 2)], recipes)
+    assert picks == [("B05", 0, "Diamond", 3)]
+    assert crafts == [("Diamond Block", 1)]
+    assert sorted(shortfalls) == [("Diamond", 6), ("Emerald", 2)]
+
+
+def test_recipe_loops_are_errors():
+    recipes = {"Iron Block": (1, {"Iron Ingot": 9}), "Iron Ingot": (9, {"Iron Block": 1})}
+    with pytest.raises(ValueError, match="Recipe loop"):
+        main.check_materials(main.load_data(), [("Iron Block", 1)], recipes)
+
+
+def test_read_recipes():
+    with open(main.RECIPES_FILE, "w") as f:
+        json.dump({"Torch": {"makes": 4, "from": {"Coal": 1, "Stick": 1}}, "Stick": {"from": {"Oak Planks": 2}}}, f)
+    assert main.read_recipes() == {"Torch": (4, {"Coal": 1, "Stick": 1}), "Stick": (1, {"Oak Planks": 2})}
+    with open(main.RECIPES_FILE, "w") as f:
+        json.dump({"Torch": {"makes": 0, "from": {"Coal": 1}}}, f)
+    with pytest.raises(ValueError, match="Torch"):
+        main.read_recipes()
@@ -0,0 +1,58 @@
+import pytest
+
+import main
+
+
+def test_partial_stacks_are_topped_up_before_empty_slots():
+    main._write_snapshot({"B02": {"0": ["Iron Ingot", 30], "1": ["Gold Ingot", 64]}})
+    data = main.load_data()
+    placements, unplaced = main.plan_placements(data, [("Iron Ingot", 40)])
+    assert placements == [("B02", 0, "Iron Ingot", 34, 64), ("B02", 2, "Iron Ingot", 6, 6)]
+    assert unplaced == []
+    assert main.chest_to_json(data["B02"])["0"] == ["Iron Ingot", 30]  # Planning changes nothing
+
+
+def test_later_entries_top_up_stacks_earlier_entries_opened():
+    data = main.load_data()
+    placements, _ = main.plan_placements(data, [("Iron Ingot", 10, "Ores & Ingots"), ("Iron Ingot", 20)])
+    assert placements == [("B02", 0, "Iron Ingot", 10, 10), ("B02", 0, "Iron Ingot", 20, 30)]
+    assert main.apply_placements(data, placements) == 2
+    assert main.chest_to_json(main.load_data()["B02"]) == {"0": ["Iron Ingot", 30]}
+
+
+def test_earlier_entries_stacks_are_not_topped_up_twice():
+    main._write_snapshot({"B02": {"0": ["Iron Ingot", 60]}})
+    data = main.load_data()
+    placements, _ = main.plan_placements(data, [("Iron Ingot", 10, "Ores & Ingots"), ("Iron Ingot", 10)])
+    slots = {}
+    for chest_id, slot, item_name, added, new_qty in placements:
+        assert new_qty == slots.get((chest_id, slot), 60 if (chest_id, slot) == ("B02", 0) else 0) + added
+        assert new_qty <= 64
+        slots[(chest_id, slot)] = new_qty
+    assert sum(qty for qty in slots.values()) == 80
+
+
+def test_tools_take_one_slot_each():
+    data = main.load_data()
+    placements, unplaced = main.plan_placements(data, [("Diamond Pickaxe", 3, "Pickaxes")])
+    assert [(chest_id, added) for chest_id, _, _, added, _ in placements] == [("B06", 1)] * 3
+    assert len({slot for _, slot, _, _, _ in placements}) == 3
+
+
+def test_what_does_not_fit_is_unplaced():
+    main.configure_layout({"Main": ["A"]}, {"A": ["A01"]}, {"A": [("A01", "Stone")]})
+    data = main.load_data()
+    placements, unplaced = main.plan_placements(data, [("Stone", 54 * 64 + 5)])
+    assert len(placements) == 54
+    assert unplaced == [("Stone", 5)]
+
+
+def test_unknown_category_is_an_error():
+    with pytest.raises(ValueError, match="Unknown category"):
+        main.plan_placements(main.load_data(), [("Stone", 1, "Nowhere")])
+
+
+def test_parse_incoming():
+    incoming, errors = main.parse_incoming(["# delivery", "Stone, 64", "Iron Ingot, 9, Ores & Ingots", "Dirt", "Sand, 0"])
+    assert incoming == [("Stone", 64), ("Iron Ingot", 9, "Ores & Ingots")]
+    assert [line_no for line_no, _ in errors] == [4, 5]
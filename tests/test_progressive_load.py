@@ -0,0 +1,167 @@
+import io
+import json
+import re
+import threading
+
+import pytest
+
+import main
+
+CHEST_IDS = [chest_id for wall in ("A", "B", "C", "D") for chest_id in main.chests[wall]]
+RAW = {chest_id: {str(slot): [f"Item {i % 7}", i + slot + 1] for slot in range(3)}
+       for i, chest_id in enumerate(CHEST_IDS)}
+STRAY = "B10"  # Gets a stray "}" that would end the object early
+
+
+def _snapshot_text(raw=RAW):
+    main._write_snapshot(raw)
+    with open(main.SAVE_FILE) as f:
+        return f.read()
+
+
+def _with_stray_brace():
+    text = _snapshot_text()
+    start = text.index(f'"{STRAY}": {{') + len(f'"{STRAY}": {{')
+    text = text[:start] + "}}}" + text[start:]
+    with open(main.SAVE_FILE, "w") as f:
+        f.write(text)
+    return text, start + 2  # The brace after the one closing the object
+
+
+def _where(text, pos):
+    line = text.count("\n", 0, pos) + 1
+    return f"line {line} column {pos - text.rfind(chr(10), 0, pos)} (char {pos})"
+
+
+def _load(progressive):
+    data = main.load_data(progressive=progressive)
+    if progressive:
+        while not main.loading_data(data).merge(1):
+            pass
+    return data
+
+
+@pytest.mark.parametrize("chunk_chars", [main.LOAD_CHUNK_CHARS, 64, 7])
+def test_stray_brace_is_reported_and_parsing_resyncs(monkeypatch, chunk_chars):
+    monkeypatch.setattr(main, "LOAD_CHUNK_CHARS", chunk_chars)
+    text, extra = _with_stray_brace()
+    entries = list(main._iter_snapshot(io.StringIO(text).read))
+    assert [(chest_id, problem) for chest_id, _, problem in entries if problem] == [
+        (STRAY, f"Extra data at {_where(text, extra)}")]
+    assert {chest_id: value for chest_id, value, problem in entries if not problem} == \
+        {chest_id: value for chest_id, value in RAW.items() if chest_id != STRAY}
+
+
+def test_trailing_data_and_missing_end(monkeypatch):
+    text = _snapshot_text()
+    entries = list(main._iter_snapshot(io.StringIO(text + "\n}x").read))
+    assert len(entries) == len(RAW) + 1
+    assert entries[-1] == (None, None, f"Extra data at {_where(text + chr(10) + '}x', len(text) + 1)}")
+
+    # Cut off after a chest: the rest of the file is missing
+    entries = list(main._iter_snapshot(io.StringIO(text[:text.index('"D30"')]).read))
+    assert len(entries) == len(RAW)
+    assert entries[-1] == (None, None, "storage_data.json ends before its closing '}'")
+    # Cut off at the closing brace: the last chest can't be told complete
+    entries = list(main._iter_snapshot(io.StringIO(text[:-1]).read))
+    assert len(entries) == len(RAW)
+    assert entries[-1][:2] == ("D30", None)
+    assert entries[-1][2].startswith("Expecting ',' delimiter at line ")
+
+
+def test_malformed_chest_message_reads_like_json():
+    text = _snapshot_text().replace('"Item 3",', '"Item 3"', 1)
+    problems = [problem for _, _, problem in main._iter_snapshot(io.StringIO(text).read) if problem]
+    assert len(problems) == 1
+    assert re.fullmatch(r"Expecting ',' delimiter at line \d+ column \d+ \(char \d+\)", problems[0])
+
+
+@pytest.mark.parametrize("progressive", [False, True])
+def test_partial_load_is_not_written_back(monkeypatch, progressive):
+    text, _ = _with_stray_brace()
+    monkeypatch.setattr(main, "JOURNAL_COMPACT_RECORDS", 1)
+    data = _load(progressive)
+
+    assert len(data) == len(RAW) - 1 and STRAY not in data
+    assert [chest_id for chest_id, _ in main.load_errors] == [STRAY]
+    assert main.partial_load
+    with open(main.SAVE_FILE + ".unreadable") as f:
+        assert f.read() == text
+
+    main.set_slot(data, "A01", 10, "Torch", 1)
+    main.save_data(data)
+    with pytest.raises(ValueError, match="accept_partial_load"):
+        main.compact_data(data)
+    main.start_background_writer()
+    main.set_slot(data, "A01", 11, "Torch", 2)
+    main.save_data(data)
+    main.stop_background_writer()
+    with open(main.SAVE_FILE) as f:
+        assert f.read() == text
+    with pytest.raises(ValueError):
+        main.migrate_json_to_shards()
+
+    data = main.load_data()
+    assert main.chest_to_json(data["A01"])["11"] == ["Torch", 2]
+    main.accept_partial_load()
+    main.compact_data(data)
+    with open(main.SAVE_FILE) as f:
+        assert len(json.load(f)) == len(RAW) - 1
+    assert not main.partial_load
+    data = main.load_data()
+    assert main.load_errors == [] and not main.partial_load
+
+
+def test_progressive_load_matches_a_full_load():
+    main._write_snapshot(RAW)
+    main._append_journal([["U", "A01", "9", "Torch", 4], ["C", "C05", "notes"], ["U", "X1", "0", "Stick", 1]])
+    expected = main.data_to_json(_load(False))
+    data = _load(True)
+    assert main.data_to_json(data) == expected
+    assert not data.unloaded and main.loading_data(data) is None
+    assert main.get_wall_stats(data, "C") == main.get_wall_stats(main.data_from_json(expected), "C")
+    assert main.search_chests(data, "notes") == [("C05", "notes")]
+
+
+def test_chests_out_of_walk_order_all_load():
+    ids = list(RAW)
+    ids = ids[::2] + ids[1::2]
+    with open(main.SAVE_FILE, "w") as f:
+        json.dump({chest_id: RAW[chest_id] for chest_id in ids}, f, indent=2)
+    main._append_journal([["U", "A02", "20", "Torch", 1]])
+    data = _load(True)
+    assert main.load_errors == [] and not main.partial_load
+    assert main.chest_to_json(data["A02"]) == dict(RAW["A02"], **{"20": ["Torch", 1]})
+    assert len(data) == len(RAW)
+
+
+@pytest.mark.parametrize("changed", [False, True])
+def test_chest_read_after_its_wall_was_shown(changed):
+    main._append_journal([["U", "A02", "5", "Dirt", 1]])
+    data = main.load_data(progressive=True)  # No SAVE_FILE: entries are fed in by hand
+    load = main.loading_data(data)
+    load.thread.join()
+    gate = threading.Event()
+    load.thread = threading.Thread(target=gate.wait)  # Still "parsing" until the gate opens
+    load.thread.start()
+    try:
+        load.parsed.extend([("A01", {"0": ["Stone", 1]}, None), ("B01", {"0": ["Coal", 2]}, None)])
+        assert not load.merge(1)
+        assert load.has_chest("A02")  # Wall A is complete: A02 shown from the journal alone
+        assert main.chest_to_json(data["A02"]) == {"5": ["Dirt", 1]}
+        if changed:
+            main.set_slot(data, "A02", 6, "Sand", 2)
+        load.parsed.append(("A02", {"0": ["Stone", 3]}, None))
+    finally:
+        gate.set()
+        load.thread.join()
+    assert load.merge(1)
+
+    if changed:
+        assert main.chest_to_json(data["A02"]) == {"5": ["Dirt", 1], "6": ["Sand", 2]}
+        assert main.load_errors == [("A02", "read after its wall was shown, kept the chest as shown")]
+        assert main.partial_load
+    else:
+        assert main.chest_to_json(data["A02"]) == {"0": ["Stone", 3], "5": ["Dirt", 1]}
+        assert main.load_errors == [] and not main.partial_load
+    assert [chest_id for chest_id, _ in main.search_chests(data, "stone")] == (["A01"] if changed else ["A01", "A02"])
@@ -0,0 +1,38 @@
+import main
+
+
+def test_labels_list_items_in_the_order_they_were_stored():
+    data = main.load_data()
+    main.set_slot(data, "B02", 5, "Iron Ingot", 3)
+    main.set_slot(data, "B02", 0, "Iron Nugget", 9)
+    main.set_slot(data, "B02", 2, "Iron Block", 1)
+    main.save_data(data)
+    assert main.search_chests(data, "iron") == [("B02", "Iron Ingot, Iron Nugget, Iron Block")]
+    assert main.search_chests(main.load_data(), "iron") == [("B02", "Iron Ingot, Iron Nugget, Iron Block")]
+
+    data = main.load_data()
+    main.clear_slot(data, "B02", 5)
+    main.set_slot(data, "B02", 5, "Iron Ore", 2)  # Refilled: now the newest
+    main.set_slot(data, "B02", 0, "Iron Bars", 4)  # Replaced in place
+    assert main.search_chests(data, "iron") == [("B02", "Iron Bars, Iron Block, Iron Ore")]
+
+
+def test_search_matches_chest_ids_labels_and_more_than_three_items():
+    main._write_snapshot({"A01": {str(slot): [f"Stone {slot}", 1] for slot in range(5)}, "A02": "Spare stone"})
+    data = main.load_data()
+    assert main.search_chests(data, "stone") == [("A01", "Stone 0, Stone 1, Stone 2 (+2 more)"),
+                                                 ("A02", "Spare stone")]
+    assert main.search_chests(data, "a01") == [("A01", "5 items")]
+    assert main.search_chests(data, "ston") == main.search_chests(data, "stone")  # Served from the cache
+    assert main.find_items(data, "stone 4") == [("A01", 4, "Stone 4", 1)]
+    assert main.item_total(data, "Stone 3") == 1
+
+
+def test_chests_holding_nothing_are_not_filled():
+    main._write_snapshot({"A01": {"0": ["Stone", 0]}, "A02": {"0": ["Stone", 2]}, "A03": "label", "A04": "  "})
+    data = main.load_data()
+    assert main.get_chest_stats(data, "A01") == (0, 1, False)
+    assert main.get_chest_stats(data, "A02") == (2, 1, True)
+    assert main.get_wall_stats(data, "A") == (2, 35, 2)
+    main.set_slot(data, "A01", 0, "Stone", 1)
+    assert main.get_wall_stats(data, "A") == (3, 35, 3)
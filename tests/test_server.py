@@ -0,0 +1,110 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import main
+
+
+def test_apply_versions_slots_and_rejects_stale_changes():
+    data = main.load_data()
+    server = main.StorageServer(data)
+    assert server.apply(0, [["U", "A01", "0", "Stone", 5]]) == (1, None)
+    assert server.apply(1, [["U", "A01", "1", "Dirt", 2]]) == (2, None)
+
+    # A client that has only seen change 1 may still change other slots...
+    assert server.apply(1, [["U", "A01", "2", "Sand", 1]]) == (3, None)
+    # ...but not slot 1, which changed after it
+    seq, repairs = server.apply(1, [["R", "A01", "1"], ["U", "A01", "4", "Clay", 1]])
+    assert seq is None
+    assert repairs == [["U", "A01", "1", "Dirt", 2], ["R", "A01", "4"]]
+    assert main.chest_to_json(data["A01"]) == {"0": ["Stone", 5], "1": ["Dirt", 2], "2": ["Sand", 1]}
+
+
+def test_whole_chest_change_conflicts_with_its_slots():
+    data = main.load_data()
+    server = main.StorageServer(data)
+    server.apply(0, [["C", "B01", "coal"]])
+    seq, repairs = server.apply(0, [["U", "B01", "0", "Coal", 9]])
+    assert seq is None
+    assert repairs == [["C", "B01", "coal"]]
+    server.apply(1, [["U", "B01", "0", "Coal", 9]])
+    assert server.apply(1, [["C", "B01", {}]])[0] is None
+
+
+def test_invalid_records_are_refused():
+    assert main._valid_record(["U", "A01", "0", "Stone", 5])
+    assert not main._valid_record(["U", "A01", "54", "Stone", 5])
+    assert not main._valid_record(["U", "A01", "0", "Stone", -1])
+    assert not main._valid_record(["R", "A01", "x"])
+    assert not main._valid_record(["X", "A01", "0"])
+
+
+@pytest.fixture
+def server(tmp_path):
+    import socket
+    path = str(tmp_path / "storage.sock")
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(8)
+    listener.setblocking(False)
+    storage_server = main.StorageServer(main.load_data())
+    thread = threading.Thread(target=storage_server.serve_forever, args=(listener,), daemon=True)
+    thread.start()
+    yield path, storage_server
+    listener.close()
+
+
+def _client_data(path):
+    client = main.StorageClient(path)
+    return client, main.data_from_json(client.load())
+
+
+def test_clients_see_each_others_changes_and_conflicts(server):
+    path, storage_server = server
+    first, first_data = _client_data(path)
+    second, second_data = _client_data(path)
+
+    main.set_slot(first_data, "A01", 0, "Stone", 5)
+    first.sync(first_data, [["U", "A01", "0", "Stone", 5]])
+    assert first.seq == 1
+
+    # The second client has not seen change 1 yet, so changing the slot conflicts
+    main.set_slot(second_data, "A01", 0, "Dirt", 1)
+    with pytest.raises(main.StorageConflict):
+        second.sync(second_data, [["U", "A01", "0", "Dirt", 1]])
+    assert main.chest_to_json(second_data["A01"]) == {"0": ["Stone", 5]}
+    assert second.seq == 1
+
+    main.set_slot(second_data, "A01", 0, "Dirt", 1)
+    second.sync(second_data, [["U", "A01", "0", "Dirt", 1]])
+    while first.seq < 2:
+        first.sync(first_data)
+    assert main.chest_to_json(first_data["A01"]) == {"0": ["Dirt", 1]}
+    assert main.chest_to_json(storage_server.data["A01"]) == {"0": ["Dirt", 1]}
+    first.sock.close()
+    second.sock.close()
+
+
+def test_save_data_goes_through_a_server_process(monkeypatch):
+    process = subprocess.Popen([sys.executable, main.__file__, "--serve"])
+    try:
+        deadline = time.monotonic() + 10
+        while not os.path.exists(main.STORAGE_SOCKET):
+            assert process.poll() is None and time.monotonic() < deadline
+            time.sleep(0.02)
+        monkeypatch.setattr(main, "storage_client", main.StorageClient(main.STORAGE_SOCKET))
+        data = main.load_data()
+        main.set_slot(data, "C02", 3, "Carrot", 40)
+        main.save_data(data)
+        main.storage_client.sock.close()
+
+        other, other_data = _client_data(main.STORAGE_SOCKET)
+        assert main.chest_to_json(other_data["C02"]) == {"3": ["Carrot", 40]}
+        other.sock.close()
+    finally:
+        process.terminate()
+        process.wait(10)
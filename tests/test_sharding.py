@@ -0,0 +1,67 @@
+import json
+import os
+
+import pytest
+
+import main
+
+RAW = {"A01": {"0": ["Stone", 64]}, "A02": "notes", "B02": {"1": ["Iron Ingot", 30]},
+       "C01": {"0": ["Wheat", 12]}, "X7": {"0": ["Stick", 2]}}
+
+
+@pytest.fixture
+def sharded(monkeypatch):
+    main._write_snapshot(RAW)
+    main._append_journal([["U", "D01", "0", "Elytra", 1]])
+    assert main.migrate_json_to_shards() == len(RAW) + 1
+    monkeypatch.setattr(main, "STORAGE_BACKEND", "sharded")
+
+
+def _shard(name):
+    with open(os.path.join(main.SHARD_DIR, name + ".json")) as f:
+        return json.load(f)
+
+
+def test_migration_splits_by_wall(sharded):
+    assert sorted(os.listdir(main.SHARD_DIR)) == ["A.json", "B.json", "C.json", "D.json", "X.json", "journal"]
+    assert _shard("A") == {"A01": {"0": ["Stone", 64]}, "A02": "notes"}
+    assert _shard("D") == {"D01": {"0": ["Elytra", 1]}}
+
+
+def test_walls_are_read_when_first_needed(sharded):
+    data = main.load_data()
+    assert data.unloaded == {"A", "B", "C", "D", "X"}
+    assert main.chest_to_json(data["B02"]) == {"1": ["Iron Ingot", 30]}
+    assert data.unloaded == {"A", "C", "D", "X"}
+    assert main.get_wall_stats(data, "C") == (1, 35, 12)
+    assert "C" not in data.unloaded
+    # The storage_data.json form does not need the rest
+    assert main.data_to_json(data) == dict(RAW, D01={"0": ["Elytra", 1]})
+    assert data.unloaded == {"A", "D", "X"}
+    assert sorted(chest_id for chest_id, _ in main.search_chests(data, "stick")) == ["X7"]
+    assert not data.unloaded
+
+
+def test_saves_touch_only_the_changed_shards(sharded, monkeypatch):
+    monkeypatch.setattr(main, "JOURNAL_COMPACT_RECORDS", 2)
+    data = main.load_data()
+    main.set_slot(data, "B02", 2, "Gold Ingot", 3)
+    main.save_data(data)
+    assert main._read_journal(main.SHARD_JOURNAL_FILE) == [["U", "B02", "2", "Gold Ingot", 3]]
+    assert _shard("B") == {"B02": {"1": ["Iron Ingot", 30]}}
+
+    a_mtime = os.path.getmtime(os.path.join(main.SHARD_DIR, "A.json"))
+    main.clear_slot(data, "B02", 1)
+    main.save_data(data)  # Second record: compaction
+    assert os.path.getsize(main.SHARD_JOURNAL_FILE) == 0
+    assert _shard("B") == {"B02": {"2": ["Gold Ingot", 3]}}
+    assert os.path.getmtime(os.path.join(main.SHARD_DIR, "A.json")) == a_mtime
+    assert "A" in data.unloaded
+
+
+def test_journal_replays_on_unread_shards(sharded):
+    data = main.load_data()
+    main.set_slot(data, "C01", 1, "Carrot", 5)
+    main.save_data(data)
+    data = main.load_data()
+    assert main.chest_to_json(data["C01"]) == {"0": ["Wheat", 12], "1": ["Carrot", 5]}
@@ -0,0 +1,74 @@
+import pytest
+
+import main
+
+RAW = {
+    "A01": {"0": ["Stone", 64], "1": ["Stone", 10]},
+    "A02": "old label",
+    "A03": {"5": ["Cobblestone", 3]},
+    "B02": {"0": ["Iron Ingot", 30], "7": ["Gold Ingot", 2]},
+    "B05": {"0": ["Diamond", 0]},
+    "X01": {"0": ["Iron Ingot", 4]},
+}
+
+
+def _migrate(monkeypatch):
+    main._write_snapshot(RAW)
+    main._append_journal([["U", "A03", "6", "Stone", 1]])
+    count = main.migrate_json_to_sqlite()
+    monkeypatch.setattr(main, "STORAGE_BACKEND", "sqlite")
+    return count
+
+
+def test_migration_copies_snapshot_and_journal(monkeypatch):
+    assert _migrate(monkeypatch) == len(RAW)
+    data = main.load_data()
+    expected = dict(RAW, A03={"5": ["Cobblestone", 3], "6": ["Stone", 1]})
+    assert main.data_to_json(data) == expected
+
+
+def test_queries_match_the_in_memory_model(monkeypatch):
+    _migrate(monkeypatch)
+    data = main.load_data()
+    conn = main._sqlite_queries(data)
+    assert conn is not None
+    memory = main.data_from_json(main.data_to_json(data))
+    for query in ("ingot", "stone", "Diamond", "nothing"):
+        assert main.sqlite_search_items(conn, query) == main.find_items(memory, query)
+    for wall in main.wall_order:
+        assert main.sqlite_wall_stats(conn, wall) == main.get_wall_stats(memory, wall)
+    # Chests outside the layout belong to no wall
+    assert main.sqlite_wall_stats(conn, "B") == (1, 35, 32)
+
+
+def test_search_uses_the_item_index(monkeypatch):
+    _migrate(monkeypatch)
+    conn = main.open_sqlite()
+    plan = " ".join(row[-1] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT s.chest_id FROM items i CROSS JOIN slots s ON s.item_id = i.id "
+        "WHERE instr(i.name_lower, ?) > 0", ("ingot",)))
+    assert "slots_item" in plan
+
+
+def test_saves_go_to_the_database(monkeypatch):
+    _migrate(monkeypatch)
+    data = main.load_data()
+    main.set_slot(data, "C01", 0, "Wheat", 12)
+    main.clear_slot(data, "A01", 1)
+    main.save_data(data)
+    main.sqlite_conn.close()
+    main.sqlite_conn = None
+    data = main.load_data()
+    assert main.chest_to_json(data["C01"]) == {"0": ["Wheat", 12]}
+    assert main.chest_to_json(data["A01"]) == {"0": ["Stone", 64]}
+
+
+def test_migration_refuses_a_partial_snapshot():
+    main._write_snapshot(RAW)
+    with open(main.SAVE_FILE) as f:
+        text = f.read()
+    with open(main.SAVE_FILE, 'w') as f:
+        f.write(text.replace('"Cobblestone",', '"Cobblestone"'))
+    with pytest.raises(ValueError):
+        main.migrate_json_to_sqlite()
+    assert main.migrate_json_to_sqlite(accept_partial=True) == len(RAW) - 1
@@ -0,0 +1,123 @@
+import json
+import os
+import struct
+import zlib
+
+import pytest
+
+import main
+
+
+# Minimal NBT encoder: values are (tag, payload bytes) pairs
+def byte(value):
+    return 1, struct.pack(">b", value)
+
+
+def short(value):
+    return 2, struct.pack(">h", value)
+
+
+def int_(value):
+    return 3, struct.pack(">i", value)
+
+
+def string(value):
+    encoded = value.encode("utf-8")
+    return 8, struct.pack(">H", len(encoded)) + encoded
+
+
+def compound(**children):
+    body = b""
+    for name, (tag, payload) in children.items():
+        encoded = name.encode("utf-8")
+        body += bytes([tag]) + struct.pack(">H", len(encoded)) + encoded + payload
+    return 10, body + b"\x00"
+
+
+def list_(*items, tag=10):
+    return 9, bytes([tag]) + struct.pack(">i", len(items)) + b"".join(payload for _, payload in items)
+
+
+def document(root):
+    return b"\x0a\x00\x00" + root[1]
+
+
+def write_region(path, chunks):
+    """Write a region file holding {chunk index: NBT document}, zlib-compressed."""
+    locations = bytearray(4096)
+    body = b""
+    sector = 2
+    for chunk_index, nbt in sorted(chunks.items()):
+        payload = zlib.compress(nbt)
+        chunk = struct.pack(">i", len(payload) + 1) + b"\x02" + payload
+        chunk += b"\x00" * (-len(chunk) % 4096)
+        locations[chunk_index * 4:chunk_index * 4 + 4] = sector.to_bytes(3, "big") + bytes([len(chunk) // 4096])
+        body += chunk
+        sector += len(chunk) // 4096
+    with open(path, "wb") as f:
+        f.write(bytes(locations) + bytes(4096) + body)
+
+
+def chest_entity(x, y, z, *items, count_key="count"):
+    stacks = [compound(Slot=byte(slot), id=string(item_id), **{count_key: int_(count) if count_key == "count"
+                                                                else byte(count)})
+              for slot, item_id, count in items]
+    return compound(id=string("minecraft:chest"), x=int_(x), y=int_(y), z=int_(z), Items=list_(*stacks))
+
+
+def test_read_nbt_decodes_nested_tags():
+    buf = document(compound(name=string("Stone"), count=int_(7), slots=list_(short(1), short(2), tag=2),
+                            inner=compound(flag=byte(-1))))
+    assert main.read_nbt(buf) == {"name": "Stone", "count": 7, "slots": [1, 2], "inner": {"flag": -1}}
+    with pytest.raises(ValueError):
+        main.read_nbt(b"\x08\x00\x00")
+
+
+def test_item_names():
+    assert main.minecraft_item_name("minecraft:oak_log") == "Oak Log"
+    assert main.minecraft_item_name("minecraft:cobblestone", {"minecraft:cobblestone": "Cobble"}) == "Cobble"
+
+
+def test_import_world_reads_mapped_chests(tmp_path):
+    region_dir = tmp_path / "world" / "region"
+    region_dir.mkdir(parents=True)
+    # Chunk 0,0 in the 1.18+ layout holds both halves of A01
+    new_chunk = document(compound(block_entities=list_(
+        chest_entity(0, 64, 0, (0, "minecraft:oak_log", 12), (3, "minecraft:cobblestone", 64)),
+        chest_entity(1, 64, 0, (0, "minecraft:stone", 5)),
+        chest_entity(5, 64, 5, (0, "minecraft:dirt", 1)))))
+    write_region(region_dir / "r.0.0.mca", {0: new_chunk})
+    # Chunk -1,0 (region -1,0) in the old layout holds A02
+    old_chunk = document(compound(Level=compound(TileEntities=list_(
+        chest_entity(-16, 70, 0, (26, "minecraft:sand", 9), count_key="Count")))))
+    write_region(region_dir / "r.-1.0.mca", {31: old_chunk})
+    with open(main.IMPORT_CONFIG_FILE, "w") as f:
+        json.dump({"chests": {"A01": [[0, 64, 0], [1, 64, 0]], "A02": [[-16, 70, 0]], "A03": [[50, 64, 50]]},
+                   "names": {"minecraft:cobblestone": "Cobble"}}, f)
+
+    data = main.load_data()
+    main.set_slot(data, "A03", 0, "Kept", 1)
+    main.save_data(data)
+    count, warnings = main.import_world(data, str(tmp_path / "world"), workers=1)
+    assert count == 2
+    assert main.chest_to_json(data["A01"]) == {"0": ["Oak Log", 12], "3": ["Cobble", 64], "27": ["Stone", 5]}
+    assert main.chest_to_json(data["A02"]) == {"26": ["Sand", 9]}
+    assert main.chest_to_json(data["A03"]) == {"0": ["Kept", 1]}
+    assert warnings == ["A03: no container at 50 64 50"]
+    assert main.chest_to_json(main.load_data()["A02"]) == {"26": ["Sand", 9]}
+
+
+def test_missing_region_and_bad_config(tmp_path):
+    os.mkdir("world")
+    with open(main.IMPORT_CONFIG_FILE, "w") as f:
+        json.dump({"walls": {"D": {"origin": [0, 0, 0], "step": [2, 0, 0]}}}, f)
+    positions, _ = main.read_import_config(main.IMPORT_CONFIG_FILE)
+    assert positions[(2, 0, 0)] == ("D02", 0)
+    count, warnings = main.import_world(main.load_data(), "world", workers=1)
+    assert count == 0
+    assert any("not found" in warning for warning in warnings)
+
+    with open(main.IMPORT_CONFIG_FILE, "w") as f:
+        json.dump({"chests": {"Z99": [[0, 0, 0]]}}, f)
+    with pytest.raises(ValueError, match="Unknown chest Z99"):
+        main.read_import_config(main.IMPORT_CONFIG_FILE)